@@ -0,0 +1,334 @@
+#!/home/ace/bin/uvrun
+# /// script
+# requires-python = ">=3.8"
+# dependencies = []
+# ///
+"""
+Moves soft-deleted conversations and messages from aioffice.db into archive.db once
+they have been deleted for longer than the retention window, and restores them on
+request.
+
+- A deleted conversation (deleted_flag = 1) moves together with all of its messages.
+- A deleted message (deleted = 1) in a live conversation moves on its own.
+- The retention window counts from deleted_at. Rows deleted before that column
+  existed count from their last activity (updated_at, timestamp).
+
+Archived rows keep their IDs, so an audit lookup by conversation_id or message_id
+finds them. Message text is stored zlib-compressed. Each batch is written to
+archive.db and committed first, and only then deleted from aioffice.db. Both steps
+run while the aioffice.db write lock is held, so nothing can undelete a row halfway.
+A crash between the two commits leaves the row in both databases, and the next run
+finishes the move. Restoring puts the rows back with their deleted flags as they
+were; --undelete also clears the flags so the patient sees them again. A message
+whose conversation was archived is restored with the whole conversation, so the
+patient never sees a revived conversation with messages missing.
+
+Usage:
+    ./scripts/archive.py                                    # archive rows deleted over 90 days ago
+    ./scripts/archive.py --retention-days 30 --dry-run      # only count what would move
+    ./scripts/archive.py --list USER_ID                     # a patient's archived conversations and messages
+    ./scripts/archive.py --restore-conversation ID --undelete
+    ./scripts/archive.py --restore-message ID             # brings its whole conversation back if that was archived
+"""
+
+import argparse
+import sqlite3
+import sys
+import time
+import zlib
+from pathlib import Path
+
+from migrate import default_data_dir
+
+CONVERSATION_COLUMNS = ['conversation_id', 'user_id', 'title', 'created_at', 'updated_at', 'deleted_flag',
+                        'last_message_at', 'message_count', 'deleted_at']
+MESSAGE_COLUMNS = ['message_id', 'conversation_id', 'role', 'message', 'timestamp', 'deleted', 'deleted_at']
+
+# NOTE: these conditions match the partial indexes of migration 0007, which serve them
+ARCHIVABLE_CONVERSATIONS = """
+    SELECT rowid, {columns} FROM conversations
+    WHERE deleted_flag = 1 AND COALESCE(deleted_at, updated_at) < datetime('now', :retention)
+    LIMIT :limit
+"""
+ARCHIVABLE_MESSAGES = """
+    SELECT m.rowid, c.user_id, {columns} FROM chat_messages m
+    JOIN conversations c ON c.conversation_id = m.conversation_id
+    WHERE m.deleted = 1 AND COALESCE(m.deleted_at, m.timestamp) < datetime('now', :retention)
+    -- those move with their conversation
+    AND NOT (c.deleted_flag = 1 AND COALESCE(c.deleted_at, c.updated_at) < datetime('now', :retention))
+    LIMIT :limit
+"""
+
+# Same definition as migration 0005 and api_delete_message.php
+SUMMARY = """
+    UPDATE conversations SET
+        last_message_at = (SELECT MAX(timestamp) FROM chat_messages
+                           WHERE conversation_id = :conversation_id AND (deleted = 0 OR deleted IS NULL)),
+        message_count = (SELECT COUNT(*) FROM chat_messages
+                         WHERE conversation_id = :conversation_id AND (deleted = 0 OR deleted IS NULL))
+    WHERE conversation_id = :conversation_id
+"""
+
+
+def connect(path):
+    # NOTE: autocommit mode; every batch opens its own short BEGIN IMMEDIATE transaction
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute('PRAGMA busy_timeout = 5000')
+    return conn
+
+
+def placeholders(values):
+    return ','.join('?' * len(values))
+
+
+def archived_message(user_id, row):
+    """archived_messages row for a chat_messages row given as MESSAGE_COLUMNS."""
+    message = dict(zip(MESSAGE_COLUMNS, row))
+    text = message['message'].encode('utf-8')
+    return [message['message_id'], message['conversation_id'], user_id, message['role'], zlib.compress(text, 6),
+            len(text), message['timestamp'], message['deleted'], message['deleted_at']]
+
+
+def move_batch(app, archive, conversation_rows, message_rows):
+    """Copy one batch into archive.db and commit it, then delete it from aioffice.db (whose lock the caller holds).
+
+    Returns the message text size before and after compression.
+    """
+    messages = [archived_message(row[1], row[2:]) for row in message_rows]
+    archive.execute('BEGIN IMMEDIATE')
+    try:
+        archive.executemany(f"INSERT OR REPLACE INTO archived_conversations ({', '.join(CONVERSATION_COLUMNS)}) "
+                            f"VALUES ({placeholders(CONVERSATION_COLUMNS)})", [row[1:] for row in conversation_rows])
+        archive.executemany("INSERT OR REPLACE INTO archived_messages (message_id, conversation_id, user_id, role, "
+                            "message_zlib, message_bytes, timestamp, deleted, deleted_at) VALUES (?,?,?,?,?,?,?,?,?)",
+                            messages)
+        archive.execute('COMMIT')
+    except BaseException:
+        archive.execute('ROLLBACK')
+        raise
+    for table, rows in [('chat_messages', message_rows), ('conversations', conversation_rows)]:
+        rowids = [row[0] for row in rows]
+        if rowids: app.execute(f"DELETE FROM {table} WHERE rowid IN ({placeholders(rowids)})", rowids)
+    return sum(m[5] for m in messages), sum(len(m[4]) for m in messages)
+
+
+def archive_rows(app, archive, kind, retention, batch_rows, pause, dry_run=False):
+    """Move archivable conversations (with their messages) or single messages batch by batch; returns counts."""
+    stats = {'kind': kind, 'conversations': 0, 'messages': 0, 'bytes': 0, 'compressed': 0, 'batches': 0,
+             'longest_lock_ms': 0.0}
+    if dry_run:
+        sql = (ARCHIVABLE_CONVERSATIONS.format(columns='conversation_id') if kind == 'conversations'
+               else ARCHIVABLE_MESSAGES.format(columns='length(CAST(m.message AS BLOB))'))
+        rows = app.execute(sql, {'retention': retention, 'limit': -1}).fetchall()
+        if kind == 'conversations':
+            ids = [row[1] for row in rows]
+            stats['conversations'] = len(ids)
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                count, size = app.execute(f"SELECT COUNT(*), COALESCE(SUM(length(CAST(message AS BLOB))), 0) "
+                                          f"FROM chat_messages WHERE conversation_id IN ({placeholders(chunk)})",
+                                          chunk).fetchone()
+                stats['messages'] += count
+                stats['bytes'] += size
+        else:
+            stats['messages'] = len(rows)
+            stats['bytes'] = sum(row[2] for row in rows)
+        return stats
+
+    while True:
+        started = time.perf_counter()
+        app.execute('BEGIN IMMEDIATE')
+        try:
+            if kind == 'conversations':
+                # A batch is whole conversations; batch_rows bounds the messages moved with them
+                conversation_rows, message_rows = [], []
+                for row in app.execute(ARCHIVABLE_CONVERSATIONS.format(columns=', '.join(CONVERSATION_COLUMNS)),
+                                       {'retention': retention, 'limit': batch_rows}).fetchall():
+                    messages = app.execute(f"SELECT rowid, ? AS user_id, {', '.join(MESSAGE_COLUMNS)} FROM chat_messages "
+                                           f"WHERE conversation_id = ?", [row[2], row[1]]).fetchall()
+                    if conversation_rows and len(message_rows) + len(messages) > batch_rows: break
+                    conversation_rows.append(row)
+                    message_rows += messages
+            else:
+                conversation_rows = []
+                message_rows = app.execute(ARCHIVABLE_MESSAGES.format(
+                    columns=', '.join(f'm.{c}' for c in MESSAGE_COLUMNS)),
+                    {'retention': retention, 'limit': batch_rows}).fetchall()
+            if conversation_rows or message_rows:
+                size, compressed = move_batch(app, archive, conversation_rows, message_rows)
+            app.execute('COMMIT')
+        except BaseException:
+            app.execute('ROLLBACK')
+            raise
+        stats['longest_lock_ms'] = max(stats['longest_lock_ms'], (time.perf_counter() - started) * 1000)
+        if not conversation_rows and not message_rows: break
+        stats['conversations'] += len(conversation_rows)
+        stats['messages'] += len(message_rows)
+        stats['batches'] += 1
+        stats['bytes'] += size
+        stats['compressed'] += compressed
+        print(f"\r  {kind}: {stats['conversations']:,} conversations, {stats['messages']:,} messages", end='', flush=True)
+        # NOTE: the pause between batches is what lets waiting chat requests take the write lock
+        time.sleep(pause)
+    print(f"\r  {kind}: {stats['conversations']:,} conversations, {stats['messages']:,} messages "
+          f"in {stats['batches']} batches          ")
+    return stats
+
+
+def restore(app, archive, conversation_id, message_ids=None, undelete=False):
+    """Move a conversation (if archived) and its archived messages, or only message_ids, back into aioffice.db.
+
+    message_ids of an archived conversation bring the whole conversation back, since on
+    their own they would revive it with the rest of its messages missing; undelete then
+    clears the conversation's flag and theirs only. Rows already back in aioffice.db are
+    skipped, so a restore interrupted between its two commits can simply be run again.
+    Returns (conversations, messages) restored.
+    """
+    conversation = archive.execute(f"SELECT {', '.join(CONVERSATION_COLUMNS)} FROM archived_conversations "
+                                   f"WHERE conversation_id = ?", [conversation_id]).fetchone()
+    undelete_ids = message_ids
+    if conversation: message_ids = None
+    sql = ("SELECT message_id, conversation_id, role, message_zlib, timestamp, deleted, deleted_at "
+           "FROM archived_messages WHERE conversation_id = ?")
+    params = [conversation_id]
+    if message_ids is not None:
+        sql += f" AND message_id IN ({placeholders(message_ids)})"
+        params += message_ids
+    messages = [(*row[:3], zlib.decompress(row[3]).decode('utf-8'), *row[4:])
+                for row in archive.execute(sql + " ORDER BY timestamp, rowid", params)]
+
+    app.execute('BEGIN IMMEDIATE')
+    try:
+        live = app.execute("SELECT 1 FROM conversations WHERE conversation_id = ?", [conversation_id]).fetchone()
+        if not live and not conversation:
+            raise LookupError(f"conversation {conversation_id} is neither in aioffice.db nor archived")
+        # The conversation goes first: the search index triggers look it up for every message
+        if conversation and not live:
+            app.execute(f"INSERT INTO conversations ({', '.join(CONVERSATION_COLUMNS)}) "
+                        f"VALUES ({placeholders(CONVERSATION_COLUMNS)})", conversation)
+        restored = 0
+        for row in messages:
+            restored += app.execute(f"INSERT OR IGNORE INTO chat_messages ({', '.join(MESSAGE_COLUMNS)}) "
+                                    f"VALUES ({placeholders(MESSAGE_COLUMNS)})", row).rowcount
+        if undelete:
+            ids = undelete_ids if undelete_ids is not None else [row[0] for row in messages]
+            if ids:
+                app.execute(f"UPDATE chat_messages SET deleted = 0, deleted_at = NULL "
+                            f"WHERE message_id IN ({placeholders(ids)})", ids)
+            if conversation:
+                app.execute("UPDATE conversations SET deleted_flag = 0, deleted_at = NULL WHERE conversation_id = ?",
+                            [conversation_id])
+        app.execute(SUMMARY, {'conversation_id': conversation_id})
+        app.execute('COMMIT')
+    except BaseException:
+        app.execute('ROLLBACK')
+        raise
+
+    archive.execute('BEGIN IMMEDIATE')
+    try:
+        if messages:
+            ids = [row[0] for row in messages]
+            archive.execute(f"DELETE FROM archived_messages WHERE message_id IN ({placeholders(ids)})", ids)
+        if conversation:
+            archive.execute("DELETE FROM archived_conversations WHERE conversation_id = ?", [conversation_id])
+        archive.execute('COMMIT')
+    except BaseException:
+        archive.execute('ROLLBACK')
+        raise
+    return (1 if conversation and not live else 0), restored
+
+
+def list_archive(archive, user_id):
+    conversations = archive.execute("SELECT conversation_id, title, deleted_at, updated_at, archived_at "
+                                    "FROM archived_conversations WHERE user_id = ? ORDER BY archived_at",
+                                    [user_id]).fetchall()
+    print(f"Archived conversations of {user_id}: {len(conversations)}")
+    for conversation_id, title, deleted_at, updated_at, archived_at in conversations:
+        count = archive.execute("SELECT COUNT(*) FROM archived_messages WHERE conversation_id = ?",
+                                [conversation_id]).fetchone()[0]
+        print(f"  {conversation_id}  deleted {deleted_at or updated_at}  archived {archived_at}  "
+              f"{count:>4} messages  {title}")
+    messages = archive.execute("""
+        SELECT m.message_id, m.conversation_id, m.role, m.timestamp, m.archived_at FROM archived_messages m
+        WHERE m.user_id = ? AND NOT EXISTS (SELECT 1 FROM archived_conversations c
+                                            WHERE c.conversation_id = m.conversation_id)
+        ORDER BY m.conversation_id, m.timestamp""", [user_id]).fetchall()
+    print(f"Archived messages of live conversations: {len(messages)}")
+    for message_id, conversation_id, role, timestamp, archived_at in messages:
+        print(f"  {message_id}  in {conversation_id}  {role:<9}  sent {timestamp}  archived {archived_at}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Move old soft-deleted chat rows to archive.db, or restore them')
+    parser.add_argument('--data-dir', type=Path, default=default_data_dir())
+    parser.add_argument('--retention-days', type=float, default=90, help='archive rows deleted longer ago than this')
+    parser.add_argument('--batch-rows', type=int, default=500, help='messages moved per transaction')
+    parser.add_argument('--pause-ms', type=float, default=10.0, help='sleep between batches')
+    parser.add_argument('--dry-run', action='store_true', help='count rows that would be archived, change nothing')
+    parser.add_argument('--list', metavar='USER_ID', help="list a patient's archived conversations and messages")
+    parser.add_argument('--restore-conversation', metavar='ID', help='restore a conversation and its archived messages')
+    parser.add_argument('--restore-message', metavar='ID',
+                        help='restore one archived message; if its conversation was archived, the whole conversation '
+                             'comes back with it (all its messages)')
+    parser.add_argument('--undelete', action='store_true',
+                        help='with --restore-*: also clear the deleted flags (with --restore-message: of that message '
+                             'and of its conversation only)')
+    args = parser.parse_args()
+
+    app_path, archive_path = args.data_dir / 'aioffice.db', args.data_dir / 'archive.db'
+    for path in [app_path, archive_path]:
+        if not path.exists():
+            print(f"❌ {path} not found; run ./scripts/migrate.py first")
+            return 1
+    app, archive = connect(app_path), connect(archive_path)
+
+    if args.list:
+        list_archive(archive, args.list)
+        return 0
+
+    if args.restore_conversation or args.restore_message:
+        if args.restore_message:
+            row = archive.execute("SELECT conversation_id FROM archived_messages WHERE message_id = ?",
+                                  [args.restore_message]).fetchone()
+            if not row:
+                print(f"❌ Message {args.restore_message} is not in the archive")
+                return 1
+            conversation_id, message_ids = row[0], [args.restore_message]
+        else:
+            conversation_id, message_ids = args.restore_conversation, None
+        try:
+            conversations, messages = restore(app, archive, conversation_id, message_ids, args.undelete)
+        except LookupError as e:
+            print(f"❌ {e}")
+            return 1
+        state = 'visible again' if args.undelete else 'still soft-deleted'
+        print(f"✅ Restored {conversations} conversation(s) and {messages} message(s) into {conversation_id} ({state})")
+        return 0
+
+    retention = f'-{args.retention_days} days'
+    pause = args.pause_ms / 1000
+    size_before = app_path.stat().st_size
+    print(f"{'Counting' if args.dry_run else 'Archiving'} rows deleted more than {args.retention_days:g} days ago "
+          f"from {app_path}")
+    results = [archive_rows(app, archive, kind, retention, args.batch_rows, pause, args.dry_run)
+               for kind in ['conversations', 'messages']]
+    app.close()
+    archive.close()
+
+    print("\n" + "=" * 60)
+    for r in results:
+        lock = '' if args.dry_run else f"  longest lock {r['longest_lock_ms']:.1f}ms"
+        print(f"{r['kind']:<14} {r['conversations']:>8,} conversations {r['messages']:>10,} messages "
+              f"{r['bytes'] / 1048576:>8.1f} MB text{lock}")
+    if args.dry_run: return 0
+    text, compressed = sum(r['bytes'] for r in results), sum(r['compressed'] for r in results)
+    if compressed: print(f"Message text compressed {text / 1048576:.1f} MB -> {compressed / 1048576:.1f} MB")
+    # NOTE: deleted rows become free pages that later inserts reuse; the file itself does not shrink
+    print(f"aioffice.db: {size_before / 1048576:.1f} MB, archive.db: {archive_path.stat().st_size / 1048576:.1f} MB")
+    print(f"✅ Archived {sum(r['conversations'] for r in results):,} conversations and "
+          f"{sum(r['messages'] for r in results):,} messages")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+#!/home/ace/bin/uvrun
+# /// script
+# requires-python = ">=3.8"
+# dependencies = []
+# ///
+"""
+Query-plan audit for the SQL embedded in www_up/**/*.php.
+
+Pulls every SQL string passed to prepare()/query()/exec(), runs EXPLAIN QUERY PLAN
+for it against a populated aioffice.db (with auth.db attached as `auth`, like
+api_dashboard.php does) and reports full table scans, automatic indexes, temp
+B-trees and index lookups that are not covering. Exits 1 when a query in a hot-path
+file (HOT_PATHS) scans a table or builds an automatic index, so CI catches
+queries that lose their index.
+
+Populate a database first with gen_synthetic_data.py; SQLite picks different plans
+for empty tables.
+
+Usage:
+    ./scripts/audit_query_plans.py                            # audit against tmp/synthetic
+    ./scripts/audit_query_plans.py --data-dir data --verbose  # show every plan, not just findings
+    ./scripts/audit_query_plans.py --json tmp/query_plans.json
+"""
+
+import argparse
+import json
+import re
+import sqlite3
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+WWW_DIR = PROJECT_ROOT / 'www_up'
+
+# Files whose queries run on every page view or chat turn; a scan here fails the audit
+HOT_PATHS = [
+    'infrastructure/lib.php',
+    'infrastructure/prompt_context.php',
+    'infrastructure/conversation_window.php',
+    'infrastructure/record_retrieval.php',
+    'infrastructure/chat_turn.php',
+    'pg_chat/index.php',
+    'pg_chat/api_chat.php',
+    'pg_chat/api_get_conversation.php',
+    'pg_chat/api_list_conversations.php',
+    'pg_main/api_dashboard.php',
+    'pg_records/index.php',
+]
+
+CALL_PATTERN = re.compile(r'->(?:prepare|query|exec)\(\s*(["\'])(.*?)(?<!\\)\1', re.DOTALL)
+SQL_START = re.compile(r'^\s*(SELECT|INSERT|UPDATE|DELETE|WITH|REPLACE)\b', re.IGNORECASE)
+PHP_VARIABLE = re.compile(r'\{?\$\w+(?:->\w+|\[[^\]]*\])*\}?')
+PLAN_TARGET = re.compile(r'^(SCAN|SEARCH)(?: TABLE)? (\S+)(?: AS \S+)?(?: USING (.*))?$')
+
+
+def extract_queries(www_dir=WWW_DIR):
+    """Yield (relative path, line, sql) for every SQL statement string in the PHP sources."""
+    for path in sorted(www_dir.rglob('*.php')):
+        source = path.read_text()
+        for match in CALL_PATTERN.finditer(source):
+            sql = match.group(2)
+            if not SQL_START.match(sql): continue
+            line = source.count('\n', 0, match.start()) + 1
+            yield path.relative_to(www_dir).as_posix(), line, ' '.join(sql.split())
+
+
+def explain(conn, sql):
+    """EXPLAIN QUERY PLAN with every placeholder bound to NULL; returns plan detail lines."""
+    # NOTE: interpolated PHP variables only ever stand for values in this codebase, so NULL works for them too
+    sql = PHP_VARIABLE.sub('NULL', sql)
+    names = re.findall(r'(?<!:):(\w+)', sql)
+    params = {name: None for name in names} if names else [None] * sql.count('?')
+    rows = conn.execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+    depth = {0: -1}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, -1) + 1
+        lines.append('  ' * depth[node_id] + detail)
+    return lines
+
+
+def findings(plan):
+    """Classify plan lines into (severity, message) pairs; 'scan' severities fail hot paths."""
+    found = []
+    for line in plan:
+        detail = line.strip()
+        target = PLAN_TARGET.match(detail)
+        if 'TEMP B-TREE' in detail:
+            found.append(('temp', detail))
+        elif not target:
+            continue
+        elif target.group(1) == 'SCAN':
+            # NOTE: a SCAN on a CTE or subquery result is not a table read, and constant rows are free
+            if target.group(2).startswith(('(', 'CONSTANT')): continue
+            found.append(('scan', detail))
+        elif 'AUTOMATIC' in (target.group(3) or ''):
+            found.append(('scan', detail + ' (index is rebuilt on every execution)'))
+        elif 'INDEX' in (target.group(3) or '') and 'COVERING' not in target.group(3) \
+                and 'sqlite_autoindex_' not in target.group(3):
+            # NOTE: sqlite_autoindex_* back PRIMARY KEY/UNIQUE columns, so they match at most one row
+            found.append(('lookup', detail + ' (not covering; each match costs a table lookup)'))
+    return found
+
+
+def open_db(data_dir):
+    """Open aioffice.db read-only with auth.db attached as `auth`."""
+    app_path, auth_path = data_dir / 'aioffice.db', data_dir / 'auth.db'
+    for path in [app_path, auth_path]:
+        if not path.exists(): sys.exit(f"{path} not found; generate one with gen_synthetic_data.py")
+    conn = sqlite3.connect(f'file:{app_path}?mode=ro', uri=True)
+    conn.execute('ATTACH DATABASE ? AS auth', [f'file:{auth_path}?mode=ro'])
+    return conn
+
+
+def audit(conn, www_dir=WWW_DIR):
+    """Explain every extracted query; returns a list of result dicts."""
+    results = []
+    for file, line, sql in extract_queries(www_dir):
+        result = {'file': file, 'line': line, 'sql': sql, 'hot': file in HOT_PATHS}
+        try:
+            result['plan'] = explain(conn, sql)
+            result['findings'] = findings(result['plan'])
+        except sqlite3.Error as e:
+            result['plan'], result['findings'] = [], [('error', str(e))]
+        results.append(result)
+    return results
+
+
+def print_report(results, verbose=False):
+    labels = {'scan': 'SCAN', 'temp': 'TEMP', 'lookup': 'LOOKUP', 'error': 'ERROR'}
+    for r in results:
+        if not r['findings'] and not verbose: continue
+        print(f"\n{r['file']}:{r['line']}{'  [hot path]' if r['hot'] else ''}")
+        print(f"  {r['sql'][:160]}{'...' if len(r['sql']) > 160 else ''}")
+        if verbose:
+            for plan_line in r['plan']: print(f"    | {plan_line}")
+        for severity, message in r['findings']:
+            print(f"    {labels[severity]:<7}{message}")
+
+    counts = {severity: sum(1 for r in results for s, _ in r['findings'] if s == severity) for severity in labels}
+    print("\n" + "=" * 60)
+    print(f"Queries audited: {len(results)}")
+    print(f"Table scans / automatic indexes: {counts['scan']}")
+    print(f"Temp B-trees: {counts['temp']}")
+    print(f"Non-covering index lookups: {counts['lookup']}")
+    if counts['error']: print(f"Queries that failed to plan: {counts['error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='EXPLAIN QUERY PLAN every SQL query in the PHP sources')
+    parser.add_argument('--data-dir', type=Path, default=PROJECT_ROOT / 'tmp' / 'synthetic',
+                        help='directory with populated aioffice.db and auth.db')
+    parser.add_argument('--www', type=Path, default=WWW_DIR, help='PHP source root')
+    parser.add_argument('--verbose', action='store_true', help='print the full plan of every query')
+    parser.add_argument('--json', type=Path, help='also write the results to this file')
+    args = parser.parse_args()
+
+    conn = open_db(args.data_dir)
+    results = audit(conn, args.www)
+    conn.close()
+    print_report(results, args.verbose)
+    if args.json:
+        args.json.parent.mkdir(parents=True, exist_ok=True)
+        args.json.write_text(json.dumps(results, indent=2))
+
+    regressions = [r for r in results if r['hot'] and any(s in ('scan', 'error') for s, _ in r['findings'])]
+    if regressions:
+        print(f"\n❌ {len(regressions)} hot-path quer{'y' if len(regressions) == 1 else 'ies'} without a usable index:")
+        for r in regressions: print(f"   {r['file']}:{r['line']}")
+        return 1
+    print("\n✅ No hot-path table scans")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
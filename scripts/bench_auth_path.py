@@ -0,0 +1,155 @@
+#!/home/ace/bin/uvrun
+# /// script
+# requires-python = ">=3.8"
+# dependencies = []
+# ///
+"""
+Benchmark of the per-request auth path (getUserIdFromToken() in lib.php).
+
+Replays the same SQL as lib.php from concurrent processes against a copy of auth.db:
+a pool of active sessions, each polled repeatedly as page views and API calls would.
+Runs once per session touch interval (AIOFC_SESSION_TOUCH_SECONDS) and reports auth
+latency, how many requests wrote to auth.db, and the bytes each run wrote.
+
+Usage:
+    ./scripts/bench_auth_path.py --data-dir tmp/synthetic --intervals 0,300 --workers 4 --duration 10
+"""
+
+import argparse
+import concurrent.futures
+import json
+import math
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from bench_db_profiles import PROFILES, connect
+from migrate import copy_data_dir
+
+PROJECT_ROOT = Path(__file__).parent.parent
+
+# NOTE: keep in sync with getUserIdFromToken() in www_up/infrastructure/lib.php
+LOOKUP = """
+    SELECT user_id,
+           last_activity IS NULL OR last_activity <= datetime('now', :touch_after) AS stale
+    FROM sessions
+    WHERE token = :token
+    AND expires_at > datetime('now')
+    LIMIT 1
+"""
+REFRESH = """
+    UPDATE sessions
+    SET last_activity = datetime('now'),
+        expires_at = datetime('now', '+32 days')
+    WHERE token = :token
+"""
+
+
+def written_bytes():
+    """Bytes this process has passed to write() so far (Linux), or None."""
+    try:
+        with open('/proc/self/io') as f:
+            return int(next(line for line in f if line.startswith('wchar')).split()[1])
+    except (OSError, StopIteration):
+        return None
+
+
+def worker(db_path, pragmas, tokens, interval, duration, start_at, seed):
+    rng = random.Random(seed)
+    conn = connect(db_path, pragmas)
+    latencies, writes, busy = [], 0, 0
+    touch_after = f'-{interval} seconds'
+    time.sleep(max(0.0, start_at - time.time()))
+    io_before = written_bytes()
+    deadline = start_at + duration
+    while time.time() < deadline:
+        token = rng.choice(tokens)
+        started = time.perf_counter()
+        try:
+            row = conn.execute(LOOKUP, {'token': token, 'touch_after': touch_after}).fetchone()
+            if row and row[1]:
+                conn.execute(REFRESH, {'token': token})
+                writes += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+        except sqlite3.OperationalError:
+            busy += 1
+    io_after = written_bytes()
+    conn.close()
+    return latencies, writes, busy, (io_after - io_before) if io_before is not None else None
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values: return 0.0
+    return sorted_values[max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)]
+
+
+def run(data_dir, profile, interval, workers, sessions, duration, seed):
+    (PROJECT_ROOT / 'tmp').mkdir(exist_ok=True)
+    copy_dir = Path(tempfile.mkdtemp(prefix='bench_auth_', dir=PROJECT_ROOT / 'tmp'))
+    try:
+        copy_data_dir(data_dir, copy_dir)
+        db_path = copy_dir / 'auth.db'
+        conn = connect(db_path, PROFILES[profile])
+        tokens = [t for (t,) in conn.execute("SELECT token FROM sessions WHERE expires_at > datetime('now') "
+                                            "ORDER BY token LIMIT ?", [sessions])]
+        # Every session starts due for a write, as after a quiet period
+        conn.execute("UPDATE sessions SET last_activity = datetime('now', '-1 day')")
+        conn.close()
+
+        start_at = time.time() + 0.5
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(worker, *zip(*[(db_path, PROFILES[profile], tokens, interval, duration, start_at,
+                                                    seed + i) for i in range(workers)])))
+        latencies = sorted(l for r in results for l in r[0])
+        requests = len(latencies)
+        io = [r[3] for r in results]
+        return {'interval': interval, 'requests': requests, 'requests_per_s': requests / duration,
+                'writes': sum(r[1] for r in results), 'busy': sum(r[2] for r in results),
+                'write_fraction': sum(r[1] for r in results) / requests if requests else 0,
+                'bytes_written': sum(io) if None not in io else None,
+                'p50_ms': percentile(latencies, 50), 'p95_ms': percentile(latencies, 95),
+                'p99_ms': percentile(latencies, 99)}
+    finally:
+        shutil.rmtree(copy_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Auth-path latency and write volume per session touch interval')
+    parser.add_argument('--data-dir', type=Path, default=PROJECT_ROOT / 'tmp' / 'synthetic')
+    parser.add_argument('--intervals', default='0,300', help='touch intervals in seconds; 0 writes on every request')
+    parser.add_argument('--profile', default='wal', choices=list(PROFILES))
+    parser.add_argument('--workers', type=int, default=4, help='concurrent processes')
+    parser.add_argument('--sessions', type=int, default=200, help='active sessions being polled')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds per interval')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', type=Path, help='JSON report path (default: tmp/bench/auth-path-<time>.json)')
+    args = parser.parse_args()
+
+    runs = []
+    for interval in [int(v) for v in args.intervals.split(',')]:
+        print(f"interval {interval}s: {args.workers} workers, {args.sessions} sessions, {args.duration:.0f}s",
+              file=sys.stderr)
+        runs.append(run(args.data_dir, args.profile, interval, args.workers, args.sessions, args.duration, args.seed))
+
+    print(f"\n{'interval':>9} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'writes':>8} {'write %':>8} {'MB written':>11}")
+    print("-" * 76)
+    for r in runs:
+        mb = f"{r['bytes_written'] / 1048576:.1f}" if r['bytes_written'] is not None else 'n/a'
+        print(f"{r['interval']:>8}s {r['requests_per_s']:>8.0f} {r['p50_ms']:>6.3f}ms {r['p95_ms']:>6.3f}ms "
+              f"{r['p99_ms']:>6.3f}ms {r['writes']:>8} {r['write_fraction'] * 100:>7.2f}% {mb:>11}")
+
+    output = args.output or PROJECT_ROOT / 'tmp' / 'bench' / f"auth-path-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({'data_dir': str(args.data_dir), 'profile': args.profile, 'workers': args.workers,
+                                  'sessions': args.sessions, 'duration': args.duration, 'runs': runs}, indent=2))
+    print(f"\nReport: {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
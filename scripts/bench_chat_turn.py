@@ -0,0 +1,209 @@
+#!/home/ace/bin/uvrun
+# /// script
+# requires-python = ">=3.8"
+# dependencies = []
+# ///
+"""
+Benchmark of the SQLite writes of one api_chat.php turn: fsyncs and lock hold time.
+
+Replays a chat turn against a copy of aioffice.db in two variants:
+- autocommit:    the old write path, five statements each committing on its own
+                 (three `UPDATE conversations SET updated_at`, two message inserts);
+- transactional: the current path (TURN in bench_db_profiles.py), one transaction
+                 before the Gemini call and one after it.
+For each connection profile it reports commits, fsync/fdatasync calls and write-lock
+hold time per turn. fsyncs are counted by a small LD_PRELOAD shim built with the
+system C compiler into tmp/; without a compiler that column reads n/a.
+
+Usage:
+    ./scripts/bench_chat_turn.py --data-dir tmp/synthetic --turns 200
+    ./scripts/bench_chat_turn.py --profiles wal-full,rollback --gemini-ms 50
+"""
+
+import argparse
+import ctypes
+import json
+import math
+import os
+import random
+import secrets
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from bench_db_profiles import PROFILES, TURN, connect
+from migrate import copy_data_dir
+
+PROJECT_ROOT = Path(__file__).parent.parent
+
+# api_chat.php before the write path was made transactional
+AUTOCOMMIT_TURN = [
+    "UPDATE conversations SET updated_at = CURRENT_TIMESTAMP WHERE conversation_id = :conversation_id AND user_id = :user_id",
+    """INSERT INTO chat_messages (message_id, conversation_id, role, message, timestamp)
+       VALUES (:patient_message_id, :conversation_id, 'patient', :question, CURRENT_TIMESTAMP)""",
+    "UPDATE conversations SET updated_at = CURRENT_TIMESTAMP WHERE conversation_id = :conversation_id",
+    # ... Gemini call ...
+    """INSERT INTO chat_messages (message_id, conversation_id, role, message, timestamp)
+       VALUES (:assistant_message_id, :conversation_id, 'assistant', :answer, CURRENT_TIMESTAMP)""",
+    "UPDATE conversations SET updated_at = CURRENT_TIMESTAMP WHERE conversation_id = :conversation_id",
+]
+GEMINI_CALL_AFTER = 3  # statements of AUTOCOMMIT_TURN that run before the Gemini call
+
+# Every transaction of each variant, as (statements, followed by the Gemini call?)
+VARIANTS = {
+    'autocommit': [([sql], i == GEMINI_CALL_AFTER - 1) for i, sql in enumerate(AUTOCOMMIT_TURN)],
+    'transactional': [(statements, i == 0) for i, statements in enumerate(TURN)],
+}
+
+SHIM_SOURCE = r"""
+#define _GNU_SOURCE
+#include <dlfcn.h>
+static long calls;
+long fsync_calls(void) { return calls; }
+int fsync(int fd) {
+    static int (*real)(int);
+    if (!real) real = (int (*)(int))dlsym(RTLD_NEXT, "fsync");
+    calls++;
+    return real(fd);
+}
+int fdatasync(int fd) {
+    static int (*real)(int);
+    if (!real) real = (int (*)(int))dlsym(RTLD_NEXT, "fdatasync");
+    calls++;
+    return real(fd);
+}
+"""
+
+
+def build_shim():
+    """Compile the fsync-counting shim into tmp/; returns its path or None."""
+    shim = PROJECT_ROOT / 'tmp' / 'fsync_counter.so'
+    if shim.exists(): return shim
+    compiler = shutil.which('cc') or shutil.which('gcc')
+    if not compiler: return None
+    source = PROJECT_ROOT / 'tmp' / 'fsync_counter.c'
+    source.write_text(SHIM_SOURCE)
+    result = subprocess.run([compiler, '-shared', '-fPIC', '-O2', '-o', str(shim), str(source), '-ldl'],
+                            capture_output=True, text=True)
+    return shim if result.returncode == 0 else None
+
+
+def fsync_counter():
+    """fsync_calls() from the preloaded shim, or None when running without it."""
+    try:
+        counter = ctypes.CDLL(None).fsync_calls
+    except AttributeError:
+        return None
+    counter.restype = ctypes.c_long
+    return counter
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values: return 0.0
+    return sorted_values[max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)]
+
+
+def run_turns(db_path, profile, variant, turns, gemini_ms, seed):
+    """Worker (runs in a child process so the shim can be preloaded): replay `turns` chat turns."""
+    rng = random.Random(seed)
+    conn = connect(db_path, PROFILES[profile])
+    fixtures = conn.execute("SELECT user_id, conversation_id FROM conversations ORDER BY random() LIMIT 1000").fetchall()
+    counter = fsync_counter()
+    per_turn = []
+    for _ in range(turns):
+        user_id, conversation_id = rng.choice(fixtures)
+        params = {'user_id': user_id, 'conversation_id': conversation_id,
+                  'patient_message_id': secrets.token_hex(8), 'assistant_message_id': secrets.token_hex(8),
+                  'question': 'How are my results?', 'answer': 'Your results are within the normal range. ' * 20}
+        fsyncs_before = counter() if counter else 0
+        locks = []
+        for statements, gemini_call_follows in VARIANTS[variant]:
+            # NOTE: the write lock is taken at the first write and released by the commit
+            started = time.perf_counter()
+            if len(statements) > 1: conn.execute('BEGIN')
+            for sql in statements: conn.execute(sql, params)
+            if len(statements) > 1: conn.execute('COMMIT')
+            locks.append((time.perf_counter() - started) * 1000)
+            if gemini_call_follows and gemini_ms: time.sleep(gemini_ms / 1000)
+        per_turn.append({'commits': len(locks), 'lock_ms': sum(locks), 'longest_lock_ms': max(locks),
+                         'fsyncs': counter() - fsyncs_before if counter else None})
+    conn.close()
+    return per_turn
+
+
+def summarize(profile, variant, per_turn):
+    lock_ms = sorted(t['lock_ms'] for t in per_turn)
+    fsyncs = [t['fsyncs'] for t in per_turn]
+    return {'profile': profile, 'variant': variant, 'turns': len(per_turn),
+            'commits_per_turn': sum(t['commits'] for t in per_turn) / len(per_turn),
+            'fsyncs_per_turn': sum(fsyncs) / len(fsyncs) if None not in fsyncs else None,
+            'lock_ms_per_turn_p50': percentile(lock_ms, 50), 'lock_ms_per_turn_p95': percentile(lock_ms, 95),
+            'longest_lock_ms': max(t['longest_lock_ms'] for t in per_turn)}
+
+
+def run(data_dir, profile, variant, turns, gemini_ms, seed, shim):
+    """Fresh copy of the data, then the worker in a child process with the shim preloaded."""
+    (PROJECT_ROOT / 'tmp').mkdir(exist_ok=True)
+    copy_dir = Path(tempfile.mkdtemp(prefix='bench_turn_', dir=PROJECT_ROOT / 'tmp'))
+    try:
+        copy_data_dir(data_dir, copy_dir, {'app': 'aioffice.db'})
+        connect(copy_dir / 'aioffice.db', PROFILES[profile]).close()  # journal_mode is persistent
+        env = {**os.environ, 'LD_PRELOAD': str(shim)} if shim else None
+        result = subprocess.run([sys.executable, __file__, '--worker', json.dumps(
+            [str(copy_dir / 'aioffice.db'), profile, variant, turns, gemini_ms, seed])],
+            env=env, capture_output=True, text=True, check=True)
+        return summarize(profile, variant, json.loads(result.stdout))
+    finally:
+        shutil.rmtree(copy_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='fsyncs and lock hold time of one api_chat.php turn')
+    parser.add_argument('--data-dir', type=Path, default=PROJECT_ROOT / 'tmp' / 'synthetic')
+    parser.add_argument('--profiles', default=','.join(PROFILES), help='comma separated profile names')
+    parser.add_argument('--turns', type=int, default=200, help='chat turns per profile and variant')
+    parser.add_argument('--gemini-ms', type=float, default=0, help='simulated Gemini call between the two halves')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', type=Path, help='JSON report path (default: tmp/bench/chat-turn-<time>.json)')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_turns(*json.loads(args.worker))))
+        return 0
+
+    profiles = args.profiles.split(',')
+    unknown = [p for p in profiles if p not in PROFILES]
+    if unknown: parser.error(f"unknown profile(s): {', '.join(unknown)}")
+    (PROJECT_ROOT / 'tmp').mkdir(exist_ok=True)
+    shim = build_shim()
+    if not shim: print("⚠️  No C compiler; fsyncs are not counted", file=sys.stderr)
+
+    results = []
+    for profile in profiles:
+        for variant in VARIANTS:
+            print(f"{profile} / {variant}: {args.turns} turns", file=sys.stderr)
+            results.append(run(args.data_dir, profile, variant, args.turns, args.gemini_ms, args.seed, shim))
+
+    print(f"\n{'profile':<10} {'variant':<14} {'commits':>8} {'fsyncs':>8} {'lock p50':>10} {'lock p95':>10} {'longest':>9}")
+    print("-" * 75)
+    for r in results:
+        fsyncs = f"{r['fsyncs_per_turn']:.1f}" if r['fsyncs_per_turn'] is not None else 'n/a'
+        print(f"{r['profile']:<10} {r['variant']:<14} {r['commits_per_turn']:>8.0f} {fsyncs:>8} "
+              f"{r['lock_ms_per_turn_p50']:>8.3f}ms {r['lock_ms_per_turn_p95']:>8.3f}ms {r['longest_lock_ms']:>7.2f}ms")
+    print("(per chat turn; lock = write lock held, summed over the turn's transactions; longest = one transaction)")
+
+    output = args.output or PROJECT_ROOT / 'tmp' / 'bench' / f"chat-turn-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({'data_dir': str(args.data_dir), 'turns': args.turns, 'gemini_ms': args.gemini_ms,
+                                  'results': results}, indent=2))
+    print(f"\nReport: {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
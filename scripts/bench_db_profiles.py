@@ -0,0 +1,207 @@
+#!/home/ace/bin/uvrun
+# /// script
+# requires-python = ">=3.8"
+# dependencies = []
+# ///
+"""
+Benchmark matrix for the SQLite connection profiles in lib.php (DB_PROFILES).
+
+For every profile and every readers x writers combination, runs concurrent processes
+against a copy of a data directory for a fixed time:
+- readers repeat the dashboard and conversation reads (recent chats, record count,
+  next appointment, message history) for random patients;
+- writers repeat the writes of one api_chat.php turn (two transactions, each one
+  message insert and one conversation update).
+Reports read and write throughput, p50/p95/p99 latency and "database is locked"
+failures. This measures SQLite itself; for the full PHP stack run bench_load.py
+against test_server.py with AIOFC_DB_PROFILE set.
+
+Usage:
+    ./scripts/bench_db_profiles.py --data-dir tmp/synthetic --readers 4,8 --writers 1,4 --duration 10
+"""
+
+import argparse
+import concurrent.futures
+import json
+import math
+import random
+import secrets
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from migrate import copy_data_dir
+
+PROJECT_ROOT = Path(__file__).parent.parent
+
+# NOTE: keep in sync with DB_PROFILES in www_up/infrastructure/lib.php
+PROFILES = {
+    'wal': {'busy_timeout': '5000', 'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'cache_size': '-16000',
+            'mmap_size': '268435456', 'temp_store': 'MEMORY', 'foreign_keys': 'OFF'},
+    'wal-full': {'busy_timeout': '5000', 'journal_mode': 'WAL', 'synchronous': 'FULL', 'cache_size': '-16000',
+                 'mmap_size': '268435456', 'temp_store': 'MEMORY', 'foreign_keys': 'OFF'},
+    'rollback': {'busy_timeout': '5000', 'journal_mode': 'DELETE', 'synchronous': 'FULL', 'cache_size': '-2000',
+                 'mmap_size': '0', 'temp_store': 'DEFAULT', 'foreign_keys': 'OFF'},
+}
+
+READS = [
+    """SELECT conversation_id, title, COALESCE(last_message_at, updated_at), message_count FROM conversations
+       WHERE user_id = :user_id AND (deleted_flag = 0 OR deleted_flag IS NULL)
+       ORDER BY COALESCE(last_message_at, updated_at) DESC LIMIT 3""",
+    "SELECT COUNT(*) FROM medical_records WHERE user_id = :user_id",
+    """SELECT appointment_date, appointment_time, appointment_datetime_utc, doctor_name FROM appointments
+       WHERE user_id = :user_id ORDER BY appointment_datetime_utc DESC, appointment_date DESC LIMIT 1""",
+    """SELECT message_id, role, message, timestamp FROM chat_messages
+       WHERE conversation_id = :conversation_id AND (deleted = 0 OR deleted IS NULL) ORDER BY timestamp ASC""",
+]
+
+# NOTE: keep in sync with infrastructure/chat_turn.php; one chat turn is two transactions, before and after the Gemini call
+TURN = [
+    ["""UPDATE conversations SET updated_at = CURRENT_TIMESTAMP, last_message_at = CURRENT_TIMESTAMP,
+        message_count = message_count + 1 WHERE conversation_id = :conversation_id AND user_id = :user_id""",
+     """INSERT INTO chat_messages (message_id, conversation_id, role, message, timestamp)
+        VALUES (:patient_message_id, :conversation_id, 'patient', :question, CURRENT_TIMESTAMP)"""],
+    ["""INSERT INTO chat_messages (message_id, conversation_id, role, message, timestamp)
+        VALUES (:assistant_message_id, :conversation_id, 'assistant', :answer, CURRENT_TIMESTAMP)""",
+     """UPDATE conversations SET updated_at = CURRENT_TIMESTAMP, last_message_at = CURRENT_TIMESTAMP,
+        message_count = message_count + 1 WHERE conversation_id = :conversation_id"""],
+]
+
+
+def connect(path, pragmas):
+    # NOTE: isolation_level=None gives PHP's autocommit behaviour: one transaction per statement
+    conn = sqlite3.connect(path, isolation_level=None, timeout=0)
+    for name, value in pragmas.items(): conn.execute(f'PRAGMA {name} = {value}')
+    return conn
+
+
+def run_transaction(conn, statements, params):
+    """BEGIN ... COMMIT around statements, as PDO::beginTransaction()/commit() do in PHP."""
+    conn.execute('BEGIN')
+    try:
+        for sql in statements: conn.execute(sql, params)
+        conn.execute('COMMIT')
+    except sqlite3.Error:
+        if conn.in_transaction: conn.execute('ROLLBACK')
+        raise
+
+
+def worker(role, db_path, pragmas, fixtures, duration, start_at, seed):
+    """Run reads or chat-turn writes until the deadline; returns latencies and error counts."""
+    rng = random.Random(seed)
+    conn = connect(db_path, pragmas)
+    latencies, busy, errors = [], 0, 0
+    time.sleep(max(0.0, start_at - time.time()))
+    deadline = start_at + duration
+    while time.time() < deadline:
+        user_id, conversation_id = rng.choice(fixtures)
+        params = {'user_id': user_id, 'conversation_id': conversation_id}
+        started = time.perf_counter()
+        try:
+            if role == 'reader':
+                for sql in READS: conn.execute(sql, params).fetchall()
+            else:
+                params.update(patient_message_id=secrets.token_hex(8), assistant_message_id=secrets.token_hex(8),
+                              question='How are my results?', answer='Your results are within the normal range. ' * 20)
+                for transaction in TURN: run_transaction(conn, transaction, params)
+            latencies.append((time.perf_counter() - started) * 1000)
+        except sqlite3.OperationalError as e:
+            if 'locked' in str(e) or 'busy' in str(e): busy += 1
+            else: errors += 1
+    conn.close()
+    return role, latencies, busy, errors
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values: return 0.0
+    return sorted_values[max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)]
+
+
+def summarize(latencies, busy, errors, duration):
+    latencies.sort()
+    return {'ops': len(latencies), 'ops_per_s': len(latencies) / duration, 'busy': busy, 'errors': errors,
+            'p50_ms': percentile(latencies, 50), 'p95_ms': percentile(latencies, 95), 'p99_ms': percentile(latencies, 99)}
+
+
+def run_cell(data_dir, profile, readers, writers, duration, seed):
+    """One matrix cell: fresh copy of the data, profile applied, readers and writers in parallel."""
+    (PROJECT_ROOT / 'tmp').mkdir(exist_ok=True)
+    copy_dir = Path(tempfile.mkdtemp(prefix='bench_profiles_', dir=PROJECT_ROOT / 'tmp'))
+    try:
+        copy_data_dir(data_dir, copy_dir)
+        db_path = copy_dir / 'aioffice.db'
+        pragmas = PROFILES[profile]
+        connect(db_path, pragmas).close()  # journal_mode is persistent; switch it before the workers start
+        conn = sqlite3.connect(db_path)
+        fixtures = conn.execute("SELECT user_id, conversation_id FROM conversations ORDER BY random() LIMIT 2000").fetchall()
+        conn.close()
+
+        start_at = time.time() + 0.5
+        roles = ['reader'] * readers + ['writer'] * writers
+        collected = {'reader': ([], 0, 0), 'writer': ([], 0, 0)}
+        with concurrent.futures.ProcessPoolExecutor(max_workers=len(roles)) as pool:
+            futures = [pool.submit(worker, role, db_path, pragmas, fixtures, duration, start_at, seed + i)
+                       for i, role in enumerate(roles)]
+            for future in concurrent.futures.as_completed(futures):
+                role, latencies, busy, errors = future.result()
+                all_latencies, all_busy, all_errors = collected[role]
+                collected[role] = (all_latencies + latencies, all_busy + busy, all_errors + errors)
+        return {role: summarize(*values, duration) for role, values in collected.items() if values[0] or values[1]}
+    finally:
+        shutil.rmtree(copy_dir, ignore_errors=True)
+
+
+def print_matrix(cells):
+    print(f"\n{'profile':<10} {'R':>3} {'W':>3} {'reads/s':>9} {'read p95':>9} {'read p99':>9} "
+          f"{'turns/s':>8} {'turn p95':>9} {'turn p99':>9} {'busy':>6}")
+    print("-" * 86)
+    for cell in cells:
+        r, w = cell['results'].get('reader', {}), cell['results'].get('writer', {})
+        busy = r.get('busy', 0) + w.get('busy', 0)
+        print(f"{cell['profile']:<10} {cell['readers']:>3} {cell['writers']:>3} "
+              f"{r.get('ops_per_s', 0):>9.0f} {r.get('p95_ms', 0):>8.1f}ms {r.get('p99_ms', 0):>7.1f}ms "
+              f"{w.get('ops_per_s', 0):>8.0f} {w.get('p95_ms', 0):>7.1f}ms {w.get('p99_ms', 0):>7.1f}ms {busy:>6}")
+
+
+def int_list(text):
+    return [int(v) for v in text.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Read/write throughput of each SQLite connection profile')
+    parser.add_argument('--data-dir', type=Path, default=PROJECT_ROOT / 'tmp' / 'synthetic')
+    parser.add_argument('--profiles', default=','.join(PROFILES), help='comma separated profile names')
+    parser.add_argument('--readers', type=int_list, default=[4], help='reader process counts, e.g. 2,8')
+    parser.add_argument('--writers', type=int_list, default=[1, 4], help='writer process counts, e.g. 1,4')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds per matrix cell')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', type=Path, help='JSON report path (default: tmp/bench/db-profiles-<time>.json)')
+    args = parser.parse_args()
+
+    profiles = args.profiles.split(',')
+    unknown = [p for p in profiles if p not in PROFILES]
+    if unknown: parser.error(f"unknown profile(s): {', '.join(unknown)}")
+
+    cells = []
+    for profile in profiles:
+        for readers in args.readers:
+            for writers in args.writers:
+                print(f"{profile}: {readers} readers, {writers} writers, {args.duration:.0f}s", file=sys.stderr)
+                results = run_cell(args.data_dir, profile, readers, writers, args.duration, args.seed)
+                cells.append({'profile': profile, 'readers': readers, 'writers': writers, 'results': results})
+    print_matrix(cells)
+
+    output = args.output or PROJECT_ROOT / 'tmp' / 'bench' / f"db-profiles-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({'data_dir': str(args.data_dir), 'duration': args.duration, 'profiles': PROFILES,
+                                  'cells': cells}, indent=2))
+    print(f"\nReport: {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
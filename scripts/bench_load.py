@@ -0,0 +1,253 @@
+#!/home/ace/bin/uvrun
+# /// script
+# requires-python = ">=3.8"
+# dependencies = [
+#     "aiohttp",
+# ]
+# ///
+"""
+Async load generator for the JSON endpoints.
+
+Creates N virtual patients (user, session token, patient row and one conversation each)
+directly in the target data/ directory, then drives pg_chat/api_chat.php,
+pg_chat/api_get_conversation.php, pg_main/api_dashboard.php and pg_login/login.php
+(token check) open-loop at a target request rate. Reports p50/p95/p99 latency,
+throughput, the error mix and SQLITE_BUSY ("database is locked") failures, and writes
+everything as JSON so runs can be compared over time.
+
+Run it against a hermetic server with the Gemini stand-in so chat turns cost nothing:
+    ./scripts/test_server.py --gemini-standin -- ./scripts/bench_load.py --patients 50 --rps 40
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import sqlite3
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import aiohttp
+
+PROJECT_ROOT = Path(__file__).parent.parent
+ENDPOINTS = ['chat', 'conversation', 'dashboard', 'login']
+BUSY_PATTERN = re.compile(r'database is locked|database table is locked|SQLITE_BUSY', re.I)
+
+
+def setup_patients(data_dir, count, seed):
+    """Insert virtual patients with live sessions and a seeded conversation; return their fixtures."""
+    rng = random.Random(seed)
+    auth = sqlite3.connect(data_dir / 'auth.db', timeout=30)
+    app = sqlite3.connect(data_dir / 'aioffice.db', timeout=30)
+    patients = []
+    for i in range(count):
+        user_id = f'bench_user_{i}'
+        token = f'bench_token_{i}_{rng.getrandbits(64):016x}'
+        conversation_id = f'bench_conv_{i}'
+        auth.execute("INSERT OR REPLACE INTO users (id, email) VALUES (?, ?)", (user_id, f'bench{i}@example.com'))
+        auth.execute("""
+            INSERT OR REPLACE INTO sessions (id, user_id, token, expires_at)
+            VALUES (?, ?, ?, datetime('now', '+1 day'))
+        """, (f'bench_session_{i}', user_id, token))
+        app.execute("INSERT OR REPLACE INTO patients (user_id, full_name) VALUES (?, ?)", (user_id, f'Bench Patient {i}'))
+        app.execute("""
+            INSERT OR REPLACE INTO conversations (conversation_id, user_id, title, last_message_at, message_count)
+            VALUES (?, ?, 'Bench conversation', CURRENT_TIMESTAMP, 10)
+        """, (conversation_id, user_id))
+        app.executemany("""
+            INSERT OR REPLACE INTO chat_messages (message_id, conversation_id, role, message) VALUES (?, ?, ?, ?)
+        """, [(f'bench_msg_{i}_{j}', conversation_id, 'patient' if j % 2 == 0 else 'assistant',
+               f'Bench message {j} about my lab results') for j in range(10)])
+        patients.append({'user_id': user_id, 'token': token, 'conversation_id': conversation_id})
+    auth.commit()
+    app.commit()
+    auth.close()
+    app.close()
+    return patients
+
+
+def cleanup_patients(data_dir):
+    """Remove everything setup_patients() created."""
+    app = sqlite3.connect(data_dir / 'aioffice.db', timeout=30)
+    app.execute("""
+        DELETE FROM chat_messages WHERE conversation_id IN
+            (SELECT conversation_id FROM conversations WHERE user_id LIKE 'bench\\_user\\_%' ESCAPE '\\')
+    """)
+    app.execute("DELETE FROM conversations WHERE user_id LIKE 'bench\\_user\\_%' ESCAPE '\\'")
+    app.execute("DELETE FROM patients WHERE user_id LIKE 'bench\\_user\\_%' ESCAPE '\\'")
+    app.commit()
+    app.close()
+    auth = sqlite3.connect(data_dir / 'auth.db', timeout=30)
+    auth.execute("DELETE FROM sessions WHERE user_id LIKE 'bench\\_user\\_%' ESCAPE '\\'")
+    auth.execute("DELETE FROM users WHERE id LIKE 'bench\\_user\\_%' ESCAPE '\\'")
+    auth.commit()
+    auth.close()
+
+
+def build_request(endpoint, base_url, patient):
+    """Method, URL and JSON body for one request of the given kind."""
+    if endpoint == 'chat':
+        return 'POST', f'{base_url}/pg_chat/api_chat.php', {
+            'message': 'Are my latest blood test results normal?',
+            'conversation_id': patient['conversation_id'],
+            'local_datetime': time.strftime('%m/%d/%Y, %H:%M:%S'), 'timezone': 'UTC'}
+    if endpoint == 'conversation':
+        return 'GET', f"{base_url}/pg_chat/api_get_conversation.php?id={patient['conversation_id']}", None
+    if endpoint == 'dashboard':
+        return 'GET', f'{base_url}/pg_main/api_dashboard.php', None
+    return 'POST', f'{base_url}/pg_login/login.php', {'token': patient['token']}
+
+
+def classify(status, body):
+    """Error kind for a response, or None when it succeeded."""
+    if BUSY_PATTERN.search(body): return 'sqlite_busy'
+    if status != 200: return f'http_{status}'
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return 'invalid_json'
+    if isinstance(data, dict) and (data.get('success') is False or 'error' in data): return 'app_error'
+    return None
+
+
+async def one_request(session, endpoint, base_url, patient, samples):
+    method, url, payload = build_request(endpoint, base_url, patient)
+    started = time.perf_counter()
+    try:
+        async with session.request(method, url, json=payload, cookies={'aiofc_session': patient['token']}) as resp:
+            body = await resp.text()
+            error = classify(resp.status, body)
+    except asyncio.TimeoutError:
+        error = 'timeout'
+    except aiohttp.ClientError as e:
+        error = f'connection_{type(e).__name__}'
+    samples.append({'endpoint': endpoint, 'latency': time.perf_counter() - started, 'error': error})
+
+
+async def generate_load(args, patients):
+    """Issue requests open-loop at args.rps for args.duration seconds and collect samples."""
+    rng = random.Random(args.seed)
+    weights = [args.mix.get(name, 0) for name in ENDPOINTS]
+    samples = []
+    tasks = []
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    connector = aiohttp.TCPConnector(limit=args.max_connections)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        next_at = start
+        while next_at - start < args.duration:
+            await asyncio.sleep(max(0.0, next_at - loop.time()))
+            endpoint = rng.choices(ENDPOINTS, weights)[0]
+            tasks.append(asyncio.ensure_future(one_request(session, endpoint, args.base_url, rng.choice(patients), samples)))
+            next_at += rng.expovariate(args.rps) if args.poisson else 1.0 / args.rps
+        await asyncio.gather(*tasks)
+        elapsed = loop.time() - start
+    return samples, elapsed
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values: return None
+    return sorted_values[max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)]
+
+
+def summarize(samples, elapsed):
+    """Latency percentiles (ms), throughput and error mix per endpoint and overall."""
+    def stats(group):
+        latencies = sorted(round(s['latency'] * 1000, 2) for s in group)
+        errors = {}
+        for s in group:
+            if s['error']: errors[s['error']] = errors.get(s['error'], 0) + 1
+        return {
+            'requests': len(group),
+            'throughput_rps': round(len(group) / elapsed, 2) if elapsed else 0,
+            'ok': len(group) - sum(errors.values()),
+            'p50_ms': percentile(latencies, 50), 'p95_ms': percentile(latencies, 95),
+            'p99_ms': percentile(latencies, 99), 'max_ms': latencies[-1] if latencies else None,
+            'mean_ms': round(sum(latencies) / len(latencies), 2) if latencies else None,
+            'errors': errors, 'sqlite_busy': errors.get('sqlite_busy', 0),
+        }
+    endpoints = {name: stats([s for s in samples if s['endpoint'] == name]) for name in ENDPOINTS}
+    return {'elapsed_s': round(elapsed, 3), 'total': stats(samples),
+            'endpoints': {k: v for k, v in endpoints.items() if v['requests']}}
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=PROJECT_ROOT).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def print_report(report, previous=None):
+    rows = [('total', report['total'])] + list(report['endpoints'].items())
+    print(f"{'endpoint':<14}{'reqs':>7}{'rps':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'busy':>6}  errors")
+    for name, s in rows:
+        fmt = lambda v: f"{v:.1f}" if v is not None else '-'
+        print(f"{name:<14}{s['requests']:>7}{s['throughput_rps']:>8}{fmt(s['p50_ms']):>9}{fmt(s['p95_ms']):>9}"
+              f"{fmt(s['p99_ms']):>9}{s['sqlite_busy']:>6}  {s['errors'] or ''}")
+        old = (previous or {}).get('endpoints', {}).get(name) if name != 'total' else (previous or {}).get('total')
+        if old and old.get('p95_ms') and s['p95_ms']:
+            print(f"{'':<14}p95 vs previous: {s['p95_ms'] - old['p95_ms']:+.1f} ms "
+                  f"({(s['p95_ms'] / old['p95_ms'] - 1) * 100:+.1f}%)")
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name not in ENDPOINTS: raise argparse.ArgumentTypeError(f"unknown endpoint '{name}'")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Async load generator for the JSON endpoints')
+    parser.add_argument('--base-url', default=os.environ.get('BASE_URL'), help='defaults to $BASE_URL')
+    parser.add_argument('--data-dir', type=Path, default=Path(os.environ.get('AIOFC_DATA_DIR', PROJECT_ROOT / 'data')),
+                        help='data/ directory the server uses, for creating virtual patients')
+    parser.add_argument('--patients', type=int, default=20, help='number of virtual patients')
+    parser.add_argument('--rps', type=float, default=20, help='target requests per second')
+    parser.add_argument('--duration', type=float, default=30, help='seconds of load')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('chat=1,conversation=4,dashboard=4,login=1'),
+                        help='endpoint weights, e.g. chat=1,conversation=4,dashboard=4,login=1')
+    parser.add_argument('--poisson', action='store_true', help='exponential inter-arrival times instead of fixed')
+    parser.add_argument('--timeout', type=float, default=30, help='per-request timeout in seconds')
+    parser.add_argument('--max-connections', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', type=Path, help='JSON result file (default tmp/bench/load-<timestamp>.json)')
+    parser.add_argument('--compare', type=Path, help='previous JSON result to diff p95 against')
+    parser.add_argument('--keep-fixtures', action='store_true', help='leave virtual patients in the database')
+    args = parser.parse_args()
+    if not args.base_url: parser.error('--base-url or BASE_URL is required')
+    args.base_url = args.base_url.rstrip('/')
+
+    patients = setup_patients(args.data_dir, args.patients, args.seed)
+    try:
+        samples, elapsed = asyncio.run(generate_load(args, patients))
+    finally:
+        if not args.keep_fixtures: cleanup_patients(args.data_dir)
+
+    report = {
+        'meta': {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()), 'git_revision': git_revision(),
+                 'base_url': args.base_url, 'patients': args.patients, 'target_rps': args.rps,
+                 'duration_s': args.duration, 'mix': args.mix, 'poisson': args.poisson, 'seed': args.seed},
+        **summarize(samples, elapsed),
+    }
+    output = args.output or PROJECT_ROOT / 'tmp' / 'bench' / f"load-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print_report(report, json.loads(args.compare.read_text()) if args.compare else None)
+    print(f"\nResults written to {output}")
+    return 0 if report['total']['ok'] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
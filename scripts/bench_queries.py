@@ -0,0 +1,242 @@
+#!/home/ace/bin/uvrun
+# /// script
+# requires-python = ">=3.8"
+# dependencies = []
+# ///
+"""
+Latency benchmark for the per-request SQL queries, directly against SQLite.
+
+Runs each hot query from the PHP pages many times with parameters sampled from the
+database (real user ids, conversation ids, tokens and verification codes) and reports
+p50/p95/mean per query. With --before-after it measures the effect of index
+migrations: on a copy of the data directory it drops the indexes those migrations
+create, measures, re-applies the migrations, and measures again.
+
+Usage:
+    ./scripts/gen_synthetic_data.py --users 10100 --out tmp/synthetic_1m   # ~1M chat messages
+    ./scripts/bench_queries.py --data-dir tmp/synthetic_1m
+    ./scripts/bench_queries.py --data-dir tmp/synthetic_1m \\
+        --before-after migrations/app/0004_hot_path_indexes.sql migrations/auth/0002_hot_path_indexes.sql
+"""
+
+import argparse
+import json
+import math
+import random
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from migrate import DATABASES, copy_data_dir
+
+PROJECT_ROOT = Path(__file__).parent.parent
+CREATE_INDEX = re.compile(r'CREATE\s+(?:UNIQUE\s+)?INDEX\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)', re.I)
+
+# (label, database, sql, sample) - sql mirrors the PHP query, sample names the fixture it binds
+QUERIES = [
+    ('session lookup (lib.php)', 'auth',
+     "SELECT user_id FROM sessions WHERE token = :token AND expires_at > datetime('now') LIMIT 1", 'session'),
+    ('code check (login.php)', 'auth', """
+        SELECT id FROM verification_codes
+        WHERE email = :email AND code = :code AND used = 0 AND expires_at > datetime('now')
+        ORDER BY created_at DESC LIMIT 1
+     """, 'code'),
+    ('chat history (api_chat.php)', 'app', """
+        SELECT role, message FROM chat_messages
+        WHERE conversation_id = :conversation_id AND (deleted = 0 OR deleted IS NULL)
+        ORDER BY timestamp ASC
+     """, 'conversation'),
+    ('conversation (api_get_conversation.php)', 'app', """
+        SELECT message_id, role, message, timestamp FROM chat_messages
+        WHERE conversation_id = :conversation_id AND (deleted = 0 OR deleted IS NULL)
+        ORDER BY timestamp ASC
+     """, 'conversation'),
+    ('records for prompt (api_chat.php)', 'app', """
+        SELECT record_title, record_type, record_date, content FROM medical_records
+        WHERE user_id = :user_id ORDER BY record_date DESC
+     """, 'user'),
+    ('appointments for prompt (api_chat.php)', 'app', """
+        SELECT appointment_date, appointment_time, doctor_name, appointment_type, location, notes, status
+        FROM appointments WHERE user_id = :user_id ORDER BY appointment_date DESC, appointment_time DESC
+     """, 'user'),
+    ('sidebar (pg_chat/index.php)', 'app', """
+        SELECT conversation_id, title, created_at, updated_at, last_message_at, message_count FROM conversations
+        WHERE user_id = :user_id AND (deleted_flag = 0 OR deleted_flag IS NULL)
+        ORDER BY COALESCE(last_message_at, updated_at) DESC, rowid DESC LIMIT 31
+     """, 'user'),
+    ('recent chats (api_dashboard.php)', 'app', """
+        SELECT conversation_id, title as preview, COALESCE(last_message_at, updated_at) as timestamp, message_count
+        FROM conversations WHERE user_id = :user_id AND (deleted_flag = 0 OR deleted_flag IS NULL)
+        ORDER BY COALESCE(last_message_at, updated_at) DESC LIMIT 3
+     """, 'user'),
+    ('record count (api_dashboard.php)', 'app',
+     "SELECT COUNT(*) as count FROM medical_records WHERE user_id = :user_id", 'user'),
+    ('next appointment (api_dashboard.php)', 'app', """
+        SELECT appointment_date as date, appointment_time as time, appointment_datetime_utc, doctor_name,
+               appointment_type, location
+        FROM appointments WHERE user_id = :user_id
+        ORDER BY appointment_datetime_utc DESC, appointment_date DESC LIMIT 1
+     """, 'user'),
+    ('record list (pg_records/index.php)', 'app', """
+        SELECT record_id, record_title, record_type, record_date, source_filename FROM medical_records
+        WHERE user_id = :user_id ORDER BY record_date DESC, created_at DESC
+     """, 'user'),
+]
+
+
+def open_connections(data_dir):
+    return {key: sqlite3.connect(f'file:{data_dir / name}?mode=ro', uri=True) for key, name in DATABASES.items()
+            if (data_dir / name).exists()}
+
+
+def sample_fixtures(conns, count, seed):
+    """Parameter sets per sample kind, drawn from the data itself so every query hits real rows."""
+    rng = random.Random(seed)
+
+    def pick(conn, sql):
+        rows = conn.execute(sql).fetchall()
+        return [rows[rng.randrange(len(rows))] for _ in range(count)] if rows else []
+
+    auth, app = conns['auth'], conns['app']
+    return {
+        'session': [{'token': t} for (t,) in pick(auth, "SELECT token FROM sessions")],
+        'code': [{'email': e, 'code': c} for e, c in pick(auth, "SELECT email, code FROM verification_codes")],
+        'conversation': [{'conversation_id': c} for (c,) in pick(app, "SELECT conversation_id FROM conversations")],
+        'user': [{'user_id': u} for (u,) in pick(app, "SELECT user_id FROM patients")],
+    }
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    return sorted_values[max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)]
+
+
+def run_queries(conns, fixtures, iterations, warmup=5):
+    """Time each query over `iterations` parameter sets; returns {label: stats}."""
+    results = {}
+    for label, db, sql, sample in QUERIES:
+        conn, params = conns[db], fixtures[sample]
+        if not params: continue
+        for p in params[:warmup]: conn.execute(sql, p).fetchall()
+        timings = []
+        rows = 0
+        for p in params[:iterations]:
+            started = time.perf_counter()
+            rows += len(conn.execute(sql, p).fetchall())
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        plan = [r[3] for r in conn.execute('EXPLAIN QUERY PLAN ' + sql, params[0])]
+        results[label] = {'p50_ms': percentile(timings, 50), 'p95_ms': percentile(timings, 95),
+                          'mean_ms': sum(timings) / len(timings), 'rows_per_query': rows / len(timings), 'plan': plan}
+    return results
+
+
+def database_sizes(data_dir):
+    return {key: (data_dir / name).stat().st_size for key, name in DATABASES.items() if (data_dir / name).exists()}
+
+
+def migration_indexes(paths):
+    """(database key, sql, index names) for each index migration file."""
+    migrations = []
+    for path in paths:
+        sql = path.read_text()
+        migrations.append((path.parent.name, sql, CREATE_INDEX.findall(sql)))
+    return migrations
+
+
+def before_after(data_dir, migration_paths, iterations, seed):
+    """Measure on a copy without the migrations' indexes, then with them."""
+    (PROJECT_ROOT / 'tmp').mkdir(exist_ok=True)
+    copy_dir = Path(tempfile.mkdtemp(prefix='bench_queries_', dir=PROJECT_ROOT / 'tmp'))
+    try:
+        copy_data_dir(data_dir, copy_dir)
+        migrations = migration_indexes(migration_paths)
+        for db, _, names in migrations:
+            conn = sqlite3.connect(copy_dir / DATABASES[db])
+            for name in names: conn.execute(f'DROP INDEX IF EXISTS {name}')
+            conn.execute('VACUUM')
+            conn.close()
+
+        sizes_before = database_sizes(copy_dir)
+        conns = open_connections(copy_dir)
+        fixtures = sample_fixtures(conns, iterations + 5, seed)
+        before = run_queries(conns, fixtures, iterations)
+        for conn in conns.values(): conn.close()
+
+        build_seconds = {}
+        for db, sql, _ in migrations:
+            conn = sqlite3.connect(copy_dir / DATABASES[db])
+            started = time.perf_counter()
+            conn.executescript(sql)
+            build_seconds[db] = build_seconds.get(db, 0) + time.perf_counter() - started
+            conn.close()
+
+        conns = open_connections(copy_dir)
+        after = run_queries(conns, fixtures, iterations)
+        for conn in conns.values(): conn.close()
+        return {'before': before, 'after': after, 'index_build_seconds': build_seconds,
+                'size_before': sizes_before, 'size_after': database_sizes(copy_dir)}
+    finally:
+        shutil.rmtree(copy_dir, ignore_errors=True)
+
+
+def print_results(results):
+    print(f"\n{'Query':<42} {'p50 ms':>9} {'p95 ms':>9} {'rows':>7}")
+    print("-" * 70)
+    for label, r in results.items():
+        print(f"{label:<42} {r['p50_ms']:>9.3f} {r['p95_ms']:>9.3f} {r['rows_per_query']:>7.1f}")
+
+
+def print_comparison(report):
+    print(f"\n{'Query':<42} {'p50 before':>11} {'p50 after':>10} {'p95 before':>11} {'p95 after':>10} {'speedup':>8}")
+    print("-" * 96)
+    for label, b in report['before'].items():
+        a = report['after'][label]
+        speedup = b['p50_ms'] / a['p50_ms'] if a['p50_ms'] else float('inf')
+        print(f"{label:<42} {b['p50_ms']:>11.3f} {a['p50_ms']:>10.3f} {b['p95_ms']:>11.3f} {a['p95_ms']:>10.3f} "
+              f"{speedup:>7.0f}x")
+    print()
+    for db in report['size_before']:
+        growth = report['size_after'][db] - report['size_before'][db]
+        print(f"{DATABASES[db]}: index build {report['index_build_seconds'].get(db, 0):.2f}s, "
+              f"+{growth / 1048576:.1f} MB ({report['size_before'][db] / 1048576:.0f} MB before)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-query latency of the hot SQL paths')
+    parser.add_argument('--data-dir', type=Path, default=PROJECT_ROOT / 'tmp' / 'synthetic')
+    parser.add_argument('--iterations', type=int, default=200, help='executions per query')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--before-after', type=Path, nargs='+', metavar='MIGRATION',
+                        help='index migration files to measure without and with (paths under scripts/)')
+    parser.add_argument('--output', type=Path, help='JSON report path (default: tmp/bench/queries-<time>.json)')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.data_dir / 'aioffice.db')
+    messages = conn.execute('SELECT COUNT(*) FROM chat_messages').fetchone()[0]
+    conn.close()
+    print(f"Data: {args.data_dir} ({messages:,} chat messages), {args.iterations} executions per query")
+
+    if args.before_after:
+        paths = [p if p.exists() else Path(__file__).parent / p for p in args.before_after]
+        report = before_after(args.data_dir, paths, args.iterations, args.seed)
+        print_comparison(report)
+    else:
+        conns = open_connections(args.data_dir)
+        report = {'results': run_queries(conns, sample_fixtures(conns, args.iterations + 5, args.seed), args.iterations)}
+        print_results(report['results'])
+    report.update({'data_dir': str(args.data_dir), 'chat_messages': messages, 'iterations': args.iterations})
+
+    output = args.output or PROJECT_ROOT / 'tmp' / 'bench' / f"queries-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"\nReport: {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+#!/home/ace/bin/uvrun
+# /// script
+# requires-python = ">=3.8"
+# dependencies = []
+# ///
+"""
+Local stand-in for ~/bin/email-send and ~/bin/email-read.
+
+`send` takes the same arguments as email-send and drops the message as a JSON file
+into a spool directory instead of sending it. `read` blocks until a matching message
+arrives, so tests wait exactly as long as delivery takes instead of sleeping.
+
+Point login.php at it with:
+    AIOFC_EMAIL_SEND="python3 /path/to/scripts/email_standin.py send"
+    AIOFC_MAIL_SPOOL=/path/to/spool            # optional, defaults to tmp/mail_spool
+
+Usage:
+    ./scripts/email_standin.py send <to> <subject> <body>
+    ./scripts/email_standin.py read [--to EMAIL] [--since EPOCH] [--timeout SECONDS]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+from pathlib import Path
+
+DEFAULT_SPOOL = Path(__file__).parent.parent / 'tmp' / 'mail_spool'
+
+
+def spool_dir():
+    """Spool directory shared by the sender (PHP) and readers (tests)."""
+    return Path(os.environ.get('AIOFC_MAIL_SPOOL', DEFAULT_SPOOL))
+
+
+def send_message(to, subject, body, spool=None):
+    """Write a message into the spool atomically, so readers never see partial files."""
+    spool = Path(spool or spool_dir())
+    spool.mkdir(parents=True, exist_ok=True)
+    sent_at = time.time()
+    name = f"{sent_at:.6f}-{uuid.uuid4().hex[:8]}.json"
+    tmp_path = spool / f".{name}.tmp"
+    tmp_path.write_text(json.dumps({'to': to, 'subject': subject, 'body': body, 'sent_at': sent_at}))
+    os.replace(tmp_path, spool / name)
+    return spool / name
+
+
+def list_messages(spool=None, to=None, since=0.0):
+    """Messages in the spool, oldest first, optionally filtered by recipient and send time."""
+    spool = Path(spool or spool_dir())
+    if not spool.exists(): return []
+    messages = [json.loads(p.read_text()) for p in sorted(spool.glob('*.json'))]
+    return [m for m in messages if m['sent_at'] >= since and (to is None or m['to'] == to)]
+
+
+def wait_for_message(to=None, since=0.0, timeout=10.0, spool=None, poll=0.02):
+    """Block until a message for `to` sent at or after `since` arrives; return the newest, or None."""
+    spool = Path(spool or spool_dir())
+    deadline = time.time() + timeout
+    last_mtime = None
+    while True:
+        mtime = spool.stat().st_mtime if spool.exists() else None
+        # NOTE: only rescan when the directory changed; os.replace() bumps its mtime on every delivery
+        if mtime != last_mtime:
+            last_mtime = mtime
+            messages = list_messages(spool, to, since)
+            if messages: return messages[-1]
+        if time.time() >= deadline: return None
+        time.sleep(poll)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Spool-based stand-in for email-send/email-read')
+    commands = parser.add_subparsers(dest='command', required=True)
+    send = commands.add_parser('send', help='same arguments as ~/bin/email-send')
+    send.add_argument('to')
+    send.add_argument('subject')
+    send.add_argument('body')
+    read = commands.add_parser('read', help='wait for a message and print it')
+    read.add_argument('--to')
+    read.add_argument('--since', type=float, default=0.0, help='only messages sent at or after this epoch time')
+    read.add_argument('--timeout', type=float, default=10.0)
+    args = parser.parse_args()
+
+    if args.command == 'send':
+        send_message(args.to, args.subject, args.body)
+        return 0
+    message = wait_for_message(args.to, args.since, args.timeout)
+    if not message:
+        print("No message arrived", file=sys.stderr)
+        return 1
+    print(f"To: {message['to']}\nSubject: {message['subject']}\n\n{message['body']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
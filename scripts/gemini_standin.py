@@ -0,0 +1,356 @@
+#!/home/ace/bin/uvrun
+# /// script
+# requires-python = ">=3.8"
+# dependencies = []
+# ///
+"""
+Local stand-in for the Gemini generateContent API.
+
+Implements `models/{model}:generateContent` and `models/{model}:streamGenerateContent`
+(JSON array or `alt=sse`) with programmable latency, usageMetadata token counts,
+429/5xx failure injection and canned replies, so the chat path can be tested and
+load-tested offline without spending API quota.
+
+Explicit context caching is emulated too: `cachedContents` can be created, read,
+extended (PATCH ttl), listed and deleted, and a generateContent request naming one
+reads its systemInstruction/contents from it and reports cachedContentTokenCount.
+`--cache-min-tokens` and `--no-caching` reproduce Gemini refusing to create an entry.
+
+Point the PHP app at it with:
+    AIOFC_GEMINI_BASE_URL=http://127.0.0.1:8765/v1beta AIOFC_GEMINI_API_KEY=standin
+
+Latency specs: `fixed:0.4`, `uniform:0.2,1.5`, `normal:0.8,0.2`, `lognormal:-0.5,0.6` (seconds).
+Runtime settings can be changed with `POST /_standin/config` (same keys as the CLI options)
+and counters read with `GET /_standin/stats`. `GET /_standin/requests` returns the latest
+generate requests as received, each with the full prompt text the model would have read
+(a named cachedContents entry filled in), so tests can check what the app sent.
+"""
+
+import argparse
+import collections
+import json
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_REPLY = ("I have reviewed your medical records. Regarding \"{question}\": your results are within "
+                 "the normal range. I am not a doctor, so please consult your healthcare provider.")
+
+ERROR_STATUS = {429: 'RESOURCE_EXHAUSTED', 500: 'INTERNAL', 502: 'UNAVAILABLE', 503: 'UNAVAILABLE',
+                504: 'DEADLINE_EXCEEDED'}
+
+
+def parse_latency(spec):
+    """Turn a latency spec like 'uniform:0.2,1.5' into a sampling function."""
+    kind, _, args = spec.partition(':')
+    values = [float(v) for v in args.split(',') if v]
+    samplers = {
+        'fixed': lambda rng: values[0],
+        'uniform': lambda rng: rng.uniform(values[0], values[1]),
+        'normal': lambda rng: rng.gauss(values[0], values[1]),
+        'lognormal': lambda rng: rng.lognormvariate(values[0], values[1]),
+    }
+    if kind not in samplers: raise ValueError(f"Unknown latency distribution: {spec}")
+    return lambda rng: max(0.0, samplers[kind](rng))
+
+
+def estimate_tokens(text):
+    """Rough Gemini token estimate: about four characters per token."""
+    return max(1, len(text) // 4)
+
+
+class StandinState:
+    """Mutable settings and counters shared by all request threads."""
+
+    def __init__(self, args):
+        self.lock = threading.Lock()
+        self.rng = random.Random(args.seed)
+        self.stats = {'requests': 0, 'stream_requests': 0, 'errors': {}, 'prompt_tokens': 0, 'output_tokens': 0,
+                      'cache_creates': 0, 'cache_updates': 0, 'cache_deletes': 0, 'cached_tokens': 0}
+        self.caches = {}
+        self.requests = collections.deque(maxlen=100)
+        self.configure(vars(args))
+
+    def configure(self, settings):
+        with self.lock:
+            if settings.get('latency'): self.latency = parse_latency(settings['latency'])
+            if settings.get('chunk_delay') is not None: self.chunk_delay = float(settings['chunk_delay'])
+            if settings.get('error_rate') is not None: self.error_rate = float(settings['error_rate'])
+            if settings.get('error_codes'): self.error_codes = [int(c) for c in str(settings['error_codes']).split(',')]
+            if 'output_tokens' in settings: self.output_tokens = settings['output_tokens']
+            if settings.get('cache_min_tokens') is not None: self.cache_min_tokens = int(settings['cache_min_tokens'])
+            if 'no_caching' in settings: self.caching = not settings['no_caching']
+            if settings.get('replies_file'):
+                with open(settings['replies_file']) as f: self.replies = json.load(f)
+            elif settings.get('replies'):
+                self.replies = settings['replies']
+            elif not hasattr(self, 'replies'):
+                self.replies = [DEFAULT_REPLY]
+            self.reply_index = 0
+
+    def next_outcome(self):
+        """Decide latency, injected error (or None) and canned reply for one request."""
+        with self.lock:
+            delay = self.latency(self.rng)
+            error = self.rng.choice(self.error_codes) if self.rng.random() < self.error_rate else None
+            reply = self.replies[self.reply_index % len(self.replies)]
+            self.reply_index += 1
+            return delay, error, reply
+
+    def count(self, key, amount=1):
+        with self.lock: self.stats[key] += amount
+
+    def count_error(self, code):
+        with self.lock: self.stats['errors'][str(code)] = self.stats['errors'].get(str(code), 0) + 1
+
+    def live_cache(self, name):
+        """The cachedContents entry with this name, or None if unknown or expired."""
+        with self.lock:
+            cache = self.caches.get(name)
+            if cache and cache['expires'] <= time.time():
+                del self.caches[name]
+                cache = None
+            return cache
+
+
+def build_reply(template, request, output_tokens):
+    """Fill the canned reply with the latest user question and pad it to output_tokens if asked."""
+    user_turns = [c for c in request.get('contents', []) if c.get('role', 'user') == 'user']
+    # The question is the last part: callers may put per-turn context in front of it
+    question = user_turns[-1]['parts'][-1].get('text', '') if user_turns else ''
+    text = template.replace('{question}', question[:200])
+    if output_tokens:
+        filler = ' Please bring these results to your next appointment.'
+        while estimate_tokens(text) < output_tokens: text += filler
+        text = text[:output_tokens * 4]
+    return text
+
+
+def prompt_text(request):
+    """All text the model would read for this request (or for a cachedContents entry)."""
+    parts = request.get('systemInstruction', {}).get('parts', [])
+    for content in request.get('contents', []): parts = parts + content.get('parts', [])
+    return ''.join(p.get('text', '') for p in parts)
+
+
+def parse_ttl(value):
+    """Seconds from a protobuf Duration string such as '3600s'."""
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)s', str(value or '3600s'))
+    if not match: raise ValueError(f"Invalid ttl: {value}")
+    return float(match.group(1))
+
+
+def rfc3339(timestamp):
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(timestamp)) + f'.{int(timestamp % 1 * 1e6):06d}Z'
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def send_error_json(self, code, message):
+        self.send_json(code, {'error': {'code': code, 'message': message, 'status': ERROR_STATUS.get(code, {
+            400: 'INVALID_ARGUMENT', 403: 'PERMISSION_DENIED', 404: 'NOT_FOUND'}.get(code, 'UNKNOWN'))}})
+
+    def cache_name(self):
+        """`cachedContents/{id}` from the request path, or None."""
+        match = re.search(r'/(cachedContents/[^/?]+)', self.path)
+        return match.group(1) if match else None
+
+    def cache_resource(self, cache):
+        """Public view of a cachedContents entry (contents are never echoed back, as in the real API)."""
+        return {'name': cache['name'], 'model': cache['model'], 'displayName': cache.get('displayName', ''),
+                'createTime': rfc3339(cache['created']), 'updateTime': rfc3339(cache['updated']),
+                'expireTime': rfc3339(cache['expires']), 'usageMetadata': {'totalTokenCount': cache['tokens']}}
+
+    def do_GET(self):
+        if self.path.startswith('/_standin/stats'): return self.send_json(200, self.state.stats)
+        if self.path.startswith('/_standin/requests'):
+            with self.state.lock: return self.send_json(200, {'requests': list(self.state.requests)})
+        name = self.cache_name()
+        if name:
+            cache = self.state.live_cache(name)
+            return self.send_json(200, self.cache_resource(cache)) if cache else self.send_error_json(404, f'{name} not found')
+        if re.search(r'/cachedContents(\?|$)', self.path):
+            live = [c for c in (self.state.live_cache(n) for n in list(self.state.caches)) if c]
+            return self.send_json(200, {'cachedContents': [self.cache_resource(c) for c in live]})
+        self.send_json(404, {'error': {'code': 404, 'message': 'Not found', 'status': 'NOT_FOUND'}})
+
+    def do_PATCH(self):
+        request = self.read_json()
+        name = self.cache_name()
+        cache = self.state.live_cache(name) if name else None
+        if not cache: return self.send_error_json(404, f'{name} not found')
+        try:
+            ttl = parse_ttl(request.get('ttl'))
+        except ValueError as e:
+            return self.send_error_json(400, str(e))
+        with self.state.lock:
+            cache['expires'] = time.time() + ttl
+            cache['updated'] = time.time()
+        self.state.count('cache_updates')
+        self.send_json(200, self.cache_resource(cache))
+
+    def do_DELETE(self):
+        name = self.cache_name()
+        with self.state.lock:
+            cache = self.state.caches.pop(name, None) if name else None
+        if not cache: return self.send_error_json(404, f'{name} not found')
+        self.state.count('cache_deletes')
+        self.send_json(200, {})
+
+    def create_cache(self, request):
+        """POST cachedContents: store the prompt prefix and return the new entry."""
+        if not self.state.caching:
+            return self.send_error_json(400, f"Model {request.get('model')} does not support caching")
+        tokens = estimate_tokens(prompt_text(request))
+        if tokens < self.state.cache_min_tokens:
+            return self.send_error_json(400, f'Cached content is too small. total_token_count={tokens}, '
+                                             f'min_total_token_count={self.state.cache_min_tokens}')
+        if not request.get('model'): return self.send_error_json(400, 'model is required')
+        try:
+            ttl = parse_ttl(request.get('ttl'))
+        except ValueError as e:
+            return self.send_error_json(400, str(e))
+        now = time.time()
+        cache = {'name': f'cachedContents/{random.getrandbits(64):016x}', 'model': request['model'],
+                 'displayName': request.get('displayName', ''), 'systemInstruction': request.get('systemInstruction', {}),
+                 'contents': request.get('contents', []), 'tokens': tokens, 'created': now, 'updated': now,
+                 'expires': now + ttl}
+        with self.state.lock: self.state.caches[cache['name']] = cache
+        self.state.count('cache_creates')
+        self.send_json(200, self.cache_resource(cache))
+
+    def do_POST(self):
+        request = self.read_json()
+        if self.path.startswith('/_standin/config'):
+            self.state.configure(request)
+            return self.send_json(200, {'success': True})
+        if re.search(r'/cachedContents(\?|$)', self.path):
+            return self.create_cache(request)
+
+        match = re.search(r'/models/([^/:]+):(generateContent|streamGenerateContent)', self.path)
+        if not match:
+            return self.send_json(404, {'error': {'code': 404, 'message': 'Not found', 'status': 'NOT_FOUND'}})
+        model, method = match.groups()
+        stream = method == 'streamGenerateContent'
+        self.state.count('stream_requests' if stream else 'requests')
+
+        received = request
+        cached_tokens = 0
+        if request.get('cachedContent'):
+            cache = self.state.live_cache(request['cachedContent'])
+            if not cache:
+                return self.send_error_json(403, f"CachedContent not found (or permission denied): {request['cachedContent']}")
+            if request.get('systemInstruction'):
+                return self.send_error_json(400, 'CachedContent can not be used with GenerateContent request '
+                                                 'setting system_instruction, tools or tool_config.')
+            if cache['model'] != f'models/{model}':
+                return self.send_error_json(400, f"Model {model} does not match the cached content's model {cache['model']}")
+            cached_tokens = cache['tokens']
+            request = {**request, 'systemInstruction': cache['systemInstruction'],
+                       'contents': cache['contents'] + request.get('contents', [])}
+
+        with self.state.lock:
+            self.state.requests.append({'method': method, 'request': received, 'prompt': prompt_text(request)})
+        delay, error, template = self.state.next_outcome()
+        time.sleep(delay)
+        if error:
+            self.state.count_error(error)
+            message = 'Resource has been exhausted (e.g. check quota).' if error == 429 else 'Injected failure'
+            return self.send_json(error, {'error': {'code': error, 'message': message, 'status': ERROR_STATUS.get(error, 'UNKNOWN')}})
+
+        text = build_reply(template, request, self.state.output_tokens)
+        prompt_tokens = estimate_tokens(prompt_text(request))
+        output_tokens = estimate_tokens(text)
+        self.state.count('prompt_tokens', prompt_tokens)
+        self.state.count('output_tokens', output_tokens)
+        self.state.count('cached_tokens', cached_tokens)
+        usage = {'promptTokenCount': prompt_tokens, 'candidatesTokenCount': output_tokens,
+                 'totalTokenCount': prompt_tokens + output_tokens,
+                 **({'cachedContentTokenCount': cached_tokens} if cached_tokens else {})}
+        if not stream:
+            return self.send_json(200, {
+                'candidates': [{'content': {'role': 'model', 'parts': [{'text': text}]}, 'finishReason': 'STOP', 'index': 0}],
+                'usageMetadata': usage, 'modelVersion': model
+            })
+        self.stream_reply(text, usage, model, sse='alt=sse' in self.path)
+
+    def stream_reply(self, text, usage, model, sse):
+        """Send the reply in word-sized chunks, as SSE events or as a streamed JSON array."""
+        words = re.findall(r'\S+\s*', text) or ['']
+        chunks = [''.join(words[i:i + 8]) for i in range(0, len(words), 8)]
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream' if sse else 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for i, chunk in enumerate(chunks):
+            last = i == len(chunks) - 1
+            payload = {'candidates': [{'content': {'role': 'model', 'parts': [{'text': chunk}]}, 'index': 0,
+                                       **({'finishReason': 'STOP'} if last else {})}],
+                       'modelVersion': model, **({'usageMetadata': usage} if last else {})}
+            body = json.dumps(payload)
+            data = f"data: {body}\r\n\r\n" if sse else ('[' if i == 0 else ',\r\n') + body + (']' if last else '')
+            self.write_chunk(data.encode())
+            if not last: time.sleep(self.state.chunk_delay)
+        self.write_chunk(b'')
+
+    def write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Local Gemini API stand-in')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', default='fixed:0', help='latency distribution, e.g. uniform:0.2,1.5')
+    parser.add_argument('--chunk-delay', type=float, default=0.05, help='seconds between streamed chunks')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests that fail')
+    parser.add_argument('--error-codes', default='429,500,503', help='HTTP codes to inject, comma separated')
+    parser.add_argument('--output-tokens', type=int, default=None, help='pad replies to about this many tokens')
+    parser.add_argument('--replies-file', help='JSON list of canned replies ({question} is substituted)')
+    parser.add_argument('--cache-min-tokens', type=int, default=0, help='refuse cachedContents smaller than this')
+    parser.add_argument('--no-caching', action='store_true', help='refuse every cachedContents create, like a '
+                                                                  'model without caching support')
+    parser.add_argument('--seed', type=int, default=None)
+    return parser.parse_args(argv)
+
+
+def serve(args):
+    """Create the stand-in server (call serve_forever() on it, possibly in a thread)."""
+    handler = type('StandinHandler', (Handler,), {'state': StandinState(args)})
+    return ThreadingHTTPServer((args.host, args.port), handler)
+
+
+def main():
+    args = parse_args()
+    server = serve(args)
+    print(f"Gemini stand-in on http://{args.host}:{server.server_port}/v1beta", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,252 @@
+#!/home/ace/bin/uvrun
+# /// script
+# requires-python = ">=3.8"
+# dependencies = []
+# ///
+"""
+Synthetic data generator for scale-testing auth.db and aioffice.db.
+
+Fills the schemas from SCHEMA.md/AUTH.md with users, sessions (some expired),
+verification codes, patients, multi-KB markdown medical records, appointments,
+conversations and chat messages (including soft-deleted ones). Rows are streamed
+through executemany() in batches inside bulk-load pragmas, so tens of millions of
+rows load in minutes.
+
+Output is deterministic for a given --seed and --now, so benchmark runs are reproducible.
+
+Usage:
+    ./scripts/gen_synthetic_data.py --out tmp/synthetic --users 10000 --messages-per-conversation 40
+"""
+
+import argparse
+import datetime
+import itertools
+import random
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+from migrate import migrate_data_dir
+
+PROJECT_ROOT = Path(__file__).parent.parent
+
+DOCTORS = ['Dr. Smith', 'Dr. Patel', 'Dr. Nguyen', 'Dr. Garcia', 'Dr. Okafor', 'Dr. Chen', 'Dr. Rossi']
+FIRST_NAMES = ['John', 'Mary', 'Aisha', 'Wei', 'Carlos', 'Fatima', 'Olga', 'Kenji', 'Priya', 'Liam', 'Sofia']
+LAST_NAMES = ['Doe', 'Smith', 'Khan', 'Li', 'Garcia', 'Ivanova', 'Tanaka', 'Sharma', 'Murphy', 'Rossi']
+RECORD_TYPES = [('lab_results', 'Blood Work Results'), ('lab_results', 'Lipid Panel'), ('lab_results', 'Hormone Report'),
+                ('prescriptions', 'Prescription Update'), ('visit_notes', 'Visit Summary'), ('imaging', 'Imaging Report')]
+LAB_TESTS = [('Hemoglobin', 'g/dL', 12.0, 17.5), ('White Blood Cells', '/uL', 4000, 11000), ('Platelets', 'K/uL', 150, 400),
+             ('Glucose', 'mg/dL', 70, 140), ('LDL Cholesterol', 'mg/dL', 60, 190), ('HDL Cholesterol', 'mg/dL', 35, 80),
+             ('TSH', 'mIU/L', 0.4, 4.5), ('Creatinine', 'mg/dL', 0.6, 1.3), ('Vitamin D', 'ng/mL', 20, 80),
+             ('Sodium', 'mmol/L', 135, 145), ('Potassium', 'mmol/L', 3.5, 5.1), ('HbA1c', '%', 4.5, 7.5)]
+WORDS = ('patient reports mild fatigue improved sleep continue current medication follow up in three months '
+         'blood pressure stable no acute distress reviewed results discussed diet exercise plan referred to '
+         'specialist monitor symptoms hydration recommended dose adjusted tolerating well side effects none').split()
+QUESTIONS = ['What do my latest lab results mean?', 'Is my cholesterol too high?', 'Should I worry about my TSH level?',
+             'What should I ask Dr. Smith at my next appointment?', 'Can you explain my prescription changes?',
+             'Why was my vitamin D low?', 'When is my next appointment?', 'Are my blood sugar numbers normal?']
+
+
+def rows_in_batches(rows, size):
+    while True:
+        batch = list(itertools.islice(rows, size))
+        if not batch: return
+        yield batch
+
+
+def bulk_insert(conn, table, columns, rows, batch_size):
+    """Stream rows into table with executemany, one transaction per batch; return the row count."""
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    started = time.time()
+    count = 0
+    for batch in rows_in_batches(rows, batch_size):
+        with conn: conn.executemany(sql, batch)
+        count += len(batch)
+    elapsed = time.time() - started
+    print(f"  {table:<20}{count:>12,} rows {elapsed:>8.1f}s {count / max(elapsed, 1e-9):>12,.0f} rows/s")
+    return count
+
+
+class Generator:
+    """Deterministic row streams; every table draws from its own RNG so counts elsewhere don't shift it."""
+
+    def __init__(self, args):
+        self.args = args
+        self.epoch = datetime.datetime.fromisoformat(args.now).replace(tzinfo=datetime.timezone.utc).timestamp()
+        self.user_ids = [self.ident(random.Random(f'{args.seed}-uid-{i}'), 22) for i in range(args.users)]
+        rng = self.rng('corpus')
+        sentences = (' '.join(rng.choices(WORDS, k=rng.randint(8, 20))).capitalize() + '.' for _ in range(50000))
+        self.corpus = ' '.join(sentences)
+
+    def text(self, rng, length):
+        """About `length` characters of prose, sliced from a pre-generated corpus (per-word RNG is far too slow)."""
+        start = self.corpus.index(' ', rng.randrange(len(self.corpus) - length - 200)) + 1
+        return self.corpus[start:start + length]
+
+    def rng(self, name):
+        return random.Random(f'{self.args.seed}-{name}')
+
+    @staticmethod
+    def ident(rng, length):
+        return f'{rng.getrandbits(length * 4):0{length}x}'
+
+    def ts(self, seconds_ago):
+        return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(self.epoch - seconds_ago))
+
+    def count(self, rng, mean):
+        return rng.randint(0, 2 * mean) if mean else 0
+
+    def users(self):
+        rng = self.rng('users')
+        for i, user_id in enumerate(self.user_ids):
+            created = rng.randint(86400, 3 * 365 * 86400)
+            yield user_id, f'patient{i}@example.com', self.ts(created), self.ts(rng.randint(0, created))
+
+    def sessions(self):
+        rng = self.rng('sessions')
+        for user_id in self.user_ids:
+            for _ in range(self.count(rng, self.args.sessions_per_user)):
+                created = rng.randint(0, 90 * 86400)
+                activity = rng.randint(0, created)
+                expires = -32 * 86400 + activity if rng.random() >= self.args.expired_session_rate \
+                    else rng.randint(1, 60 * 86400)
+                yield (self.ident(rng, 22), user_id, self.ident(rng, 22), 'Mozilla/5.0 (synthetic)',
+                       self.ts(created), self.ts(activity), self.ts(expires))
+
+    def verification_codes(self):
+        rng = self.rng('codes')
+        for i in range(self.args.verification_codes):
+            created = rng.randint(0, 30 * 86400)
+            yield (self.ident(rng, 22), f'patient{rng.randrange(max(self.args.users, 1))}@example.com',
+                   f'{rng.randrange(1000000):06d}', self.ts(created), self.ts(created - 900), int(rng.random() < 0.8))
+
+    def patients(self):
+        rng = self.rng('patients')
+        for user_id in self.user_ids:
+            created = self.ts(rng.randint(86400, 3 * 365 * 86400))
+            yield user_id, f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}', created, created
+
+    def record_content(self, rng, title, date):
+        """Markdown record of roughly --record-kb kilobytes: a lab table followed by narrative notes."""
+        lines = [f'# {title}', '', f'**Date:** {date}  ', f'**Ordering physician:** {rng.choice(DOCTORS)}', '',
+                 '| Test | Result | Units | Reference range | Flag |', '|---|---|---|---|---|']
+        for name, unit, low, high in rng.sample(LAB_TESTS, rng.randint(4, len(LAB_TESTS))):
+            value = rng.uniform(low * 0.8, high * 1.2)
+            flag = 'H' if value > high else 'L' if value < low else ''
+            lines.append(f'| {name} | {value:.1f} | {unit} | {low}-{high} | {flag} |')
+        lines += ['', '## Notes', '']
+        target = int(rng.uniform(0.5, 1.5) * self.args.record_kb * 1024)
+        notes = self.text(rng, max(target - sum(len(line) + 1 for line in lines), 100))
+        return '\n'.join(lines) + '\n' + notes.replace('. ', '.\n')
+
+    def medical_records(self):
+        rng = self.rng('records')
+        for user_id in self.user_ids:
+            for _ in range(self.count(rng, self.args.records_per_patient)):
+                record_type, title = rng.choice(RECORD_TYPES)
+                age = rng.randint(0, 5 * 365 * 86400)
+                date = self.ts(age)[:10]
+                yield (self.ident(rng, 22), user_id, title, record_type, date, self.record_content(rng, title, date),
+                       f'{record_type}_{date}.pdf' if rng.random() < 0.5 else None, self.ts(age))
+
+    def appointments(self):
+        rng = self.rng('appointments')
+        for user_id in self.user_ids:
+            for _ in range(self.count(rng, self.args.appointments_per_patient)):
+                offset = rng.randint(-2 * 365 * 86400, 120 * 86400)
+                when = self.ts(-offset)
+                status = 'scheduled' if offset > 0 else rng.choice(['completed', 'completed', 'cancelled', 'no-show'])
+                notes = self.text(rng, rng.randint(60, 400)) if status == 'completed' else None
+                yield (self.ident(rng, 22), user_id, rng.choice(DOCTORS), when[:10], when[11:16], when,
+                       rng.choice(['routine', 'follow-up', 'specialist', 'lab_work']), 'Main Clinic', notes, status,
+                       self.ts(max(-offset, 0) + 86400), self.ts(max(-offset, 0)))
+
+    def chat_messages(self, conversations):
+        """Yield message rows, appending each conversation's row to `conversations` once its timeline is known."""
+        rng = self.rng('conversations')
+        for user_id in self.user_ids:
+            for _ in range(self.count(rng, self.args.conversations_per_patient)):
+                conversation_id = self.ident(rng, 16)
+                start = rng.randint(3600, 365 * 86400)
+                question = rng.choice(QUESTIONS)
+                last, last_visible, visible = start, None, 0
+                for j in range(self.count(rng, self.args.messages_per_conversation)):
+                    last = max(0, last - rng.randint(5, 120))
+                    text = question if j == 0 else self.text(rng, rng.randint(30, 700))
+                    deleted = int(rng.random() < self.args.deleted_message_rate)
+                    if not deleted: last_visible, visible = last, visible + 1
+                    yield (self.ident(rng, 16), conversation_id, 'patient' if j % 2 == 0 else 'assistant', text,
+                           self.ts(last), deleted)
+                conversations.append((conversation_id, user_id, question[:50], self.ts(start), self.ts(last),
+                                      int(rng.random() < self.args.deleted_conversation_rate),
+                                      self.ts(last_visible) if last_visible is not None else None, visible))
+
+
+def open_db(path):
+    conn = sqlite3.connect(path)
+    # NOTE: bulk-load settings; a crash mid-load leaves a database that should simply be regenerated
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA journal_mode = MEMORY")
+    conn.execute("PRAGMA cache_size = -262144")
+    return conn
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Deterministic synthetic data for auth.db and aioffice.db')
+    parser.add_argument('--out', type=Path, default=PROJECT_ROOT / 'tmp' / 'synthetic', help='output data/ directory')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--now', default=datetime.date.today().isoformat() + ' 00:00:00',
+                        help='reference time for all timestamps (fix it for byte-identical output)')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--sessions-per-user', type=int, default=2, help='mean; actual counts vary 0..2x')
+    parser.add_argument('--expired-session-rate', type=float, default=0.3)
+    parser.add_argument('--verification-codes', type=int, default=5000)
+    parser.add_argument('--records-per-patient', type=int, default=10)
+    parser.add_argument('--record-kb', type=float, default=3.0, help='mean markdown record size in KB')
+    parser.add_argument('--appointments-per-patient', type=int, default=6)
+    parser.add_argument('--conversations-per-patient', type=int, default=5)
+    parser.add_argument('--messages-per-conversation', type=int, default=20)
+    parser.add_argument('--deleted-conversation-rate', type=float, default=0.05)
+    parser.add_argument('--deleted-message-rate', type=float, default=0.03)
+    parser.add_argument('--batch-size', type=int, default=20000)
+    parser.add_argument('--force', action='store_true', help='overwrite existing databases in --out')
+    args = parser.parse_args()
+
+    args.out.mkdir(parents=True, exist_ok=True)
+    for name in ['auth.db', 'aioffice.db']:
+        if (args.out / name).exists():
+            if not args.force: parser.error(f"{args.out / name} exists; use --force to overwrite")
+            (args.out / name).unlink()
+
+    gen = Generator(args)
+    started = time.time()
+    print(f"Generating into {args.out} (seed {args.seed}, now {args.now})")
+    migrate_data_dir(args.out, log=lambda *args, **kwargs: None)
+    auth = open_db(args.out / 'auth.db')
+    bulk_insert(auth, 'users', ['id', 'email', 'created_at', 'last_login'], gen.users(), args.batch_size)
+    bulk_insert(auth, 'sessions', ['id', 'user_id', 'token', 'device_info', 'created_at', 'last_activity', 'expires_at'],
+                gen.sessions(), args.batch_size)
+    bulk_insert(auth, 'verification_codes', ['id', 'email', 'code', 'created_at', 'expires_at', 'used'],
+                gen.verification_codes(), args.batch_size)
+    auth.close()
+
+    app = open_db(args.out / 'aioffice.db')
+    bulk_insert(app, 'patients', ['user_id', 'full_name', 'created_at', 'updated_at'], gen.patients(), args.batch_size)
+    bulk_insert(app, 'medical_records', ['record_id', 'user_id', 'record_title', 'record_type', 'record_date', 'content',
+                                         'source_filename', 'created_at'], gen.medical_records(), args.batch_size)
+    bulk_insert(app, 'appointments', ['appointment_id', 'user_id', 'doctor_name', 'appointment_date', 'appointment_time',
+                                      'appointment_datetime_utc', 'appointment_type', 'location', 'notes', 'status',
+                                      'created_at', 'updated_at'], gen.appointments(), args.batch_size)
+    conversations = []
+    bulk_insert(app, 'chat_messages', ['message_id', 'conversation_id', 'role', 'message', 'timestamp', 'deleted'],
+                gen.chat_messages(conversations), args.batch_size)
+    bulk_insert(app, 'conversations', ['conversation_id', 'user_id', 'title', 'created_at', 'updated_at', 'deleted_flag',
+                                       'last_message_at', 'message_count'], iter(conversations), args.batch_size)
+    app.close()
+    print(f"Done in {time.time() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
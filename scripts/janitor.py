@@ -0,0 +1,147 @@
+#!/home/ace/bin/uvrun
+# /// script
+# requires-python = ">=3.8"
+# dependencies = []
+# ///
+"""
+Purges dead rows from auth.db: expired sessions, and verification codes that were
+used or have expired. login.php only ever inserts into these tables.
+
+Rows are deleted in small BEGIN IMMEDIATE batches walking the rowid order, so each
+write lock is held for milliseconds and logins keep going while the janitor runs.
+Afterwards it can return the freed pages to the filesystem (--vacuum, needs
+auto_vacuum=INCREMENTAL, which --enable-incremental-vacuum sets once) and refresh
+planner statistics (--analyze). Safe to run from cron on a live server.
+
+Usage:
+    ./scripts/janitor.py                         # purge data/auth.db
+    ./scripts/janitor.py --dry-run               # only count what would be removed
+    ./scripts/janitor.py --vacuum --analyze --data-dir tmp/synthetic
+"""
+
+import argparse
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+from migrate import default_data_dir
+
+# (table, condition) - rows matching the condition are dead
+PURGES = [
+    ('sessions', "expires_at <= datetime('now')"),
+    ('verification_codes', "used = 1 OR expires_at <= datetime('now')"),
+]
+
+
+def connect(path):
+    # NOTE: autocommit mode; every batch opens its own short BEGIN IMMEDIATE transaction
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute('PRAGMA busy_timeout = 5000')
+    return conn
+
+
+def purge(conn, table, condition, batch_rows, pause, dry_run=False):
+    """Delete matching rows batch by batch; returns counts and the longest lock held."""
+    stats = {'table': table, 'deleted': 0, 'batches': 0, 'longest_lock_ms': 0.0}
+    select = f"SELECT rowid FROM {table} WHERE rowid > ? AND ({condition}) ORDER BY rowid LIMIT ?"
+    last_rowid = -1
+    while True:
+        if dry_run:
+            rowids = [r for (r,) in conn.execute(select, [last_rowid, batch_rows])]
+        else:
+            started = time.perf_counter()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                rowids = [r for (r,) in conn.execute(select, [last_rowid, batch_rows])]
+                if rowids:
+                    conn.execute(f"DELETE FROM {table} WHERE rowid IN ({','.join('?' * len(rowids))})", rowids)
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            stats['longest_lock_ms'] = max(stats['longest_lock_ms'], (time.perf_counter() - started) * 1000)
+        if not rowids: break
+        last_rowid = rowids[-1]
+        stats['deleted'] += len(rowids)
+        stats['batches'] += 1
+        print(f"\r  {table}: {stats['deleted']:,} rows", end='', flush=True)
+        # NOTE: the pause between batches is what lets waiting logins take the write lock
+        if not dry_run: time.sleep(pause)
+    done = 'to delete' if dry_run else f"deleted in {stats['batches']} batches"
+    print(f"\r  {table}: {stats['deleted']:,} rows {done}          ")
+    return stats
+
+
+def incremental_vacuum(conn, pages_per_step, pause):
+    """Release free pages to the filesystem a few at a time; returns pages released."""
+    released = 0
+    while True:
+        free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        if free == 0: return released
+        step = min(free, pages_per_step)
+        conn.execute(f'PRAGMA incremental_vacuum({step})').fetchall()
+        released += step
+        time.sleep(pause)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Purge expired sessions and verification codes from auth.db')
+    parser.add_argument('--data-dir', type=Path, default=default_data_dir())
+    parser.add_argument('--batch-rows', type=int, default=500, help='rows deleted per transaction')
+    parser.add_argument('--pause-ms', type=float, default=10.0, help='sleep between batches')
+    parser.add_argument('--dry-run', action='store_true', help='count rows that would be deleted, change nothing')
+    parser.add_argument('--vacuum', action='store_true', help='run PRAGMA incremental_vacuum afterwards')
+    parser.add_argument('--analyze', action='store_true', help='run ANALYZE afterwards')
+    parser.add_argument('--enable-incremental-vacuum', action='store_true',
+                        help='switch auth.db to auto_vacuum=INCREMENTAL (one full VACUUM, locks the database)')
+    args = parser.parse_args()
+
+    db_path = args.data_dir / 'auth.db'
+    if not db_path.exists():
+        print(f"❌ {db_path} not found")
+        return 1
+
+    conn = connect(db_path)
+    size_before = db_path.stat().st_size
+    pause = args.pause_ms / 1000
+    print(f"{'Counting' if args.dry_run else 'Purging'} dead rows in {db_path}")
+    results = [purge(conn, table, condition, args.batch_rows, pause, args.dry_run) for table, condition in PURGES]
+    if args.dry_run:
+        conn.close()
+        return 0
+
+    if args.enable_incremental_vacuum:
+        started = time.perf_counter()
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+        print(f"  auto_vacuum=INCREMENTAL, full VACUUM took {time.perf_counter() - started:.2f}s")
+    if args.vacuum:
+        # NOTE: 0 = NONE, 1 = FULL, 2 = INCREMENTAL; without INCREMENTAL freed pages are only reused, never released
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+            page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+            released = incremental_vacuum(conn, 256, pause)
+            print(f"  incremental_vacuum released {released:,} pages ({released * page_size / 1048576:.1f} MB)")
+        else:
+            print("  ⚠️  auto_vacuum is not INCREMENTAL; freed pages stay in the file for reuse "
+                  "(run once with --enable-incremental-vacuum)")
+    if args.analyze:
+        started = time.perf_counter()
+        conn.execute('ANALYZE')
+        print(f"  ANALYZE took {time.perf_counter() - started:.2f}s")
+    if args.vacuum or args.enable_incremental_vacuum:
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    conn.close()
+
+    size_after = db_path.stat().st_size
+    print("\n" + "=" * 60)
+    for r in results:
+        print(f"{r['table']:<20} {r['deleted']:>10,} deleted  {r['batches']:>6} batches  "
+              f"longest lock {r['longest_lock_ms']:.1f}ms")
+    print(f"auth.db: {size_before / 1048576:.1f} MB -> {size_after / 1048576:.1f} MB")
+    print(f"✅ Removed {sum(r['deleted'] for r in results):,} rows")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
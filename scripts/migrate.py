@@ -0,0 +1,368 @@
+#!/home/ace/bin/uvrun
+# /// script
+# requires-python = ">=3.8"
+# dependencies = []
+# ///
+"""
+Versioned, resumable schema migrations for auth.db, aioffice.db and archive.db.
+
+Migrations live in scripts/migrations/<db>/NNNN_name.sql or .py, where <db> is
+`auth` (auth.db), `app` (aioffice.db) or `archive` (archive.db). Each database
+records what has run in a `schema_version` table, so every migration runs exactly
+once and in order.
+
+- .sql migrations run in a single BEGIN IMMEDIATE transaction together with their
+  schema_version row; keep them to DDL and small updates.
+- .py migrations define `migrate(ctx)` and use the Context helpers. Large tables
+  are rebuilt with ctx.rebuild_table(), which copies rowid ranges in short
+  transactions (triggers keep the copy in sync with concurrent writes) and stores
+  its progress, so an interrupted run resumes where it stopped.
+
+Usage:
+    ./scripts/migrate.py                      # apply pending migrations to data/
+    ./scripts/migrate.py --status             # list applied and pending migrations
+    ./scripts/migrate.py --dry-run            # time pending migrations against a copy
+    ./scripts/migrate.py --data-dir tmp/synthetic --chunk-rows 20000
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+MIGRATIONS_DIR = Path(__file__).parent / 'migrations'
+DATABASES = {'auth': 'auth.db', 'app': 'aioffice.db', 'archive': 'archive.db'}
+MIGRATION_FILE = re.compile(r'^(\d{4})_(\w+)\.(sql|py)$')
+
+VERSION_TABLE = """
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        duration_ms INTEGER
+    );
+    CREATE TABLE IF NOT EXISTS schema_migration_progress (
+        table_name TEXT PRIMARY KEY,
+        last_rowid INTEGER NOT NULL
+    );
+"""
+
+
+def default_data_dir():
+    """Same lookup as getDataDir() in lib.php."""
+    return Path(os.environ.get('AIOFC_DATA_DIR') or PROJECT_ROOT / 'data')
+
+
+def discover(db_key, migrations_dir=MIGRATIONS_DIR):
+    """Migration files for one database as (version, name, path), in version order."""
+    found = []
+    for path in sorted((migrations_dir / db_key).iterdir()):
+        match = MIGRATION_FILE.match(path.name)
+        if match: found.append((int(match.group(1)), match.group(2), path))
+    versions = [v for v, _, _ in found]
+    if len(versions) != len(set(versions)): raise ValueError(f"Duplicate migration version in {migrations_dir / db_key}")
+    return found
+
+
+def connect(path):
+    # NOTE: autocommit mode; migrations open their own BEGIN IMMEDIATE transactions
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute('PRAGMA busy_timeout = 5000')
+    conn.executescript(VERSION_TABLE)
+    return conn
+
+
+def applied_versions(conn):
+    return {row[0]: row[1] for row in conn.execute('SELECT version, name FROM schema_version')}
+
+
+class Context:
+    """Connection plus helpers handed to .py migrations; tracks the longest write transaction."""
+
+    def __init__(self, conn, chunk_rows=5000, log=print):
+        self.conn = conn
+        self.chunk_rows = chunk_rows
+        self.log = log
+        self.longest_lock = 0.0
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Short BEGIN IMMEDIATE ... COMMIT, rolled back on error."""
+        self.conn.execute('BEGIN IMMEDIATE')
+        started = time.perf_counter()
+        try:
+            yield self.conn
+            self.conn.execute('COMMIT')
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+        finally:
+            self.longest_lock = max(self.longest_lock, time.perf_counter() - started)
+
+    def columns(self, table):
+        return [row[1] for row in self.conn.execute(f'PRAGMA table_info({table})')]
+
+    def table_exists(self, table):
+        return self.conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", [table]).fetchone() is not None
+
+    def add_column(self, table, column, declaration):
+        """ALTER TABLE ADD COLUMN unless the column is already there."""
+        if column in self.columns(table): return False
+        with self.transaction():
+            self.conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {declaration}')
+        return True
+
+    def update_chunked(self, table, assignments):
+        """UPDATE table SET <assignments> over rowid ranges, chunk_rows per transaction; returns rows updated.
+
+        For backfills of new columns; the assignments must be idempotent, since an
+        interrupted run starts over from the first row.
+        """
+        total = self.conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+        updated, last = 0, -1
+        while True:
+            with self.transaction():
+                high = self.conn.execute(f'SELECT MAX(rowid) FROM (SELECT rowid FROM {table} WHERE rowid > ? '
+                                         f'ORDER BY rowid LIMIT ?)', [last, self.chunk_rows]).fetchone()[0]
+                if high is None: break
+                updated += self.conn.execute(f'UPDATE {table} SET {assignments} WHERE rowid > ? AND rowid <= ?',
+                                             [last, high]).rowcount
+            last = high
+            self.log(f"    {table}: {updated:,}/{total:,} rows updated", end='\r')
+        self.log(f"    {table}: {updated:,} rows updated{' ' * 12}")
+        return updated
+
+    def fill_chunked(self, key, table, insert_sql):
+        """Run insert_sql with (low, high] rowid bounds of `table`, chunk_rows per transaction; returns rows inserted.
+
+        Progress is stored under `key` in schema_migration_progress, which the caller
+        creates (last_rowid 0) together with the triggers that keep the target in sync:
+        those triggers only act on rows with rowid <= last_rowid, the ones already
+        filled. The progress row is deleted with the last chunk, after which the
+        triggers cover every row. An interrupted run resumes where it stopped.
+        """
+        row = self.conn.execute('SELECT last_rowid FROM schema_migration_progress WHERE table_name = ?', [key]).fetchone()
+        if row is None: return 0
+        last, inserted = row[0], 0
+        total = self.conn.execute(f'SELECT COUNT(*) FROM {table} WHERE rowid > ?', [last]).fetchone()[0]
+        if last: self.log(f"    {key}: resuming after rowid {last:,}")
+        while True:
+            with self.transaction():
+                high = self.conn.execute(f'SELECT MAX(rowid) FROM (SELECT rowid FROM {table} WHERE rowid > ? '
+                                         f'ORDER BY rowid LIMIT ?)', [last, self.chunk_rows]).fetchone()[0]
+                if high is None:
+                    self.conn.execute('DELETE FROM schema_migration_progress WHERE table_name = ?', [key])
+                    break
+                inserted += self.conn.execute(insert_sql, [last, high]).rowcount
+                self.conn.execute('UPDATE schema_migration_progress SET last_rowid = ? WHERE table_name = ?', [high, key])
+            last = high
+            self.log(f"    {key}: {inserted:,} rows from {total:,} in {table}", end='\r')
+        self.log(f"    {key}: {inserted:,} rows filled{' ' * 24}")
+        return inserted
+
+    def rebuild_table(self, table, create_sql, columns, select_exprs=None, indexes=None):
+        """Copy `table` into a new table built by create_sql ('CREATE TABLE {name} (...)') and swap it in.
+
+        Rows are copied in rowid order, chunk_rows per transaction, so the write lock is
+        only held briefly. Triggers mirror writes made to the old table during the copy.
+        select_exprs maps each new column to an expression over the old table (default: same name);
+        indexes are the CREATE INDEX statements to run after the swap (default: the old table's).
+        The old table's own triggers (search index, context versions, ...) are recreated on the new one.
+        """
+        new = f'{table}__rebuild'
+        exprs = ', '.join(select_exprs or columns)
+        target = f"{new} (rowid, {', '.join(columns)})"
+        copy_row = f"INSERT OR REPLACE INTO {target} SELECT rowid, {exprs} FROM {table} WHERE rowid = NEW.rowid;"
+        if indexes is None:
+            indexes = [row[0] for row in self.conn.execute(
+                "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", [table])]
+
+        if not self.table_exists(new):
+            with self.transaction():
+                self.conn.execute(create_sql.format(name=new))
+                # NOTE: one execute() per statement; executescript() would commit the open transaction
+                self.conn.execute(f"CREATE TRIGGER {new}_insert AFTER INSERT ON {table} BEGIN {copy_row} END")
+                self.conn.execute(f"CREATE TRIGGER {new}_update AFTER UPDATE ON {table} BEGIN "
+                                  f"DELETE FROM {new} WHERE rowid = OLD.rowid; {copy_row} END")
+                self.conn.execute(f"CREATE TRIGGER {new}_delete AFTER DELETE ON {table} BEGIN "
+                                  f"DELETE FROM {new} WHERE rowid = OLD.rowid; END")
+                self.conn.execute('INSERT OR REPLACE INTO schema_migration_progress VALUES (?, 0)', [table])
+
+        last = self.conn.execute('SELECT last_rowid FROM schema_migration_progress WHERE table_name = ?',
+                                 [table]).fetchone()[0]
+        copied = self.conn.execute(f'SELECT COUNT(*) FROM {table} WHERE rowid <= ?', [last]).fetchone()[0]
+        total = self.conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+        if last: self.log(f"    {table}: resuming after {copied:,} rows")
+        while True:
+            with self.transaction():
+                high = self.conn.execute(f'SELECT MAX(rowid) FROM (SELECT rowid FROM {table} WHERE rowid > ? '
+                                         f'ORDER BY rowid LIMIT ?)', [last, self.chunk_rows]).fetchone()[0]
+                if high is None: break
+                copied += self.conn.execute(f'INSERT OR REPLACE INTO {target} SELECT rowid, {exprs} FROM {table} '
+                                            f'WHERE rowid > ? AND rowid <= ?', [last, high]).rowcount
+                self.conn.execute('UPDATE schema_migration_progress SET last_rowid = ? WHERE table_name = ?', [high, table])
+            last = high
+            self.log(f"    {table}: {copied:,}/{total:,} rows copied", end='\r')
+        self.log(f"    {table}: {copied:,} rows copied{' ' * 12}")
+
+        # NOTE: the old table is renamed aside rather than dropped in the swap; dropping a large table
+        # frees every page inside the lock. legacy_alter_table keeps other tables' REFERENCES untouched.
+        retired = f'{table}__retired'
+        old_indexes = [row[0] for row in self.conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", [table])]
+        self.conn.execute('PRAGMA legacy_alter_table = ON')
+        try:
+            with self.transaction():
+                for suffix in ['insert', 'update', 'delete']: self.conn.execute(f'DROP TRIGGER {new}_{suffix}')
+                # NOTE: read inside the swap, so a trigger added while the copy ran is kept too;
+                # left on the old table they would be renamed aside and dropped with it
+                old_triggers = self.conn.execute(
+                    "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = ?", [table]).fetchall()
+                for name, _ in old_triggers: self.conn.execute(f'DROP TRIGGER {name}')
+                for name in old_indexes: self.conn.execute(f'DROP INDEX {name}')
+                self.conn.execute(f'ALTER TABLE {table} RENAME TO {retired}')
+                self.conn.execute(f'ALTER TABLE {new} RENAME TO {table}')
+                for sql in indexes: self.conn.execute(sql)
+                for _, sql in old_triggers: self.conn.execute(sql)
+                self.conn.execute('DELETE FROM schema_migration_progress WHERE table_name = ?', [table])
+        finally:
+            self.conn.execute('PRAGMA legacy_alter_table = OFF')
+        self.drop_table_chunked(retired)
+
+    def drop_table_chunked(self, table):
+        """Empty a table chunk_rows at a time, then drop it, so no single transaction frees the whole table."""
+        while True:
+            with self.transaction():
+                deleted = self.conn.execute(f'DELETE FROM {table} WHERE rowid IN '
+                                            f'(SELECT rowid FROM {table} LIMIT ?)', [self.chunk_rows]).rowcount
+            if not deleted: break
+        with self.transaction():
+            self.conn.execute(f'DROP TABLE {table}')
+
+
+def run_sql_migration(ctx, version, name, path):
+    """Run a .sql file and record it in one transaction (executescript cannot bind parameters)."""
+    script = path.read_text()
+    started = time.perf_counter()
+    try:
+        ctx.conn.executescript(f"BEGIN IMMEDIATE;\n{script}\n;"
+                               f"INSERT INTO schema_version (version, name) VALUES ({version}, '{name}');\nCOMMIT;")
+    except sqlite3.Error:
+        if ctx.conn.in_transaction: ctx.conn.execute('ROLLBACK')
+        raise
+    finally:
+        ctx.longest_lock = max(ctx.longest_lock, time.perf_counter() - started)
+
+
+def run_py_migration(ctx, version, name, path):
+    spec = importlib.util.spec_from_file_location(f'migration_{path.parent.name}_{version}', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.migrate(ctx)
+    with ctx.transaction():
+        ctx.conn.execute('INSERT INTO schema_version (version, name) VALUES (?, ?)', [version, name])
+
+
+def migrate_database(path, db_key, chunk_rows=5000, log=print, migrations_dir=MIGRATIONS_DIR):
+    """Apply pending migrations to one database file; returns [(version, name, seconds, longest_lock)]."""
+    conn = connect(path)
+    done = applied_versions(conn)
+    report = []
+    try:
+        # NOTE: finish dropping tables a previous, interrupted rebuild_table() had already swapped out
+        for (table,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB '*__retired'").fetchall():
+            Context(conn, chunk_rows, log).drop_table_chunked(table)
+        for version, name, file in discover(db_key, migrations_dir):
+            if version in done: continue
+            log(f"  {db_key} {version:04d}_{name}")
+            ctx = Context(conn, chunk_rows, log)
+            started = time.perf_counter()
+            (run_sql_migration if file.suffix == '.sql' else run_py_migration)(ctx, version, name, file)
+            elapsed = time.perf_counter() - started
+            conn.execute('UPDATE schema_version SET duration_ms = ? WHERE version = ?', [round(elapsed * 1000), version])
+            report.append((version, name, elapsed, ctx.longest_lock))
+    finally:
+        conn.close()
+    return report
+
+
+def migrate_data_dir(data_dir, chunk_rows=5000, log=print, databases=DATABASES):
+    """Apply pending migrations to every database in a data/ directory."""
+    Path(data_dir).mkdir(parents=True, exist_ok=True)
+    return {db_key: migrate_database(Path(data_dir) / filename, db_key, chunk_rows, log)
+            for db_key, filename in databases.items()}
+
+
+def copy_data_dir(data_dir, copy_dir, databases=DATABASES):
+    """Consistent copies of the databases via the SQLite backup API (safe while PHP is writing)."""
+    for filename in databases.values():
+        if not (data_dir / filename).exists(): continue
+        src = sqlite3.connect(data_dir / filename)
+        dst = sqlite3.connect(copy_dir / filename)
+        src.backup(dst)
+        dst.close()
+        src.close()
+
+
+def print_status(data_dir):
+    for db_key, filename in DATABASES.items():
+        path = data_dir / filename
+        done = {}
+        if path.exists():
+            conn = sqlite3.connect(path)
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'schema_version'").fetchone():
+                done = applied_versions(conn)
+            conn.close()
+        print(f"{filename}:")
+        for version, name, _ in discover(db_key):
+            print(f"  {'applied' if version in done else 'pending'}  {version:04d}_{name}")
+
+
+def print_report(results):
+    print(f"\n{'Migration':<40} {'Time':>10} {'Longest lock':>14}")
+    print("-" * 66)
+    for db_key, report in results.items():
+        for version, name, elapsed, lock in report:
+            print(f"{db_key + ' ' + f'{version:04d}_{name}':<40} {elapsed:>9.2f}s {lock:>13.3f}s")
+    if not any(results.values()): print("Nothing to migrate")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Apply versioned schema migrations to auth.db, aioffice.db and archive.db')
+    parser.add_argument('--data-dir', type=Path, default=default_data_dir(), help='default: $AIOFC_DATA_DIR or data/')
+    parser.add_argument('--status', action='store_true', help='list applied and pending migrations')
+    parser.add_argument('--dry-run', action='store_true', help='apply to a throwaway copy and report timings')
+    parser.add_argument('--chunk-rows', type=int, default=5000, help='rows per transaction when rebuilding tables')
+    args = parser.parse_args()
+
+    if args.status:
+        print_status(args.data_dir)
+        return 0
+
+    if not args.dry_run:
+        print(f"Migrating {args.data_dir}")
+        print_report(migrate_data_dir(args.data_dir, args.chunk_rows))
+        return 0
+
+    (PROJECT_ROOT / 'tmp').mkdir(exist_ok=True)
+    copy_dir = Path(tempfile.mkdtemp(prefix='migrate_dry_run_', dir=PROJECT_ROOT / 'tmp'))
+    try:
+        started = time.perf_counter()
+        copy_data_dir(args.data_dir, copy_dir)
+        print(f"Copied {args.data_dir} in {time.perf_counter() - started:.2f}s; dry run against {copy_dir}")
+        print_report(migrate_data_dir(copy_dir, args.chunk_rows))
+    finally:
+        shutil.rmtree(copy_dir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,58 @@
+-- Application database as documented in SCHEMA.md.
+-- IF NOT EXISTS lets this adopt databases created before migrations were tracked;
+-- columns those databases may lack are added by later migrations.
+
+CREATE TABLE IF NOT EXISTS patients (
+    user_id TEXT PRIMARY KEY,
+    full_name TEXT NOT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS medical_records (
+    record_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    record_title TEXT,
+    record_type TEXT,
+    record_date DATE,
+    content TEXT NOT NULL,
+    source_filename TEXT,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES patients(user_id)
+);
+
+CREATE TABLE IF NOT EXISTS conversations (
+    conversation_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    deleted_flag INTEGER DEFAULT 0,
+    FOREIGN KEY (user_id) REFERENCES patients(user_id)
+);
+
+CREATE TABLE IF NOT EXISTS chat_messages (
+    message_id TEXT PRIMARY KEY,
+    conversation_id TEXT NOT NULL,
+    role TEXT CHECK(role IN ('patient', 'assistant')),
+    message TEXT NOT NULL,
+    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+    deleted INTEGER DEFAULT 0,
+    FOREIGN KEY (conversation_id) REFERENCES conversations(conversation_id)
+);
+
+CREATE TABLE IF NOT EXISTS appointments (
+    appointment_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    doctor_name TEXT NOT NULL,
+    appointment_date DATE NOT NULL,
+    appointment_time TIME,
+    appointment_datetime_utc DATETIME,
+    appointment_type TEXT,
+    location TEXT,
+    notes TEXT,
+    status TEXT DEFAULT 'scheduled',
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES patients(user_id)
+);
@@ -0,0 +1,89 @@
+"""
+Port of the old one-shot scripts/migrate_schema.py: renames the generic `id`/`name`
+columns of pre-conversation databases to record_id/appointment_id/full_name and moves
+each user's chat_messages into a 'Previous Conversation'. Tables that already use the
+new column names are left alone, so this is a no-op on current databases.
+"""
+
+PATIENTS = """
+    CREATE TABLE {name} (
+        user_id TEXT PRIMARY KEY,
+        full_name TEXT NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+MEDICAL_RECORDS = """
+    CREATE TABLE {name} (
+        record_id TEXT PRIMARY KEY,
+        user_id TEXT NOT NULL,
+        record_title TEXT,
+        record_type TEXT,
+        record_date DATE,
+        content TEXT NOT NULL,
+        source_filename TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES patients(user_id)
+    )
+"""
+
+APPOINTMENTS = """
+    CREATE TABLE {name} (
+        appointment_id TEXT PRIMARY KEY,
+        user_id TEXT NOT NULL,
+        doctor_name TEXT NOT NULL,
+        appointment_date DATE NOT NULL,
+        appointment_time TIME,
+        appointment_datetime_utc DATETIME,
+        appointment_type TEXT,
+        location TEXT,
+        notes TEXT,
+        status TEXT DEFAULT 'scheduled',
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES patients(user_id)
+    )
+"""
+
+CHAT_MESSAGES = """
+    CREATE TABLE {name} (
+        message_id TEXT PRIMARY KEY,
+        conversation_id TEXT NOT NULL,
+        role TEXT CHECK(role IN ('patient', 'assistant')),
+        message TEXT NOT NULL,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        deleted INTEGER DEFAULT 0,
+        FOREIGN KEY (conversation_id) REFERENCES conversations(conversation_id)
+    )
+"""
+
+APPOINTMENT_COLUMNS = ['user_id', 'doctor_name', 'appointment_date', 'appointment_time', 'appointment_datetime_utc',
+                       'appointment_type', 'location', 'notes', 'status', 'created_at', 'updated_at']
+RECORD_COLUMNS = ['user_id', 'record_title', 'record_type', 'record_date', 'content', 'source_filename', 'created_at']
+
+
+def migrate(ctx):
+    if 'name' in ctx.columns('patients'):
+        ctx.rebuild_table('patients', PATIENTS, ['user_id', 'full_name', 'created_at', 'updated_at'],
+                          ['user_id', 'name', 'created_at', 'updated_at'])
+
+    if 'id' in ctx.columns('medical_records'):
+        ctx.rebuild_table('medical_records', MEDICAL_RECORDS, ['record_id'] + RECORD_COLUMNS, ['id'] + RECORD_COLUMNS)
+
+    if 'id' in ctx.columns('appointments'):
+        ctx.rebuild_table('appointments', APPOINTMENTS, ['appointment_id'] + APPOINTMENT_COLUMNS,
+                          ['id'] + APPOINTMENT_COLUMNS)
+
+    if 'user_id' in ctx.columns('chat_messages'):
+        # NOTE: deterministic ids so an interrupted run re-creates the same conversations
+        with ctx.transaction() as conn:
+            conn.execute("""
+                INSERT OR IGNORE INTO conversations (conversation_id, user_id, title, created_at, updated_at)
+                SELECT 'legacy-' || user_id, user_id, 'Previous Conversation', MIN(timestamp), MAX(timestamp)
+                FROM chat_messages
+                GROUP BY user_id
+            """)
+        ctx.rebuild_table('chat_messages', CHAT_MESSAGES,
+                          ['message_id', 'conversation_id', 'role', 'message', 'timestamp', 'deleted'],
+                          ['id', "'legacy-' || user_id", 'role', 'message', 'timestamp', '0'], indexes=[])
@@ -0,0 +1,9 @@
+"""
+Soft-delete columns for databases created before they existed. Replaces the
+ALTER TABLE that api_delete_message.php used to run on every request.
+"""
+
+
+def migrate(ctx):
+    ctx.add_column('conversations', 'deleted_flag', 'INTEGER DEFAULT 0')
+    ctx.add_column('chat_messages', 'deleted', 'INTEGER DEFAULT 0')
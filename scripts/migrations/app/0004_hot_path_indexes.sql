@@ -0,0 +1,19 @@
+-- Secondary indexes for the per-request queries flagged by scripts/audit_query_plans.py.
+
+-- Chat history of one conversation in time order (api_chat.php, api_get_conversation.php)
+-- and the per-conversation MAX(timestamp) in the pg_chat sidebar
+CREATE INDEX IF NOT EXISTS idx_chat_messages_conversation_time
+    ON chat_messages (conversation_id, timestamp);
+
+-- A patient's conversations, most recently updated first (dashboard, sidebar)
+CREATE INDEX IF NOT EXISTS idx_conversations_user_updated
+    ON conversations (user_id, updated_at);
+
+-- Covering index for the pg_records list and the dashboard record count: answered without
+-- reading the rows, whose multi-KB content would otherwise pull in overflow pages
+CREATE INDEX IF NOT EXISTS idx_medical_records_user_date
+    ON medical_records (user_id, record_date, created_at, record_id, record_title, record_type, source_filename);
+
+-- A patient's appointments, latest first (dashboard next appointment, chat context)
+CREATE INDEX IF NOT EXISTS idx_appointments_user_time
+    ON appointments (user_id, appointment_datetime_utc, appointment_date);
@@ -0,0 +1,131 @@
+"""
+FTS5 full-text indexes over chat messages and medical records for pg_main/api_search.php.
+
+Both are external-content tables reading from a view, so the text is not stored a
+second time; the index itself is kept in sync by triggers. The views only contain
+what a patient may find: messages that are not soft-deleted, in conversations that
+are not soft-deleted. Each row carries an `owner` column (hex of the user_id, which
+the case-folding tokenizer cannot confuse with another user's id) so a search
+matches one patient's rows instead of every patient's and filtering afterwards.
+
+Existing rows are indexed by ctx.fill_chunked() in short transactions; until it
+finishes, the triggers only maintain rows it has already reached. The same fill
+is what `scripts/search_index.py --rebuild` runs.
+"""
+
+# Triggers leave rows above the fill's progress to the fill itself
+FILLED = "{rowid} <= COALESCE((SELECT last_rowid FROM schema_migration_progress WHERE table_name = '{fts}'), 9223372036854775807)"
+
+MESSAGE_VISIBLE = "({m}.deleted = 0 OR {m}.deleted IS NULL)"
+CONVERSATION_VISIBLE = "({c}.deleted_flag = 0 OR {c}.deleted_flag IS NULL)"
+
+SCHEMA = [
+    f"""CREATE VIEW IF NOT EXISTS chat_messages_search_source AS
+        SELECT m.rowid AS message_rowid, m.message AS message, hex(c.user_id) AS owner
+        FROM chat_messages m JOIN conversations c ON c.conversation_id = m.conversation_id
+        WHERE {MESSAGE_VISIBLE.format(m='m')} AND {CONVERSATION_VISIBLE.format(c='c')}""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS chat_messages_fts USING fts5(
+        message, owner,
+        content = 'chat_messages_search_source', content_rowid = 'message_rowid',
+        tokenize = 'unicode61 remove_diacritics 2')""",
+    # ORDER BY rank then sorts inside FTS5; the owner column never counts towards the score
+    "INSERT INTO chat_messages_fts (chat_messages_fts, rank) VALUES ('rank', 'bm25(1.0, 0.0)')",
+    """CREATE VIEW IF NOT EXISTS medical_records_search_source AS
+        SELECT rowid AS record_rowid, record_title, content, hex(user_id) AS owner
+        FROM medical_records""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS medical_records_fts USING fts5(
+        record_title, content, owner,
+        content = 'medical_records_search_source', content_rowid = 'record_rowid',
+        tokenize = 'unicode61 remove_diacritics 2')""",
+    # A match in the title counts five times one in the body
+    "INSERT INTO medical_records_fts (medical_records_fts, rank) VALUES ('rank', 'bm25(5.0, 1.0, 0.0)')",
+]
+
+# NOTE: a 'delete' must repeat exactly the values that were indexed, or the index is corrupted;
+# every trigger derives them the same way the views do.
+MESSAGE_ROW = """
+    INSERT INTO chat_messages_fts ({columns}) SELECT {values}, {row}.message, hex(c.user_id) FROM conversations c
+    WHERE c.conversation_id = {row}.conversation_id AND {visible} AND {conversation_visible};"""
+CONVERSATION_ROWS = """
+    INSERT INTO chat_messages_fts ({columns}) SELECT {values}, m.message, hex({row}.user_id) FROM chat_messages m
+    WHERE m.conversation_id = {row}.conversation_id AND {visible} AND {filled}
+    AND {conversation_visible};"""
+RECORD_ROW = """
+    INSERT INTO medical_records_fts ({columns}) VALUES ({values}, {row}.record_title, {row}.content, hex({row}.user_id));"""
+
+
+def message_row(row, delete=False):
+    return MESSAGE_ROW.format(
+        columns="chat_messages_fts, rowid, message, owner" if delete else "rowid, message, owner",
+        values=f"'delete', {row}.rowid" if delete else f"{row}.rowid", row=row,
+        visible=MESSAGE_VISIBLE.format(m=row), conversation_visible=CONVERSATION_VISIBLE.format(c='c'))
+
+
+def conversation_rows(row, delete=False):
+    return CONVERSATION_ROWS.format(
+        columns="chat_messages_fts, rowid, message, owner" if delete else "rowid, message, owner",
+        values="'delete', m.rowid" if delete else "m.rowid", row=row,
+        visible=MESSAGE_VISIBLE.format(m='m'), conversation_visible=CONVERSATION_VISIBLE.format(c=row),
+        filled=FILLED.format(rowid='m.rowid', fts='chat_messages_fts'))
+
+
+def record_row(row, delete=False):
+    return RECORD_ROW.format(
+        columns="medical_records_fts, rowid, record_title, content, owner" if delete
+        else "rowid, record_title, content, owner",
+        values=f"'delete', {row}.rowid" if delete else f"{row}.rowid", row=row)
+
+
+def triggers():
+    message_filled = FILLED.format(rowid='{row}.rowid', fts='chat_messages_fts')
+    record_filled = FILLED.format(rowid='{row}.rowid', fts='medical_records_fts')
+    changed = (f"{CONVERSATION_VISIBLE.format(c='OLD')} IS NOT {CONVERSATION_VISIBLE.format(c='NEW')} "
+               "OR OLD.user_id IS NOT NEW.user_id OR OLD.conversation_id IS NOT NEW.conversation_id")
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS chat_messages_fts_insert AFTER INSERT ON chat_messages
+            WHEN {message_filled.format(row='NEW')} BEGIN {message_row('NEW')} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS chat_messages_fts_update AFTER UPDATE OF message, deleted, conversation_id
+            ON chat_messages WHEN {message_filled.format(row='OLD')}
+            BEGIN {message_row('OLD', delete=True)} {message_row('NEW')} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS chat_messages_fts_delete AFTER DELETE ON chat_messages
+            WHEN {message_filled.format(row='OLD')} BEGIN {message_row('OLD', delete=True)} END""",
+        # Messages are indexed under their conversation's owner, and only while it is not deleted
+        f"""CREATE TRIGGER IF NOT EXISTS conversations_fts_insert AFTER INSERT ON conversations
+            BEGIN {conversation_rows('NEW')} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS conversations_fts_update AFTER UPDATE OF deleted_flag, user_id, conversation_id
+            ON conversations WHEN {changed}
+            BEGIN {conversation_rows('OLD', delete=True)} {conversation_rows('NEW')} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS conversations_fts_delete AFTER DELETE ON conversations
+            BEGIN {conversation_rows('OLD', delete=True)} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS medical_records_fts_insert AFTER INSERT ON medical_records
+            WHEN {record_filled.format(row='NEW')} BEGIN {record_row('NEW')} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS medical_records_fts_update AFTER UPDATE OF record_title, content, user_id
+            ON medical_records WHEN {record_filled.format(row='OLD')}
+            BEGIN {record_row('OLD', delete=True)} {record_row('NEW')} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS medical_records_fts_delete AFTER DELETE ON medical_records
+            WHEN {record_filled.format(row='OLD')} BEGIN {record_row('OLD', delete=True)} END""",
+    ]
+
+
+# (fts table, source table, insert of one rowid range); keep in sync with scripts/search_index.py
+FILLS = [
+    ('chat_messages_fts', 'chat_messages',
+     """INSERT INTO chat_messages_fts (rowid, message, owner)
+        SELECT message_rowid, message, owner FROM chat_messages_search_source
+        WHERE message_rowid > ? AND message_rowid <= ?"""),
+    ('medical_records_fts', 'medical_records',
+     """INSERT INTO medical_records_fts (rowid, record_title, content, owner)
+        SELECT record_rowid, record_title, content, owner FROM medical_records_search_source
+        WHERE record_rowid > ? AND record_rowid <= ?"""),
+]
+
+
+def migrate(ctx):
+    if not ctx.table_exists('chat_messages_fts'):
+        with ctx.transaction() as conn:
+            # NOTE: one execute() per statement; executescript() would commit the open transaction
+            for sql in SCHEMA + triggers(): conn.execute(sql)
+            for fts, _, _ in FILLS:
+                conn.execute('INSERT OR REPLACE INTO schema_migration_progress VALUES (?, 0)', [fts])
+    for fts, table, insert_sql in FILLS:
+        ctx.fill_chunked(fts, table, insert_sql)
@@ -0,0 +1,22 @@
+"""
+When a conversation or message was soft-deleted, so scripts/archive.py can move rows
+to archive.db once they have been deleted for longer than the retention window.
+Rows deleted before this migration have no deleted_at; the archiver falls back to
+their last activity (conversations.updated_at, chat_messages.timestamp).
+"""
+
+
+def migrate(ctx):
+    ctx.add_column('conversations', 'deleted_at', 'DATETIME')
+    ctx.add_column('chat_messages', 'deleted_at', 'DATETIME')
+    with ctx.transaction() as conn:
+        # NOTE: partial indexes hold only the soft-deleted rows, so they stay small and live writes never touch them;
+        # the archiver must filter on exactly these expressions and conditions
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_conversations_deleted_at
+                ON conversations (COALESCE(deleted_at, updated_at)) WHERE deleted_flag = 1
+        """)
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_chat_messages_deleted_at
+                ON chat_messages (COALESCE(deleted_at, timestamp)) WHERE deleted = 1
+        """)
@@ -0,0 +1,45 @@
+-- Per-patient content version of everything api_chat.php puts into the prompt context
+-- (medical records and appointments). Triggers bump it on every write, whoever the writer
+-- is, so infrastructure/prompt_context.php can key its prebuilt context on it.
+-- A patient without a row is at version 0.
+
+CREATE TABLE IF NOT EXISTS patient_context_versions (
+    user_id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TRIGGER IF NOT EXISTS medical_records_context_insert AFTER INSERT ON medical_records BEGIN
+    INSERT INTO patient_context_versions (user_id, version) VALUES (NEW.user_id, 1)
+        ON CONFLICT (user_id) DO UPDATE SET version = version + 1, updated_at = CURRENT_TIMESTAMP;
+END;
+
+-- A record moved to another patient changes both contexts
+CREATE TRIGGER IF NOT EXISTS medical_records_context_update AFTER UPDATE ON medical_records BEGIN
+    INSERT INTO patient_context_versions (user_id, version) VALUES (NEW.user_id, 1)
+        ON CONFLICT (user_id) DO UPDATE SET version = version + 1, updated_at = CURRENT_TIMESTAMP;
+    INSERT INTO patient_context_versions (user_id, version) SELECT OLD.user_id, 1 WHERE OLD.user_id IS NOT NEW.user_id
+        ON CONFLICT (user_id) DO UPDATE SET version = version + 1, updated_at = CURRENT_TIMESTAMP;
+END;
+
+CREATE TRIGGER IF NOT EXISTS medical_records_context_delete AFTER DELETE ON medical_records BEGIN
+    INSERT INTO patient_context_versions (user_id, version) VALUES (OLD.user_id, 1)
+        ON CONFLICT (user_id) DO UPDATE SET version = version + 1, updated_at = CURRENT_TIMESTAMP;
+END;
+
+CREATE TRIGGER IF NOT EXISTS appointments_context_insert AFTER INSERT ON appointments BEGIN
+    INSERT INTO patient_context_versions (user_id, version) VALUES (NEW.user_id, 1)
+        ON CONFLICT (user_id) DO UPDATE SET version = version + 1, updated_at = CURRENT_TIMESTAMP;
+END;
+
+CREATE TRIGGER IF NOT EXISTS appointments_context_update AFTER UPDATE ON appointments BEGIN
+    INSERT INTO patient_context_versions (user_id, version) VALUES (NEW.user_id, 1)
+        ON CONFLICT (user_id) DO UPDATE SET version = version + 1, updated_at = CURRENT_TIMESTAMP;
+    INSERT INTO patient_context_versions (user_id, version) SELECT OLD.user_id, 1 WHERE OLD.user_id IS NOT NEW.user_id
+        ON CONFLICT (user_id) DO UPDATE SET version = version + 1, updated_at = CURRENT_TIMESTAMP;
+END;
+
+CREATE TRIGGER IF NOT EXISTS appointments_context_delete AFTER DELETE ON appointments BEGIN
+    INSERT INTO patient_context_versions (user_id, version) VALUES (OLD.user_id, 1)
+        ON CONFLICT (user_id) DO UPDATE SET version = version + 1, updated_at = CURRENT_TIMESTAMP;
+END;
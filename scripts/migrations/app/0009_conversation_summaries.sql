@@ -0,0 +1,27 @@
+-- Rolling summary of the part of a conversation that no longer fits the chat prompt's
+-- token budget (infrastructure/conversation_window.php). It covers the conversation's
+-- visible messages up to covered_rowid; later messages are sent verbatim.
+CREATE TABLE IF NOT EXISTS conversation_summaries (
+    conversation_id TEXT PRIMARY KEY,
+    summary TEXT NOT NULL,
+    covered_rowid INTEGER NOT NULL,  -- chat_messages.rowid of the newest message folded in
+    covered_messages INTEGER NOT NULL,  -- Messages folded in so far
+    covered_tokens INTEGER NOT NULL,  -- Their estimated size, to report what the summary saves
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+-- A summary must not keep what the patient deleted: editing or (un)deleting a message it
+-- covers throws it away, and the next turn folds the remaining messages again
+CREATE TRIGGER IF NOT EXISTS chat_messages_summary_update AFTER UPDATE OF message, deleted ON chat_messages BEGIN
+    DELETE FROM conversation_summaries WHERE conversation_id = NEW.conversation_id AND covered_rowid >= NEW.rowid;
+END;
+
+-- Deleting already soft-deleted rows (scripts/archive.py) changes nothing the summary holds
+CREATE TRIGGER IF NOT EXISTS chat_messages_summary_delete AFTER DELETE ON chat_messages
+WHEN OLD.deleted = 0 OR OLD.deleted IS NULL BEGIN
+    DELETE FROM conversation_summaries WHERE conversation_id = OLD.conversation_id AND covered_rowid >= OLD.rowid;
+END;
+
+CREATE TRIGGER IF NOT EXISTS conversations_summary_delete AFTER DELETE ON conversations BEGIN
+    DELETE FROM conversation_summaries WHERE conversation_id = OLD.conversation_id;
+END;
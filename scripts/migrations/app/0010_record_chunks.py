@@ -0,0 +1,119 @@
+"""
+Medical records split into overlapping chunks with an FTS5 index, so api_chat.php can
+pick the passages of a large chart that are relevant to the patient's question
+(infrastructure/record_retrieval.php) instead of sending every record.
+
+Chunks are CHUNK_CHARS characters long and start every CHUNK_STRIDE characters, so a
+phrase up to the overlap long is whole in at least one of them. medical_record_chunks
+only stores where each chunk starts; the text is read from the record through the
+view medical_record_chunks_source, which prefixes every chunk with its record's title.
+Triggers chunk a record whenever it is written, whoever writes it (triggers cannot use
+WITH RECURSIVE, so the chunk offsets come from the record_chunk_numbers table), and a
+second set keeps medical_record_chunks_fts in step with the chunks.
+
+Existing records are chunked and indexed by ctx.fill_chunked(), in the same way as
+migration 0006; `scripts/search_index.py --rebuild --index medical_record_chunks_fts`
+re-indexes the chunks.
+"""
+
+CHUNK_CHARS = 1200
+CHUNK_STRIDE = 1000
+# Records longer than this many strides (about 1 MB) are only chunked up to there
+MAX_CHUNKS = 1024
+
+# Triggers leave rows above a fill's progress to the fill itself
+FILLED = "{rowid} <= COALESCE((SELECT last_rowid FROM schema_migration_progress WHERE table_name = '{key}'), 9223372036854775807)"
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS record_chunk_numbers (i INTEGER PRIMARY KEY)",
+    f"""INSERT OR IGNORE INTO record_chunk_numbers (i)
+        WITH RECURSIVE n(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i + 1 < {MAX_CHUNKS})
+        SELECT i FROM n""",
+    """CREATE TABLE IF NOT EXISTS medical_record_chunks (
+        chunk_id INTEGER PRIMARY KEY,
+        record_rowid INTEGER NOT NULL,  -- medical_records.rowid
+        chunk_start INTEGER NOT NULL,  -- Offset of the chunk in the record's content, in characters
+        chunk_length INTEGER NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_medical_record_chunks_record ON medical_record_chunks (record_rowid)",
+    """CREATE VIEW IF NOT EXISTS medical_record_chunks_source AS
+        SELECT c.chunk_id AS chunk_id,
+               COALESCE(r.record_title, '') || char(10) || substr(COALESCE(r.content, ''), c.chunk_start + 1, c.chunk_length) AS content,
+               hex(r.user_id) AS owner
+        FROM medical_record_chunks c JOIN medical_records r ON r.rowid = c.record_rowid""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS medical_record_chunks_fts USING fts5(
+        content, owner,
+        content = 'medical_record_chunks_source', content_rowid = 'chunk_id',
+        tokenize = 'unicode61 remove_diacritics 2')""",
+    # ORDER BY rank then sorts inside FTS5; the owner column never counts towards the score
+    "INSERT INTO medical_record_chunks_fts (medical_record_chunks_fts, rank) VALUES ('rank', 'bm25(1.0, 0.0)')",
+]
+
+# Chunk numbers a record needs: one more whenever the previous chunk ends before the content does.
+# Every record has at least its first chunk, so a record with a title only can still be found.
+# NOTE: a bound on n.i (the primary key) rather than a condition per number, so length() runs once
+LAST_CHUNK = f"MAX(0, (COALESCE(length({{content}}), 0) - {CHUNK_CHARS - CHUNK_STRIDE} - 1) / {CHUNK_STRIDE})"
+
+CHUNK_RECORD = f"""
+    INSERT INTO medical_record_chunks (record_rowid, chunk_start, chunk_length)
+    SELECT {{row}}.rowid, n.i * {CHUNK_STRIDE}, {CHUNK_CHARS} FROM record_chunk_numbers n
+    WHERE n.i <= {LAST_CHUNK.format(content='{row}.content')};"""
+UNCHUNK_RECORD = "DELETE FROM medical_record_chunks WHERE record_rowid = {row}.rowid;"
+
+# NOTE: a 'delete' must repeat exactly the values that were indexed, so it reads them through the
+# view while the record still holds them: chunks are removed by BEFORE triggers on medical_records
+INDEX_CHUNK = """
+    INSERT INTO medical_record_chunks_fts ({columns}) SELECT {values}, content, owner
+    FROM medical_record_chunks_source WHERE chunk_id = {row}.chunk_id;"""
+
+
+def index_chunk(row, delete=False):
+    return INDEX_CHUNK.format(
+        columns="medical_record_chunks_fts, rowid, content, owner" if delete else "rowid, content, owner",
+        values="'delete', chunk_id" if delete else "chunk_id", row=row)
+
+
+def triggers():
+    chunked = FILLED.format(rowid='{row}.rowid', key='medical_record_chunks')
+    indexed = FILLED.format(rowid='{row}.chunk_id', key='medical_record_chunks_fts')
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS medical_records_chunks_insert AFTER INSERT ON medical_records
+            WHEN {chunked.format(row='NEW')} BEGIN {CHUNK_RECORD.format(row='NEW')} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS medical_records_chunks_update_before BEFORE UPDATE OF record_title, content, user_id
+            ON medical_records WHEN {chunked.format(row='OLD')} BEGIN {UNCHUNK_RECORD.format(row='OLD')} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS medical_records_chunks_update AFTER UPDATE OF record_title, content, user_id
+            ON medical_records WHEN {chunked.format(row='NEW')} BEGIN {CHUNK_RECORD.format(row='NEW')} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS medical_records_chunks_delete BEFORE DELETE ON medical_records
+            WHEN {chunked.format(row='OLD')} BEGIN {UNCHUNK_RECORD.format(row='OLD')} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS medical_record_chunks_fts_insert AFTER INSERT ON medical_record_chunks
+            WHEN {indexed.format(row='NEW')} BEGIN {index_chunk('NEW')} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS medical_record_chunks_fts_delete BEFORE DELETE ON medical_record_chunks
+            WHEN {indexed.format(row='OLD')} BEGIN {index_chunk('OLD', delete=True)} END""",
+    ]
+
+
+# (progress key, table walked by rowid, insert of one rowid range), in order: chunks, then their index;
+# keep the second in sync with scripts/search_index.py
+FILLS = [
+    ('medical_record_chunks', 'medical_records',
+     f"""INSERT INTO medical_record_chunks (record_rowid, chunk_start, chunk_length)
+        SELECT r.rowid, n.i * {CHUNK_STRIDE}, {CHUNK_CHARS} FROM medical_records r JOIN record_chunk_numbers n
+        ON n.i <= {LAST_CHUNK.format(content='r.content')}
+        WHERE r.rowid > ? AND r.rowid <= ?
+        ORDER BY r.rowid, n.i"""),
+    ('medical_record_chunks_fts', 'medical_record_chunks',
+     """INSERT INTO medical_record_chunks_fts (rowid, content, owner)
+        SELECT chunk_id, content, owner FROM medical_record_chunks_source
+        WHERE chunk_id > ? AND chunk_id <= ?"""),
+]
+
+
+def migrate(ctx):
+    if not ctx.table_exists('medical_record_chunks_fts'):
+        with ctx.transaction() as conn:
+            # NOTE: one execute() per statement; executescript() would commit the open transaction
+            for sql in SCHEMA + triggers(): conn.execute(sql)
+            for key, _, _ in FILLS:
+                conn.execute('INSERT OR REPLACE INTO schema_migration_progress VALUES (?, 0)', [key])
+    for key, table, insert_sql in FILLS:
+        ctx.fill_chunked(key, table, insert_sql)
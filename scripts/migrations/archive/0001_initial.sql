@@ -0,0 +1,41 @@
+-- archive.db: soft-deleted conversations and messages moved out of aioffice.db by
+-- scripts/archive.py after the retention window. Rows keep their original IDs, so an
+-- audit lookup by conversation_id or message_id finds them here, and
+-- `./scripts/archive.py --restore-...` can put them back unchanged.
+
+CREATE TABLE IF NOT EXISTS archived_conversations (
+    conversation_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    created_at DATETIME,
+    updated_at DATETIME,
+    deleted_flag INTEGER,
+    last_message_at DATETIME,
+    message_count INTEGER,
+    deleted_at DATETIME,
+    archived_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_archived_conversations_user
+    ON archived_conversations (user_id);
+
+-- message_zlib is the message text, UTF-8 and zlib-compressed; message_bytes its uncompressed size.
+-- user_id is copied from the conversation so a patient's archive can be listed without it.
+CREATE TABLE IF NOT EXISTS archived_messages (
+    message_id TEXT PRIMARY KEY,
+    conversation_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    role TEXT,
+    message_zlib BLOB NOT NULL,
+    message_bytes INTEGER NOT NULL,
+    timestamp DATETIME,
+    deleted INTEGER,
+    deleted_at DATETIME,
+    archived_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_archived_messages_conversation
+    ON archived_messages (conversation_id, timestamp);
+
+CREATE INDEX IF NOT EXISTS idx_archived_messages_user
+    ON archived_messages (user_id);
@@ -0,0 +1,4 @@
+-- Verification code check and consumption at login (pg_login/login.php).
+-- Not partial on used = 0: the UPDATE that consumes a code filters on email and code only.
+CREATE INDEX IF NOT EXISTS idx_verification_codes_email_code
+    ON verification_codes (email, code, expires_at);
@@ -0,0 +1,132 @@
+#!/home/ace/bin/uvrun
+# /// script
+# requires-python = ">=3.8"
+# dependencies = []
+# ///
+"""
+Maintenance of the FTS5 search indexes behind pg_main/api_search.php and
+infrastructure/record_retrieval.php.
+
+Migration 0006 creates chat_messages_fts and medical_records_fts, fills them from
+the existing rows and installs the triggers that keep them in sync; migration 0010
+does the same for medical_record_chunks_fts. This script
+reports their state and can backfill them again from scratch: --rebuild empties
+an index and refills it in short rowid-range transactions, while the triggers keep
+maintaining the rows already refilled, so the site stays up. Use it after restoring
+rows with triggers disabled, or whenever --check reports a mismatch.
+
+Usage:
+    ./scripts/search_index.py                        # indexed rows per index, pending backfills
+    ./scripts/search_index.py --check                # integrity-check each index against its rows
+    ./scripts/search_index.py --rebuild              # empty and backfill every index
+    ./scripts/search_index.py --rebuild --index medical_records_fts --data-dir tmp/synthetic
+    ./scripts/search_index.py --optimize             # merge index segments (one longer transaction)
+"""
+
+import argparse
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+from migrate import Context, connect, default_data_dir
+
+# fts table -> (source table, view the index reads from, rowid column of the view, indexed columns)
+# NOTE: keep in sync with scripts/migrations/app/0006_full_text_search.py
+INDEXES = {
+    'chat_messages_fts': ('chat_messages', 'chat_messages_search_source', 'message_rowid', 'message, owner'),
+    'medical_records_fts': ('medical_records', 'medical_records_search_source', 'record_rowid',
+                            'record_title, content, owner'),
+    'medical_record_chunks_fts': ('medical_record_chunks', 'medical_record_chunks_source', 'chunk_id',
+                                  'content, owner'),
+}
+
+
+def fill_sql(fts):
+    _, view, rowid, columns = INDEXES[fts]
+    return (f"INSERT INTO {fts} (rowid, {columns}) SELECT {rowid}, {columns} FROM {view} "
+            f"WHERE {rowid} > ? AND {rowid} <= ?")
+
+
+def status(conn, fts):
+    """Indexed rows, searchable source rows, and the rowid a pending backfill has reached (or None)."""
+    _, view, _, _ = INDEXES[fts]
+    # NOTE: COUNT(*) on an external-content table would read the view; the docsize shadow table has one row per document
+    indexed = conn.execute(f'SELECT COUNT(*) FROM {fts}_docsize').fetchone()[0]
+    searchable = conn.execute(f'SELECT COUNT(*) FROM {view}').fetchone()[0]
+    pending = conn.execute('SELECT last_rowid FROM schema_migration_progress WHERE table_name = ?', [fts]).fetchone()
+    return indexed, searchable, pending[0] if pending else None
+
+
+def rebuild(ctx, fts):
+    """Empty the index, then refill it chunk by chunk; returns rows indexed."""
+    table, _, _, _ = INDEXES[fts]
+    with ctx.transaction() as conn:
+        conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('delete-all')")
+        # From here until the fill passes them, the triggers leave rows alone
+        conn.execute('INSERT OR REPLACE INTO schema_migration_progress VALUES (?, 0)', [fts])
+    return ctx.fill_chunked(fts, table, fill_sql(fts))
+
+
+def check(conn, fts):
+    """FTS5 integrity-check, comparing the index with the rows it was built from; returns an error or None."""
+    try:
+        conn.execute(f"INSERT INTO {fts} ({fts}, rank) VALUES ('integrity-check', 1)")
+        return None
+    except sqlite3.DatabaseError as e:
+        return str(e)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Status, integrity check and backfill of the full-text search indexes')
+    parser.add_argument('--data-dir', type=Path, default=default_data_dir())
+    parser.add_argument('--index', choices=list(INDEXES), help='only this index (default: all)')
+    parser.add_argument('--check', action='store_true', help='integrity-check the indexes against their rows')
+    parser.add_argument('--rebuild', action='store_true', help='empty the indexes and backfill them')
+    parser.add_argument('--optimize', action='store_true', help='merge each index into a single b-tree')
+    parser.add_argument('--chunk-rows', type=int, default=5000, help='rows indexed per transaction')
+    args = parser.parse_args()
+
+    db_path = args.data_dir / 'aioffice.db'
+    if not db_path.exists():
+        print(f"❌ {db_path} not found")
+        return 1
+    conn = connect(db_path)
+    missing = [fts for fts in INDEXES if not conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = ?", [fts]).fetchone()]
+    if missing:
+        print(f"❌ {', '.join(missing)} missing; run ./scripts/migrate.py first")
+        return 1
+    indexes = [args.index] if args.index else list(INDEXES)
+    ctx = Context(conn, args.chunk_rows)
+    failed = False
+
+    for fts in indexes:
+        if args.rebuild:
+            started = time.perf_counter()
+            print(f"Rebuilding {fts}")
+            rows = rebuild(ctx, fts)
+            print(f"  {rows:,} rows in {time.perf_counter() - started:.2f}s, longest lock {ctx.longest_lock * 1000:.0f}ms")
+        if args.optimize:
+            started = time.perf_counter()
+            conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('optimize')")
+            print(f"  {fts}: optimized in {time.perf_counter() - started:.2f}s")
+        if args.check:
+            error = check(conn, fts)
+            failed = failed or error is not None
+            print(f"  {'❌' if error else '✅'} {fts}: {error or 'index matches its rows'}")
+
+    print(f"\n{'Index':<26} {'Indexed':>10} {'Searchable':>12}  Backfill")
+    print("-" * 60)
+    for fts in indexes:
+        indexed, searchable, pending = status(conn, fts)
+        backfill = 'done' if pending is None else f'pending after rowid {pending:,}'
+        print(f"{fts:<26} {indexed:>10,} {searchable:>12,}  {backfill}")
+        if pending is None and indexed != searchable:
+            print(f"  ⚠️  {fts} is out of step with its rows; run --check, then --rebuild")
+    conn.close()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
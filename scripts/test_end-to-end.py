@@ -7,6 +7,7 @@
 # ///
 
 import json
+import os
 import re
 import subprocess
 import sys
@@ -15,6 +16,7 @@ from pathlib import Path
 
 # First, ensure playwright is installed and import it
 from playwright.sync_api import sync_playwright, TimeoutError
+import email_standin
 
 # Check if browsers are installed and install if needed
 def ensure_browsers_installed():
@@ -45,10 +47,13 @@ def ensure_browsers_installed():
 ensure_browsers_installed()
 
 def load_config():
-    """Load configuration from config.json"""
+    """Load configuration from config.json (BASE_URL in the environment overrides it)"""
     config_path = Path(__file__).parent.parent / "www" / "config.json"
     with open(config_path) as f:
-        return json.load(f)
+        config = json.load(f)
+    if os.environ.get("BASE_URL"):
+        config["BASE_URL"] = os.environ["BASE_URL"]
+    return config
 
 def read_readme_expectations(pg_name):
     """Parse README.md for a page to extract expected elements"""
@@ -75,8 +80,18 @@ def read_readme_expectations(pg_name):
     
     return expectations
 
-def get_verification_code(max_attempts=5, delay=3):
+def get_verification_code(max_attempts=5, delay=3, to=None, since=0.0):
     """Read email and extract verification code"""
+    # With the local email stand-in, block on the spool until the message lands
+    if os.environ.get("AIOFC_MAIL_SPOOL"):
+        message = email_standin.wait_for_message(to, since, timeout=10)
+        match = re.search(r'\b(\d{6})\b', message['body']) if message else None
+        if match:
+            print("     Found verification code in mail spool")
+            return match.group(1)
+        print("     WARNING: No verification code arrived in the mail spool")
+        return None
+    
     # Wait for the new email to arrive
     print("     Waiting for new verification email...")
     time.sleep(4)
@@ -239,6 +254,7 @@ def test_login_flow(page, expectations, test_email, base_url):
     send_button_text = expectations.get("send_code_button", "Send Verification Code")
     print(f"   Clicking: {send_button_text}")
     send_button = iframe.locator(f"button:has-text('{send_button_text}')")
+    sent_after = time.time()
     send_button.click()
     
     # Wait for verification code field to appear
@@ -249,7 +265,7 @@ def test_login_flow(page, expectations, test_email, base_url):
     
     # Get verification code from email
     print("   Retrieving verification code from email...")
-    code = get_verification_code()
+    code = get_verification_code(to=test_email, since=sent_after)
     if not code:
         print("   ⚠ WARNING: Could not find verification code in email")
         print("   Using a test code (this may fail)...")
@@ -267,21 +283,18 @@ def test_login_flow(page, expectations, test_email, base_url):
     verify_button = iframe.locator(f"button:has-text('{verify_button_text}')")
     verify_button.click()
     
-    # Wait for the login to process and redirect
-    print("   Waiting for login to process...")
-    time.sleep(2)
-    
-    # Check for any error messages
-    error_msg = iframe.locator(".error, .alert-danger, #message.error")
-    if error_msg.count() > 0 and error_msg.first.is_visible():
-        error_text = error_msg.first.text_content()
-        print(f"   ⚠ Error message: {error_text}")
-    
     # Wait for redirect with JavaScript navigation
+    print("   Waiting for login to process...")
     try:
         page.wait_for_url("**/pg_main/**", timeout=10000)
         print("   ✓ Login successful - redirected to pg_main")
     except:
+        # Check for any error messages
+        error_msg = iframe.locator(".error, .alert-danger, #message.error")
+        if error_msg.count() > 0 and error_msg.first.is_visible():
+            error_text = error_msg.first.text_content()
+            print(f"   ⚠ Error message: {error_text}")
+        
         # Check if we at least got a success message
         success_msg = iframe.locator(".success, .alert-success, #message.success")
         if success_msg.count() > 0:
@@ -10,16 +10,29 @@
 Master test runner for AI Office application.
 Discovers and runs all test.py files in pg_* subdirectories.
 Provides comprehensive coverage reporting and test validation.
+
+With --jobs N, tests run in a pool of N worker processes. Each worker gets its own
+hermetic `php -S` server (see test_server.py) with a private auth.db/aioffice.db,
+so fixture writes from different pages never contend on the same SQLite files.
 """
 
 import os
 import sys
+import io
+import contextlib
+import shutil
 import subprocess
 import time
 import json
+import multiprocessing.util
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 from termcolor import colored
 from tabulate import tabulate
+from test_server import build_template, start_server, stop_server
+
+PROJECT_ROOT = Path(__file__).parent.parent
+_worker = {}
 
 def find_all_pg_directories():
     """Find all pg_* directories."""
@@ -55,7 +68,37 @@ def find_test_files():
     
     return test_info
 
-def run_test(test_data):
+def init_worker():
+    """Give this pool worker its own hermetic php -S server and data/ clone."""
+    handle = start_server()
+    # NOTE: pool workers leave via os._exit(), which skips atexit but still runs multiprocessing finalizers
+    multiprocessing.util.Finalize(None, stop_server, args=(handle,), exitpriority=10)
+    _worker['env'] = handle['env']
+
+def run_test_in_worker(test_data, submitted_at):
+    """Run one test inside a pool worker, capturing its console output for the parent."""
+    started_at = time.time()
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        result = run_test(test_data, env=_worker['env'])
+    result['queue_wait'] = started_at - submitted_at
+    result['output'] = output.getvalue()
+    return result
+
+def run_tests_parallel(test_data, jobs):
+    """Run tests in a process pool and return results in discovery order."""
+    order = {item['info']['name']: i for i, item in enumerate(test_data)}
+    results = []
+    build_template()
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker) as pool:
+        futures = [pool.submit(run_test_in_worker, item, time.time()) for item in test_data]
+        for future in as_completed(futures):
+            result = future.result()
+            print(result.pop('output'), end='')
+            results.append(result)
+    return sorted(results, key=lambda r: order[r['name']])
+
+def run_test(test_data, env=None):
     """Run a single test file and return detailed results."""
     test_file = test_data['path']
     info = test_data['info']
@@ -87,6 +130,7 @@ def run_test(test_data):
             capture_output=True,
             text=True,
             cwd=test_file.parent,
+            env=env,
             timeout=60  # 60 second timeout
         )
         
@@ -270,13 +314,25 @@ def main():
         print(colored("\nNo test files found!", "red"))
         return 1
     
-    print(f"\n{colored('Running Tests:', 'cyan')}")
+    jobs = int(sys.argv[sys.argv.index('--jobs') + 1]) if '--jobs' in sys.argv else 1
+    if jobs > 1 and not shutil.which('php'):
+        print(colored("\n--jobs needs the php CLI to start per-worker servers", "red"))
+        return 1
+    
+    print(f"\n{colored('Running Tests:', 'cyan')}" + (f" ({jobs} parallel workers)" if jobs > 1 else ""))
     print("═" * 60)
     
-    results = []
-    for test_item in test_data:
-        result = run_test(test_item)
-        results.append(result)
+    suite_start = time.time()
+    if jobs > 1:
+        results = run_tests_parallel(test_data, jobs)
+    else:
+        results = []
+        for test_item in test_data:
+            queue_wait = time.time() - suite_start
+            result = run_test(test_item)
+            result['queue_wait'] = queue_wait
+            results.append(result)
+    wall_time = time.time() - suite_start
     
     # Generate detailed summary
     print("\n" + "═" * 60)
@@ -311,11 +367,12 @@ def main():
             result['name'],
             status,
             f"{result['time']:.2f}s",
+            f"{result['queue_wait']:.2f}s",
             result['api_count'],
             colored("✓", "green") if result['has_visual'] else "-"
         ])
     
-    headers = ["Page", "Status", "Time", "APIs", "Visual"]
+    headers = ["Page", "Status", "Time", "Wait", "APIs", "Visual"]
     print(tabulate(summary_data, headers=headers, tablefmt="grid"))
     
     # Overall statistics
@@ -327,6 +384,7 @@ def main():
     if warnings > 0:
         print(f"  {colored(f'Warnings: {warnings}', 'yellow')}")
     print(f"  Total Time: {total_time:.2f}s")
+    print(f"  Wall Time: {wall_time:.2f}s")
     print(f"  Average Time: {total_time/len(results):.2f}s per test")
     
     # Coverage percentage
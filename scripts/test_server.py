@@ -0,0 +1,170 @@
+#!/home/ace/bin/uvrun
+# /// script
+# requires-python = ">=3.8"
+# dependencies = []
+# ///
+"""
+Hermetic PHP test server launcher.
+
+Starts `php -S` on a free local port serving www/, with AIOFC_DATA_DIR pointing at a
+throwaway data/ directory cloned from a template snapshot. The template holds both
+databases with every migration from migrate.py applied, so tests skip the schema
+bootstrap and many suites can run side by side on one box (a file lock keeps them from
+migrating and cloning the template at once). Verification emails go
+to a per-run spool through email_standin.py unless AIOFC_EMAIL_SEND is already set, and
+api_metrics.php requires a random AIOFC_METRICS_TOKEN unless one is already set.
+
+Usage:
+    ./scripts/test_server.py                          # serve until Ctrl-C
+    ./scripts/test_server.py -- www/pg_chat/test.py   # run a command against it, then tear down
+    ./scripts/test_server.py --template data -- ...   # clone the real data/ instead of the empty template
+    ./scripts/test_server.py --gemini-standin -- ...  # answer chat requests from gemini_standin.py, with small prompt budgets
+"""
+
+import argparse
+import contextlib
+import fcntl
+import os
+import secrets
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from migrate import migrate_data_dir
+
+PROJECT_ROOT = Path(__file__).parent.parent
+TEMPLATE_DIR = PROJECT_ROOT / 'tmp' / 'test_template'
+TEMPLATE_LOCK = PROJECT_ROOT / 'tmp' / 'test_template.lock'
+
+@contextlib.contextmanager
+def template_lock(shared=False):
+    """Hold the template lock: exclusive while migrating, shared while cloning, so suites
+    running side by side never migrate the template twice or clone it half-migrated."""
+    TEMPLATE_LOCK.parent.mkdir(exist_ok=True)
+    with open(TEMPLATE_LOCK, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def build_template(template_dir=TEMPLATE_DIR):
+    """Create or update the template data/ snapshot: empty databases with every migration applied."""
+    with template_lock():
+        migrate_data_dir(template_dir, log=lambda *args, **kwargs: None)
+    return template_dir
+
+
+def clone_data_dir(template_dir, data_dir):
+    """Copy every database in template_dir into data_dir via the SQLite backup API."""
+    (data_dir / 'uploads').mkdir(parents=True)
+    for src in Path(template_dir).glob('*.db'):
+        src_conn = sqlite3.connect(src)
+        dst_conn = sqlite3.connect(data_dir / src.name)
+        src_conn.backup(dst_conn)
+        dst_conn.close()
+        src_conn.close()
+
+
+def free_port():
+    """Ask the OS for an unused local TCP port."""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(template_dir=None, extra_env=None):
+    """Clone the template into a fresh run directory and start php -S on it."""
+    (PROJECT_ROOT / 'tmp').mkdir(exist_ok=True)
+    run_dir = Path(tempfile.mkdtemp(prefix='server_', dir=PROJECT_ROOT / 'tmp'))
+    data_dir = run_dir / 'data'
+    template_dir = template_dir or build_template()
+    with template_lock(shared=True):
+        clone_data_dir(template_dir, data_dir)
+    mail_env = {'AIOFC_EMAIL_SEND': f"{sys.executable} {Path(__file__).parent / 'email_standin.py'} send",
+                'AIOFC_MAIL_SPOOL': str(run_dir / 'mail')}
+    # A metrics token, so the tests exercise api_metrics.php's token check
+    metrics_env = {'AIOFC_METRICS_TOKEN': secrets.token_hex(16)}
+    env = {**mail_env, **metrics_env, **os.environ, **(extra_env or {}), 'AIOFC_DATA_DIR': str(data_dir)}
+
+    # NOTE: another process can grab the port between free_port() and php binding it, so retry
+    for _ in range(3):
+        port = free_port()
+        server = subprocess.Popen(
+            ['php', '-S', f'127.0.0.1:{port}', '-t', str(PROJECT_ROOT / 'www')],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        for _ in range(100):
+            if server.poll() is not None: break
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+                base_url = f'http://127.0.0.1:{port}'
+                return {'server': server, 'run_dir': run_dir, 'data_dir': data_dir,
+                        'base_url': base_url, 'env': {**env, 'BASE_URL': base_url}}
+            except OSError:
+                time.sleep(0.05)
+        server.kill()
+        server.wait()
+    shutil.rmtree(run_dir, ignore_errors=True)
+    raise RuntimeError('php -S did not start')
+
+
+def stop_server(handle, keep=False):
+    """Stop a server from start_server() and delete its data unless keep is set."""
+    handle['server'].terminate()
+    handle['server'].wait()
+    if not keep: shutil.rmtree(handle['run_dir'], ignore_errors=True)
+
+
+@contextlib.contextmanager
+def hermetic_server(template_dir=None, extra_env=None):
+    """Context manager yielding a running hermetic server handle."""
+    handle = start_server(template_dir, extra_env)
+    try:
+        yield handle
+    finally:
+        stop_server(handle)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a throwaway php -S server for tests')
+    parser.add_argument('--template', type=Path, help='data/ snapshot to clone (default: empty migrated databases)')
+    parser.add_argument('--keep', action='store_true', help='keep the cloned data directory afterwards')
+    parser.add_argument('--gemini-standin', action='store_true', help='serve Gemini calls from gemini_standin.py')
+    parser.add_argument('command', nargs=argparse.REMAINDER, help='command to run with BASE_URL exported')
+    args = parser.parse_args()
+    command = args.command[1:] if args.command[:1] == ['--'] else args.command
+
+    extra_env = {}
+    if args.gemini_standin:
+        import gemini_standin
+        standin = gemini_standin.serve(gemini_standin.parse_args(['--port', '0']))
+        threading.Thread(target=standin.serve_forever, daemon=True).start()
+        # Cache every patient context, however small, so chat tests go through cachedContents,
+        # and use small prompt budgets, so short test conversations and charts already fold and retrieve
+        extra_env = {'AIOFC_GEMINI_BASE_URL': f'http://127.0.0.1:{standin.server_port}/v1beta',
+                     'AIOFC_GEMINI_API_KEY': 'standin', 'AIOFC_GEMINI_CACHE_MIN_TOKENS': '0',
+                     'AIOFC_CHAT_HISTORY_TOKENS': '500', 'AIOFC_CHAT_RECORDS_TOKENS': '1000',
+                     'AIOFC_CHAT_RECENT_RECORDS_TOKENS': '250'}
+    handle = start_server(args.template, extra_env)
+    print(f"Serving {handle['base_url']} with data in {handle['data_dir']}", file=sys.stderr)
+    try:
+        if not command:
+            handle['server'].wait()
+            return 0
+        return subprocess.run(command, env=handle['env']).returncode
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        stop_server(handle, keep=args.keep)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -20,7 +20,10 @@ from termcolor import colored
 
 
 def find_base_url():
-    """Find the base URL from configuration files."""
+    """Find the base URL from the environment or configuration files."""
+    if os.environ.get('BASE_URL'):
+        return os.environ['BASE_URL'].rstrip('/')
+    
     # Try to find config file with base URL
     config_locations = [
         Path.cwd() / 'config.json',
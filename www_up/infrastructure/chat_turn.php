@@ -0,0 +1,145 @@
+<?php
+declare(strict_types=1);
+
+require_once __DIR__ . '/prompt_context.php';
+require_once __DIR__ . '/gemini.php';
+require_once __DIR__ . '/conversation_window.php';
+require_once __DIR__ . '/record_retrieval.php';
+
+
+/**
+ * Appended to an assistant message whose stream ended early (patient disconnected, upstream failure)
+ */
+const CHAT_INTERRUPTED_MARKER = '[Response interrupted before it was complete]';
+
+
+/**
+ * Store the patient's message, in a new conversation or in one of theirs
+ *
+ * Conversation and message go in one short commit; nothing is held open across the
+ * Gemini call. Returns ['conversation_id', 'message_id', 'title' (new conversations
+ * only)], or null if the conversation is not the patient's.
+ */
+function startChatTurn(PDO $db, string $userId, string $message, ?string $conversationId): ?array {
+    $message_id = bin2hex(random_bytes(8));
+    $title = null;
+    $db->beginTransaction();
+
+    if (!$conversationId) {
+        // New conversation, created with its summary columns already counting this message
+        $conversationId = bin2hex(random_bytes(8));
+        $title = mb_substr($message, 0, 50) . (mb_strlen($message) > 50 ? '...' : '');
+
+        $stmt = $db->prepare("
+            INSERT INTO conversations (conversation_id, user_id, title, created_at, updated_at, last_message_at, message_count)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP, 1)
+        ");
+        $stmt->execute([$conversationId, $userId, $title]);
+    } else {
+        // Single updated_at bump; the user_id check doubles as the ownership check
+        $stmt = $db->prepare("
+            UPDATE conversations
+            SET updated_at = CURRENT_TIMESTAMP,
+                last_message_at = CURRENT_TIMESTAMP,
+                message_count = message_count + 1
+            WHERE conversation_id = ? AND user_id = ?
+        ");
+        $stmt->execute([$conversationId, $userId]);
+
+        if ($stmt->rowCount() === 0) {
+            $db->rollBack();
+            return null;
+        }
+    }
+
+    $stmt = $db->prepare("
+        INSERT INTO chat_messages (message_id, conversation_id, role, message, timestamp)
+        VALUES (?, ?, 'patient', ?, CURRENT_TIMESTAMP)
+    ");
+    $stmt->execute([$message_id, $conversationId, $message]);
+    $db->commit();
+
+    return ['conversation_id' => $conversationId, 'message_id' => $message_id, 'title' => $title];
+}
+
+
+/**
+ * What the Gemini request of a turn is built from, with the templates in $pageDir
+ *
+ * Returns ['history', 'context', 'turn_context', 'cached_content'], the arguments of
+ * buildGeminiRequest().
+ */
+function prepareChatTurn(PDO $db, array $config, string $userId, string $conversationId, string $message,
+                         string $local_datetime, string $timezone, string $pageDir): array {
+    // Records and appointments, prebuilt into the template until the patient's next write
+    $patient_context = getPatientContext($db, $userId, "$pageDir/prompt_template.txt");
+
+    // Newest messages within the token budget (the current one included), older ones as a rolling summary
+    $window = loadConversationWindow($db, $config, $conversationId, "$pageDir/summary_prompt.txt");
+
+    // A chart too large to send whole: the passages of its older records relevant to this question
+    $excerpts = $patient_context['recent_rowids'] === null ? ''
+        : retrieveRecordExcerpts($db, $userId, $message, $patient_context['recent_rowids']);
+
+    return [
+        'history' => $window['messages'],
+        'context' => $patient_context['text'],
+        'turn_context' => renderTurnContext("$pageDir/prompt_turn_template.txt", $local_datetime, $timezone,
+                                            $window['summary'], $excerpts),
+        // The patient's context from a Gemini cachedContents entry when possible, inline otherwise
+        'cached_content' => getGeminiCachedContent($config, $userId, $patient_context['text'])
+    ];
+}
+
+
+/**
+ * Store the assistant's reply with the conversation's single updated_at bump; returns its message_id
+ */
+function finishChatTurn(PDO $db, string $conversationId, string $reply): string {
+    $response_id = bin2hex(random_bytes(8));
+    $db->beginTransaction();
+    $stmt = $db->prepare("
+        INSERT INTO chat_messages (message_id, conversation_id, role, message, timestamp)
+        VALUES (?, ?, 'assistant', ?, CURRENT_TIMESTAMP)
+    ");
+    $stmt->execute([$response_id, $conversationId, $reply]);
+
+    $stmt = $db->prepare("
+        UPDATE conversations
+        SET updated_at = CURRENT_TIMESTAMP,
+            last_message_at = CURRENT_TIMESTAMP,
+            message_count = message_count + 1
+        WHERE conversation_id = ?
+    ");
+    $stmt->execute([$conversationId]);
+    $db->commit();
+    return $response_id;
+}
+
+
+/**
+ * Chat latency counters for monitoring (shared by all PHP workers of this server)
+ *
+ * For api_chat.php the first token arrives with the whole reply; api_chat_stream.php
+ * reports it separately, from the request's start and from the Gemini call's.
+ */
+function getChatLatencyStats(): array {
+    $turns = readMetric('chat:turns');
+    $streams = readMetric('chat_stream:turns');
+    $firstTokens = readMetric('chat_stream:first_tokens');
+    $perFirstToken = fn($counter) => $firstTokens > 0 ? round(readMetric($counter) / $firstTokens / 1000, 3) : null;
+    return [
+        'blocking' => [
+            'turns' => $turns,
+            'avg_response_ms' => $turns > 0 ? round(readMetric('chat:response_us') / $turns / 1000, 3) : null
+        ],
+        'streaming' => [
+            'turns' => $streams,
+            'avg_first_token_ms' => $perFirstToken('chat_stream:first_token_us'),
+            'avg_gemini_first_token_ms' => $perFirstToken('chat_stream:gemini_first_token_us'),
+            'avg_total_ms' => $streams > 0 ? round(readMetric('chat_stream:total_us') / $streams / 1000, 3) : null,
+            'disconnects' => readMetric('chat_stream:disconnects'),
+            'failures' => readMetric('chat_stream:failures')
+        ]
+    ];
+}
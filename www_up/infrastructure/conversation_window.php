@@ -0,0 +1,202 @@
+<?php
+declare(strict_types=1);
+
+require_once __DIR__ . '/gemini.php';
+
+
+/**
+ * Token budget of the conversation sent verbatim each turn (AIOFC_CHAT_HISTORY_TOKENS)
+ */
+function getHistoryTokenBudget(): int {
+    $tokens = getenv('AIOFC_CHAT_HISTORY_TOKENS');
+    return $tokens === false || $tokens === '' ? 6000 : max(500, (int)$tokens);
+}
+
+
+/**
+ * Longest rolling summary Gemini is asked to write, in tokens (AIOFC_CHAT_SUMMARY_TOKENS)
+ */
+function getSummaryTokenBudget(): int {
+    $tokens = getenv('AIOFC_CHAT_SUMMARY_TOKENS');
+    return $tokens === false || $tokens === '' ? 800 : max(100, (int)$tokens);
+}
+
+
+/**
+ * Rolling summary of a conversation (migration 0009), or null before its first fold
+ */
+function getConversationSummary(PDO $db, string $conversationId): ?array {
+    $stmt = $db->prepare("
+        SELECT summary, covered_rowid, covered_messages, covered_tokens
+        FROM conversation_summaries
+        WHERE conversation_id = ?
+    ");
+    $stmt->execute([$conversationId]);
+    $row = $stmt->fetch(PDO::FETCH_ASSOC);
+    $stmt->closeCursor();
+    return $row ?: null;
+}
+
+
+/**
+ * What a conversation's prompt holds this turn: the rolling summary and the newest messages verbatim
+ *
+ * Only messages after the summary are read. When they exceed getHistoryTokenBudget(),
+ * the oldest are folded into the summary with one Gemini call until the rest fit in
+ * half the budget, so folds happen every few turns and extend the summary instead of
+ * recomputing it. If a fold fails, this turn sends those messages verbatim, over the
+ * budget, rather than lose them, and the next turn tries again.
+ *
+ * Returns ['summary' => ?string, 'messages' => [['role', 'message'], ...] oldest first].
+ */
+function loadConversationWindow(PDO $db, array $config, string $conversationId, string $summaryPromptPath): array {
+    $summary = getConversationSummary($db, $conversationId);
+
+    $stmt = $db->prepare("
+        SELECT rowid, role, message
+        FROM chat_messages
+        WHERE conversation_id = ?
+        AND rowid > ?
+        AND (deleted = 0 OR deleted IS NULL)
+        ORDER BY timestamp ASC, rowid ASC
+    ");
+    $stmt->execute([$conversationId, $summary['covered_rowid'] ?? 0]);
+    $messages = $stmt->fetchAll(PDO::FETCH_ASSOC);
+    $tokens = array_map(fn($msg) => estimateTokens($msg['message']), $messages);
+
+    $budget = getHistoryTokenBudget();
+    if (array_sum($tokens) > $budget && count($messages) > 1) {
+        // Keep the newest messages within half the budget, at least the patient's latest one,
+        // and start the window on a patient message as Gemini expects
+        $start = count($messages) - 1;
+        $kept = $tokens[$start];
+        while ($start > 0 && $kept + $tokens[$start - 1] <= $budget / 2) {
+            $kept += $tokens[--$start];
+        }
+        while ($start < count($messages) - 1 && $messages[$start]['role'] !== 'patient') {
+            $start++;
+        }
+
+        $folded = array_slice($messages, 0, $start);
+        $foldedTokens = array_sum(array_slice($tokens, 0, $start));
+        $text = summarizeMessages($config, $summary['summary'] ?? null, $folded, $summaryPromptPath);
+
+        // Only messages the stored summary now covers leave the window
+        if ($text !== null && saveConversationSummary($db, $conversationId, $text, $summary, $folded, $foldedTokens)) {
+            countMetric('conversation_window:folds');
+            $summary = getConversationSummary($db, $conversationId);
+            $messages = array_slice($messages, $start);
+        } else {
+            countMetric('conversation_window:fold_failures');
+        }
+    }
+
+    countMetric('conversation_window:turns');
+    countMetric('conversation_window:history_tokens', array_sum(array_map(fn($msg) => estimateTokens($msg['message']), $messages)));
+    if ($summary !== null) {
+        countMetric('conversation_window:summary_tokens', estimateTokens($summary['summary']));
+        countMetric('conversation_window:summarized_tokens', (int)$summary['covered_tokens']);
+    }
+    return ['summary' => $summary['summary'] ?? null, 'messages' => $messages];
+}
+
+
+/**
+ * Ask Gemini for the summary extended with the given messages; null if it could not be had
+ */
+function summarizeMessages(array $config, ?string $summary, array $messages, string $promptPath): ?string {
+    $transcript = '';
+    foreach ($messages as $msg) {
+        $transcript .= ($msg['role'] === 'patient' ? 'Patient' : 'Assistant') . ": {$msg['message']}\n\n";
+    }
+    $prompt = str_replace(
+        ['{{MAX_WORDS}}', '{{SUMMARY}}', '{{MESSAGES}}'],
+        [(string)intdiv(getSummaryTokenBudget() * 3, 4), $summary ?? 'None yet.', $transcript],
+        file_get_contents($promptPath)
+    );
+
+    [$http_code, $data, $response] = geminiRequest($config, 'POST', "models/{$config['gemini_model']}:generateContent", [
+        'contents' => [['role' => 'user', 'parts' => [['text' => $prompt]]]],
+        'generationConfig' => [
+            'temperature' => 0.2,
+            'maxOutputTokens' => getSummaryTokenBudget()
+        ]
+    ], 30);
+    $text = trim($data['candidates'][0]['content']['parts'][0]['text'] ?? '');
+    if ($http_code !== 200 || $text === '') {
+        error_log("Conversation summary failed: HTTP $http_code " . substr($response, 0, 500));
+        return null;
+    }
+    return $text;
+}
+
+
+/**
+ * Store an extended summary, unless the conversation changed while it was being written
+ *
+ * It is only stored on top of the summary it extends (a concurrent turn may have folded
+ * first, a trigger may have dropped it) and only if every folded message is still
+ * visible, so a message deleted meanwhile cannot end up in it.
+ */
+function saveConversationSummary(PDO $db, string $conversationId, string $text, ?array $previous, array $folded, int $foldedTokens): bool {
+    $params = [
+        'conversation_id' => $conversationId,
+        'summary' => $text,
+        'covered_rowid' => (int)end($folded)['rowid'],
+        'previous_rowid' => (int)($previous['covered_rowid'] ?? 0),
+        'folded' => count($folded),
+        'covered_messages' => (int)($previous['covered_messages'] ?? 0) + count($folded),
+        'covered_tokens' => (int)($previous['covered_tokens'] ?? 0) + $foldedTokens
+    ];
+    $stillVisible = "
+        (SELECT COUNT(*) FROM chat_messages
+         WHERE conversation_id = :conversation_id AND rowid > :previous_rowid AND rowid <= :covered_rowid
+         AND (deleted = 0 OR deleted IS NULL)) = :folded
+    ";
+
+    if ($previous === null) {
+        $stmt = $db->prepare("
+            INSERT INTO conversation_summaries (conversation_id, summary, covered_rowid, covered_messages, covered_tokens)
+            SELECT :conversation_id, :summary, :covered_rowid, :covered_messages, :covered_tokens
+            WHERE $stillVisible
+            AND NOT EXISTS (SELECT 1 FROM conversation_summaries WHERE conversation_id = :conversation_id)
+        ");
+    } else {
+        $stmt = $db->prepare("
+            UPDATE conversation_summaries
+            SET summary = :summary,
+                covered_rowid = :covered_rowid,
+                covered_messages = :covered_messages,
+                covered_tokens = :covered_tokens,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE conversation_id = :conversation_id
+            AND covered_rowid = :previous_rowid
+            AND $stillVisible
+        ");
+    }
+    // NOTE: bound as integers, since COUNT(*) = '3' (a string) is never true in SQLite
+    foreach ($params as $name => $value) {
+        $stmt->bindValue($name, $value, is_int($value) ? PDO::PARAM_INT : PDO::PARAM_STR);
+    }
+    $stmt->execute();
+    return $stmt->rowCount() === 1;
+}
+
+
+/**
+ * Conversation window counters for monitoring (shared by all PHP workers of this server)
+ */
+function getConversationWindowStats(): array {
+    $turns = readMetric('conversation_window:turns');
+    $perTurn = fn($counter) => $turns > 0 ? intdiv(readMetric('conversation_window:' . $counter), $turns) : null;
+    return [
+        'history_token_budget' => getHistoryTokenBudget(),
+        'turns' => $turns,
+        'folds' => readMetric('conversation_window:folds'),
+        'fold_failures' => readMetric('conversation_window:fold_failures'),
+        // Per turn: messages sent verbatim, the summary sent instead of older ones, and what it stands for
+        'avg_history_tokens' => $perTurn('history_tokens'),
+        'avg_summary_tokens' => $perTurn('summary_tokens'),
+        'avg_summarized_tokens' => $perTurn('summarized_tokens')
+    ];
+}
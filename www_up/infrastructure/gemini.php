@@ -0,0 +1,287 @@
+<?php
+declare(strict_types=1);
+
+require_once __DIR__ . '/lib.php';
+
+
+/**
+ * Send one request to the Gemini API
+ *
+ * Returns [HTTP code (0 if the request failed), decoded JSON body or null, raw body].
+ */
+function geminiRequest(array $config, string $method, string $path, ?array $body = null, int $timeout = 0): array {
+    $url = "{$config['gemini_base_url']}/$path" . (str_contains($path, '?') ? '&' : '?') . 'key=' . $config['gemini_api_key'];
+    $ch = curl_init($url);
+    curl_setopt($ch, CURLOPT_RETURNTRANSFER, true);
+    curl_setopt($ch, CURLOPT_CUSTOMREQUEST, $method);
+    curl_setopt($ch, CURLOPT_HTTPHEADER, ['Content-Type: application/json']);
+    curl_setopt($ch, CURLOPT_TIMEOUT, $timeout);
+    if ($body !== null) {
+        curl_setopt($ch, CURLOPT_POSTFIELDS, json_encode($body));
+    }
+    $response = curl_exec($ch);
+    $http_code = curl_getinfo($ch, CURLINFO_HTTP_CODE);
+    curl_close($ch);
+    $response = is_string($response) ? $response : '';
+    return [$http_code, json_decode($response, true), $response];
+}
+
+
+/**
+ * Send a streamGenerateContent request (alt=sse), handing each text chunk to $onText as it arrives
+ *
+ * $onText(string $text) returns false to stop the stream, e.g. when the patient has gone
+ * away. Returns [HTTP code (0 if the request failed), the last event (it carries the
+ * usageMetadata) or null, raw body of a refused request, whether the stream ran to its end].
+ */
+function geminiStreamRequest(array $config, string $path, array $body, callable $onText, int $timeout = 0): array {
+    $url = "{$config['gemini_base_url']}/$path" . (str_contains($path, '?') ? '&' : '?') . 'alt=sse&key=' . $config['gemini_api_key'];
+    $buffer = '';
+    $refused = '';
+    $last = null;
+    $stopped = false;
+
+    $ch = curl_init($url);
+    curl_setopt($ch, CURLOPT_POST, true);
+    curl_setopt($ch, CURLOPT_HTTPHEADER, ['Content-Type: application/json']);
+    curl_setopt($ch, CURLOPT_TIMEOUT, $timeout);
+    curl_setopt($ch, CURLOPT_POSTFIELDS, json_encode($body));
+    curl_setopt($ch, CURLOPT_WRITEFUNCTION, function ($ch, string $data) use (&$buffer, &$refused, &$last, &$stopped, $onText): int {
+        if (curl_getinfo($ch, CURLINFO_HTTP_CODE) !== 200) {
+            $refused .= $data;
+            return strlen($data);
+        }
+        // Events end with a blank line; a "\r\n" split across two writes is joined up here
+        $buffer = str_replace("\r\n", "\n", $buffer . $data);
+        while (($end = strpos($buffer, "\n\n")) !== false) {
+            $json = '';
+            foreach (explode("\n", substr($buffer, 0, $end)) as $line) {
+                if (str_starts_with($line, 'data:')) $json .= ltrim(substr($line, 5));
+            }
+            $buffer = substr($buffer, $end + 2);
+            $event = json_decode($json, true);
+            if (!is_array($event)) continue;
+            $last = $event;
+            $text = implode('', array_column($event['candidates'][0]['content']['parts'] ?? [], 'text'));
+            if ($text !== '' && $onText($text) === false) {
+                $stopped = true;
+                return 0;  // NOTE: writing less than was received makes curl abort the transfer
+            }
+        }
+        return strlen($data);
+    });
+    $completed = curl_exec($ch) === true;
+    $http_code = curl_getinfo($ch, CURLINFO_HTTP_CODE);
+    if (!$completed && !$stopped) {
+        error_log('Gemini stream broken: ' . curl_error($ch));
+    }
+    curl_close($ch);
+    return [$http_code, $last, $refused, $completed && $http_code === 200];
+}
+
+
+/**
+ * Lifetime in seconds of a patient's Gemini context cache (AIOFC_GEMINI_CACHE_SECONDS,
+ * 0 = off: every turn sends the context inline)
+ */
+function getGeminiCacheTtl(): int {
+    $seconds = getenv('AIOFC_GEMINI_CACHE_SECONDS');
+    return $seconds === false || $seconds === '' ? 3600 : max(0, (int)$seconds);
+}
+
+
+/**
+ * Smallest context worth caching, in tokens (AIOFC_GEMINI_CACHE_MIN_TOKENS); Gemini
+ * rejects cachedContents below a model-specific minimum, so smaller ones go inline
+ */
+function getGeminiCacheMinTokens(): int {
+    $tokens = getenv('AIOFC_GEMINI_CACHE_MIN_TOKENS');
+    return $tokens === false || $tokens === '' ? 4096 : max(0, (int)$tokens);
+}
+
+
+/**
+ * Where the name of each patient's current cachedContents entry is kept
+ */
+function geminiCacheRecordPath(string $userId): string {
+    return getDataDir() . '/cache/gemini/' . hash('sha256', $userId) . '.json';
+}
+
+
+/**
+ * Name of a Gemini cachedContents entry holding the patient's context, or null to send it inline
+ *
+ * The entry is keyed on a hash of model, endpoint and context, so a record or appointment
+ * write (a new context version) replaces it: the old entry is deleted and a new one created.
+ * An entry in the second half of its TTL is extended, so an active patient keeps theirs.
+ * Creation failures (model without caching, context below the minimum, quota) are
+ * remembered for ten minutes and the turn goes inline. The per-patient file lock is held
+ * only to read and write the record, never across a Gemini call, so a slow create does
+ * not hold up the patient's other turns; when two turns create an entry for the same
+ * context at once, the first one stored is kept and the other deleted.
+ */
+function getGeminiCachedContent(array $config, string $userId, string $context): ?string {
+    $ttl = getGeminiCacheTtl();
+    if ($ttl === 0 || estimateTokens($context) < getGeminiCacheMinTokens()) return null;
+
+    $path = geminiCacheRecordPath($userId);
+    if (!is_dir(dirname($path)) && !@mkdir(dirname($path), 0700, true)) return null;
+    $record = updateGeminiCacheRecord($path, fn(array $record) => [null, $record]);
+    if ($record === null) return null;
+
+    $key = hash('sha256', "{$config['gemini_model']}\0{$config['gemini_base_url']}\0$context");
+    $current = ($record['key'] ?? '') === $key;
+    $live = fn(array $record) => ($record['key'] ?? '') === $key && !empty($record['name'])
+                                 && $record['expires_at'] > time() + 60;
+
+    if ($current && ($record['failed_until'] ?? 0) > time()) {
+        return null;
+    }
+    if ($live($record)) {
+        if ($record['expires_at'] - time() > $ttl / 2) {
+            countMetric('gemini_cache:hits');
+            return $record['name'];
+        }
+        [$http_code] = geminiRequest($config, 'PATCH', "{$record['name']}?updateMask=ttl", ['ttl' => "{$ttl}s"], 10);
+        if ($http_code === 200) {
+            countMetric('gemini_cache:refreshes');
+            $expires_at = time() + $ttl;
+            // Unless a concurrent turn has replaced the entry meanwhile
+            updateGeminiCacheRecord($path, fn(array $now) =>
+                [($now['name'] ?? '') === $record['name'] ? ['expires_at' => $expires_at] + $now : null, null]);
+            return $record['name'];
+        }
+    }
+
+    // Stale context (or an entry that could not be extended): drop it rather than wait for its TTL
+    if (!empty($record['name']) && ($record['base_url'] ?? '') === $config['gemini_base_url']) {
+        geminiRequest($config, 'DELETE', $record['name'], null, 10);
+    }
+
+    [$http_code, $created, $response] = geminiRequest($config, 'POST', 'cachedContents', [
+        'model' => "models/{$config['gemini_model']}",
+        'systemInstruction' => ['parts' => [['text' => $context]]],
+        'ttl' => "{$ttl}s"
+    ], 10);
+    if ($http_code === 200 && !empty($created['name'])) {
+        countMetric('gemini_cache:creates');
+        $new = ['key' => $key, 'name' => $created['name'], 'base_url' => $config['gemini_base_url'],
+                'expires_at' => time() + $ttl];
+    } else {
+        error_log("Gemini cachedContents create failed: HTTP $http_code " . substr($response, 0, 500));
+        countMetric('gemini_cache:create_failures');
+        $new = ['key' => $key, 'failed_until' => time() + 600];
+    }
+
+    // A concurrent turn may have stored an entry for this context meanwhile: keep that one
+    $stored = updateGeminiCacheRecord($path, fn(array $now) => $live($now) ? [null, $now] : [$new, $new]) ?? $new;
+    if (!empty($new['name']) && ($stored['name'] ?? null) !== $new['name']) {
+        geminiRequest($config, 'DELETE', $new['name'], null, 10);
+    }
+    return $stored['name'] ?? null;
+}
+
+
+/**
+ * Run $update on a patient's cache record file under its lock
+ *
+ * $update(array $record) returns [the record to write, or null to leave it, result].
+ * Returns the result, or null if the file cannot be opened.
+ */
+function updateGeminiCacheRecord(string $path, callable $update): mixed {
+    $fh = @fopen($path, 'c+');
+    if ($fh === false) return null;
+    flock($fh, LOCK_EX);
+
+    try {
+        $record = json_decode(stream_get_contents($fh) ?: '', true) ?: [];
+        [$write, $result] = $update($record);
+        if ($write !== null) writeGeminiCacheRecord($fh, $write);
+        return $result;
+    } finally {
+        flock($fh, LOCK_UN);
+        fclose($fh);
+    }
+}
+
+
+/**
+ * Replace the contents of a locked cache record file
+ */
+function writeGeminiCacheRecord($fh, array $record): void {
+    ftruncate($fh, 0);
+    rewind($fh);
+    fwrite($fh, json_encode($record));
+}
+
+
+/**
+ * Forget a patient's cachedContents entry after Gemini refused it (expired or deleted upstream)
+ *
+ * Under the record's lock, and only if the record still names that entry: a concurrent
+ * turn may already have stored a new one.
+ */
+function forgetGeminiCachedContent(string $userId, string $name): void {
+    updateGeminiCacheRecord(geminiCacheRecordPath($userId),
+        fn(array $record) => [($record['name'] ?? null) === $name ? [] : null, null]);
+    countMetric('gemini_cache:fallbacks');
+}
+
+
+/**
+ * generateContent request body for a turn
+ *
+ * With a cachedContents entry, the patient's context comes from the cache and Gemini
+ * accepts no systemInstruction, so this turn's context travels as the first part of
+ * the patient's latest message; without one, both go inline as the system instruction.
+ */
+function buildGeminiRequest(array $history, string $context, string $turnContext, ?string $cachedContent): array {
+    $conversation_parts = [];
+    foreach ($history as $msg) {
+        $conversation_parts[] = [
+            'role' => $msg['role'] === 'patient' ? 'user' : 'model',
+            'parts' => [['text' => $msg['message']]]
+        ];
+    }
+
+    $request = [
+        'contents' => $conversation_parts,
+        'generationConfig' => [
+            'temperature' => 0.7,
+            'maxOutputTokens' => 1000
+        ]
+    ];
+    $last = count($conversation_parts) - 1;
+    if ($cachedContent !== null && $last >= 0) {
+        $request['cachedContent'] = $cachedContent;
+        array_unshift($request['contents'][$last]['parts'], ['text' => $turnContext]);
+    } else {
+        $request['systemInstruction'] = ['parts' => [['text' => $context . "\n" . $turnContext]]];
+    }
+    return $request;
+}
+
+
+/**
+ * Record the token counts of a response, to report how much of the prompt the cache served
+ */
+function countGeminiUsage(?array $response): void {
+    $usage = $response['usageMetadata'] ?? [];
+    countMetric('gemini_cache:prompt_tokens', (int)($usage['promptTokenCount'] ?? 0));
+    countMetric('gemini_cache:cached_tokens', (int)($usage['cachedContentTokenCount'] ?? 0));
+}
+
+
+/**
+ * Gemini context cache counters for monitoring (shared by all PHP workers of this server)
+ */
+function getGeminiCacheStats(): array {
+    $stats = ['enabled' => getGeminiCacheTtl() > 0, 'ttl_seconds' => getGeminiCacheTtl(),
+              'min_tokens' => getGeminiCacheMinTokens()];
+    foreach (['hits', 'creates', 'refreshes', 'create_failures', 'fallbacks', 'prompt_tokens', 'cached_tokens'] as $counter) {
+        $stats[$counter] = readMetric('gemini_cache:' . $counter);
+    }
+    $stats['cached_token_ratio'] = $stats['prompt_tokens'] > 0
+        ? round($stats['cached_tokens'] / $stats['prompt_tokens'], 4) : null;
+    return $stats;
+}
@@ -54,61 +54,276 @@ function sanitizeInput(string $input): string {
 }
 
 
+/**
+ * Get the private data directory (AIOFC_DATA_DIR lets test servers point at an isolated copy)
+ */
+function getDataDir(): string {
+    return getenv('AIOFC_DATA_DIR') ?: __DIR__ . '/../../data';
+}
+
+
+/**
+ * Pragma profiles applied to every SQLite connection (select with AIOFC_DB_PROFILE,
+ * override single pragmas with AIOFC_DB_PRAGMAS, e.g. "cache_size=-64000,mmap_size=0")
+ */
+const DB_PROFILES = [
+    // WAL lets dashboard and page reads run while a chat turn is writing
+    'wal' => [
+        'busy_timeout' => '5000',
+        'journal_mode' => 'WAL',
+        'synchronous' => 'NORMAL',
+        'cache_size' => '-16000',
+        'mmap_size' => '268435456',
+        'temp_store' => 'MEMORY',
+        // Off: conversations may exist for users without a patients row
+        'foreign_keys' => 'OFF'
+    ],
+    // Same durability on power loss as the rollback journal, at the cost of an fsync per commit
+    'wal-full' => [
+        'busy_timeout' => '5000',
+        'journal_mode' => 'WAL',
+        'synchronous' => 'FULL',
+        'cache_size' => '-16000',
+        'mmap_size' => '268435456',
+        'temp_store' => 'MEMORY',
+        'foreign_keys' => 'OFF'
+    ],
+    // Previous behaviour: rollback journal, SQLite defaults
+    'rollback' => [
+        'busy_timeout' => '5000',
+        'journal_mode' => 'DELETE',
+        'synchronous' => 'FULL',
+        'cache_size' => '-2000',
+        'mmap_size' => '0',
+        'temp_store' => 'DEFAULT',
+        'foreign_keys' => 'OFF'
+    ]
+];
+
+
+/**
+ * Get the pragmas of the configured connection profile
+ */
+function getDbPragmas(): array {
+    static $pragmas = null;
+    if ($pragmas !== null) return $pragmas;
+    
+    $profile = getenv('AIOFC_DB_PROFILE') ?: 'wal';
+    $pragmas = DB_PROFILES[$profile] ?? DB_PROFILES['wal'];
+    foreach (array_filter(explode(',', getenv('AIOFC_DB_PRAGMAS') ?: '')) as $override) {
+        [$name, $value] = array_map('trim', explode('=', $override, 2)) + [1 => ''];
+        // Only known pragmas with plain values, since they are interpolated into SQL
+        if (isset($pragmas[$name]) && preg_match('/^-?\w+$/', $value)) {
+            $pragmas[$name] = $value;
+        }
+    }
+    return $pragmas;
+}
+
+
+/**
+ * Pragmas that SQLite keeps per database file, so they are set for attached schemas too
+ */
+const DB_SCHEMA_PRAGMAS = ['journal_mode', 'synchronous', 'cache_size', 'mmap_size'];
+
+
+/**
+ * Apply the connection profile to a PDO or SQLite3 handle and the given schemas
+ */
+function applyDbProfile(PDO|SQLite3 $db, array $schemas = ['main']): void {
+    foreach (getDbPragmas() as $name => $value) {
+        foreach (in_array($name, DB_SCHEMA_PRAGMAS, true) ? $schemas : ['main'] as $schema) {
+            $db->exec("PRAGMA $schema.$name = $value");
+        }
+    }
+}
+
+
+/**
+ * Open a SQLite3 connection with the connection profile applied
+ */
+function openSqlite(string $path): SQLite3 {
+    $db = new SQLite3($path);
+    applyDbProfile($db);
+    return $db;
+}
+
+
+/**
+ * Get authentication database connection
+ */
+function getAuthDb(): SQLite3 {
+    return openSqlite(getDataDir() . '/auth.db');
+}
+
+
+/**
+ * Seconds between session activity writes (AIOFC_SESSION_TOUCH_SECONDS, 0 = write on every request)
+ */
+function getSessionTouchInterval(): int {
+    $seconds = getenv('AIOFC_SESSION_TOUCH_SECONDS');
+    return $seconds === false || $seconds === '' ? 300 : max(0, (int)$seconds);
+}
+
+
+/**
+ * Whether APCu is loaded and enabled (it is not under php -S without apc.enable_cli)
+ */
+function apcuAvailable(): bool {
+    static $available = null;
+    return $available ??= function_exists('apcu_enabled') && apcu_enabled();
+}
+
+
+/**
+ * Add to a monitoring counter shared by all PHP workers of this server (no-op without APCu)
+ */
+function countMetric(string $name, int $by = 1): void {
+    if (!apcuAvailable()) return;
+    $key = 'aiofc:' . $name;
+    if (apcu_inc($key, $by) === false) apcu_add($key, $by);
+}
+
+
+/**
+ * Current value of a monitoring counter (0 without APCu)
+ */
+function readMetric(string $name): int {
+    return apcuAvailable() ? (int)(apcu_fetch('aiofc:' . $name) ?: 0) : 0;
+}
+
+
+/**
+ * Seconds a validated token is served from the APCu session cache (AIOFC_SESSION_CACHE_SECONDS,
+ * 0 = off); off as well when APCu is not available
+ */
+function getSessionCacheTtl(): int {
+    static $ttl = null;
+    if ($ttl !== null) return $ttl;
+    
+    $seconds = getenv('AIOFC_SESSION_CACHE_SECONDS');
+    $ttl = $seconds === false || $seconds === '' ? 60 : max(0, (int)$seconds);
+    if (!apcuAvailable()) $ttl = 0;
+    return $ttl;
+}
+
+
+/**
+ * APCu key for a session token: hashed so tokens never sit in shared memory, and scoped
+ * to the data directory so servers on different data sets cannot see each other's sessions
+ */
+function sessionCacheKey(string $token): string {
+    return 'aiofc:session:' . hash('sha256', getDataDir() . "\0" . $token);
+}
+
+
+/**
+ * Increment one of the session cache counters (hits, misses, invalidations)
+ */
+function countSessionCache(string $counter): void {
+    countMetric('session_cache:' . $counter);
+}
+
+
+/**
+ * Drop a token from the session cache; call wherever a session row is deleted
+ */
+function forgetSessionToken(string $token): void {
+    if (getSessionCacheTtl() === 0 || empty($token)) return;
+    apcu_delete(sessionCacheKey($token));
+    countSessionCache('invalidations');
+}
+
+
+/**
+ * Session cache counters for monitoring (shared by all PHP workers of this server)
+ */
+function getSessionCacheStats(): array {
+    $ttl = getSessionCacheTtl();
+    $stats = ['enabled' => $ttl > 0, 'ttl_seconds' => $ttl, 'hits' => 0, 'misses' => 0, 'invalidations' => 0];
+    if ($ttl > 0) {
+        foreach (['hits', 'misses', 'invalidations'] as $counter) {
+            $stats[$counter] = readMetric('session_cache:' . $counter);
+        }
+    }
+    $lookups = $stats['hits'] + $stats['misses'];
+    $stats['hit_ratio'] = $lookups > 0 ? round($stats['hits'] / $lookups, 4) : null;
+    return $stats;
+}
+
+
 /**
  * Validate session token and return user ID
  * @param string $token The session token to validate
  * @param bool $refresh Whether to refresh the session expiry (adds 32 days)
+ *
+ * last_activity/expires_at are only rewritten once they are older than
+ * getSessionTouchInterval(), so repeat requests stay read-only on auth.db.
+ * Valid tokens are then cached in APCu for getSessionCacheTtl() seconds, so most
+ * requests skip auth.db entirely; activity writes wait until the entry expires.
  */
 function getUserIdFromToken(string $token, bool $refresh = false): ?string {
     if (empty($token)) return null;
     
-    $authDbPath = __DIR__ . '/../../data/auth.db';
+    $cacheTtl = getSessionCacheTtl();
+    if ($cacheTtl > 0) {
+        $cached = apcu_fetch(sessionCacheKey($token));
+        if (is_array($cached) && $cached['expires_at'] > time()) {
+            countSessionCache('hits');
+            return $cached['user_id'];
+        }
+        countSessionCache('misses');
+    }
+    
+    $authDbPath = getDataDir() . '/auth.db';
     if (!file_exists($authDbPath)) return null;
     
     try {
-        $db = new SQLite3($authDbPath);
-        $db->busyTimeout(5000);
+        $db = getAppDb();
         
-        // Check if token exists and is not expired
+        // Check if token exists and is not expired, and whether its activity is due for a write
         $stmt = $db->prepare("
-            SELECT user_id 
-            FROM sessions 
+            SELECT user_id, expires_at,
+                   last_activity IS NULL OR last_activity <= datetime('now', :touch_after) AS stale
+            FROM auth.sessions 
             WHERE token = :token 
             AND expires_at > datetime('now')
             LIMIT 1
         ");
-        $stmt->bindValue(':token', $token, SQLITE3_TEXT);
-        $result = $stmt->execute();
+        $stmt->execute(['token' => $token, 'touch_after' => '-' . getSessionTouchInterval() . ' seconds']);
+        $row = $stmt->fetch(PDO::FETCH_ASSOC);
+        $stmt->closeCursor();
         
-        if ($row = $result->fetchArray(SQLITE3_ASSOC)) {
-            $userId = $row['user_id'];
-            
-            if ($refresh) {
+        if ($row) {
+            $expiresAt = strtotime($row['expires_at'] . ' UTC');
+            if ($row['stale'] && $refresh) {
                 // Refresh session expiry to 32 days from now
                 $updateStmt = $db->prepare("
-                    UPDATE sessions 
+                    UPDATE auth.sessions 
                     SET last_activity = datetime('now'),
                         expires_at = datetime('now', '+32 days')
                     WHERE token = :token
                 ");
-                $updateStmt->bindValue(':token', $token, SQLITE3_TEXT);
-                $updateStmt->execute();
-            } else {
+                $updateStmt->execute(['token' => $token]);
+                $expiresAt = time() + 32 * 86400;
+            } elseif ($row['stale']) {
                 // Just update last_activity timestamp
                 $updateStmt = $db->prepare("
-                    UPDATE sessions 
+                    UPDATE auth.sessions 
                     SET last_activity = datetime('now') 
                     WHERE token = :token
                 ");
-                $updateStmt->bindValue(':token', $token, SQLITE3_TEXT);
-                $updateStmt->execute();
+                $updateStmt->execute(['token' => $token]);
             }
             
-            $db->close();
-            return $userId;
+            if ($cacheTtl > 0) {
+                // Never cache past the session's own expiry
+                apcu_store(sessionCacheKey($token), ['user_id' => $row['user_id'], 'expires_at' => $expiresAt],
+                           max(1, min($cacheTtl, $expiresAt - time())));
+            }
+            
+            return $row['user_id'];
         }
-        
-        $db->close();
     } catch (Exception $e) {
         // Log error if needed, return null for invalid session
     }
@@ -118,18 +333,30 @@ function getUserIdFromToken(string $token, bool $refresh = false): ?string {
 
 
 /**
- * Load credentials from external JSON file
+ * Rough token count of a text: about four characters per token, as Gemini counts English
+ */
+function estimateTokens(string $text): int {
+    return intdiv(strlen($text) + 3, 4);
+}
+
+
+/**
+ * Load credentials from external JSON file (AIOFC_* env vars override it, e.g. to use local stand-ins)
  */
 function loadCreds(): array {
     $credsPath = __DIR__ . '/../../../.creds.json';
     $creds = file_exists($credsPath) ? json_decode(file_get_contents($credsPath), true) : [];
     return [
-        'db_path' => __DIR__ . '/../../data/aioffice.db',
-        'gemini_api_key' => $creds['GOOGLE']['API_KEY'] ?? '',
+        'db_path' => getDataDir() . '/aioffice.db',
+        'gemini_api_key' => getenv('AIOFC_GEMINI_API_KEY') ?: ($creds['GOOGLE']['API_KEY'] ?? ''),
+        'gemini_base_url' => getenv('AIOFC_GEMINI_BASE_URL')
+            ?: ($creds['GOOGLE']['BASE_URL'] ?? 'https://generativelanguage.googleapis.com/v1beta'),
+        'gemini_model' => getenv('AIOFC_GEMINI_MODEL') ?: ($creds['GOOGLE']['MODEL'] ?? 'gemini-2.0-flash-exp'),
         'email_smtp_host' => $creds['smtp_host'] ?? '',
         'email_smtp_user' => $creds['smtp_user'] ?? '',
         'email_smtp_pass' => $creds['smtp_pass'] ?? '',
-        'email_from' => 'noreply@aioffice.com'
+        'email_from' => 'noreply@aioffice.com',
+        'email_send_cmd' => getenv('AIOFC_EMAIL_SEND') ?: ($creds['EMAIL_SEND_CMD'] ?? '/home/ace/bin/email-send')
     ];
 }
 
@@ -144,11 +371,19 @@ function checkAuth(): ?string {
 
 
 /**
- * Get application database connection
+ * Get the request's database connection: aioffice.db with auth.db attached as `auth`
+ *
+ * Opened once per request and shared by authentication and all application queries,
+ * so auth tables are addressed as auth.sessions, auth.users, ...
  */
 function getAppDb(): PDO {
-    $dbPath = __DIR__ . '/../../data/aioffice.db';
-    $db = new PDO('sqlite:' . $dbPath);
+    static $db = null;
+    if ($db !== null) return $db;
+    
+    $db = new PDO('sqlite:' . getDataDir() . '/aioffice.db');
     $db->setAttribute(PDO::ATTR_ERRMODE, PDO::ERRMODE_EXCEPTION);
+    $stmt = $db->prepare("ATTACH DATABASE ? AS auth");
+    $stmt->execute([getDataDir() . '/auth.db']);
+    applyDbProfile($db, ['main', 'auth']);
     return $db;
 }
\ No newline at end of file
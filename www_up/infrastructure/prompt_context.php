@@ -0,0 +1,213 @@
+<?php
+declare(strict_types=1);
+
+require_once __DIR__ . '/record_retrieval.php';
+
+
+/**
+ * Directory of prebuilt patient contexts (AIOFC_PROMPT_CONTEXT_CACHE=0 turns the cache off)
+ *
+ * The files hold medical records, so they live in the private data directory next to
+ * the databases, readable by the web server user only.
+ */
+function getPromptContextCacheDir(): ?string {
+    if (getenv('AIOFC_PROMPT_CONTEXT_CACHE') === '0') return null;
+    return getDataDir() . '/cache/prompt_context';
+}
+
+
+/**
+ * Content version of a patient's records and appointments (0 = never written)
+ *
+ * Bumped by triggers on every write to medical_records and appointments (migration 0008).
+ */
+function getPatientContextVersion(PDO $db, string $userId): int {
+    $stmt = $db->prepare("SELECT version FROM patient_context_versions WHERE user_id = ?");
+    $stmt->execute([$userId]);
+    $version = $stmt->fetchColumn();
+    $stmt->closeCursor();
+    return $version === false ? 0 : (int)$version;
+}
+
+
+/**
+ * Prompt template with the patient's medical records and appointments filled in
+ *
+ * What changes every turn (dates, conversation summary, record excerpts) lives in a separate
+ * template, rendered by renderTurnContext(), so this text stays the same until the patient's
+ * next write. A chart over getRecordsTokenBudget() keeps only its newest records within
+ * getRecentRecordsTokenBudget(), possibly none when the newest alone is larger; the rest
+ * reach Gemini as excerpts relevant to each question (record_retrieval.php), so the
+ * context stays within the budget however large the chart or any one record grows.
+ *
+ * Returns ['text' => string, 'recent_rowids' => rowids of the records kept, or null if all are].
+ */
+function buildPatientContext(PDO $db, string $userId, string $templatePath): array {
+    // Get patient's medical records
+    $stmt = $db->prepare("
+        SELECT rowid, record_title, record_type, record_date, content
+        FROM medical_records
+        WHERE user_id = ?
+        ORDER BY record_date DESC
+    ");
+    $stmt->execute([$userId]);
+
+    // Build medical records section, newest first, until the chart proves too large to send whole
+    $sections = [];
+    $tokens = 0;
+    while ($record = $stmt->fetch(PDO::FETCH_ASSOC)) {
+        $section = "=== {$record['record_title']} ({$record['record_type']}) - Date: {$record['record_date']} ===\n";
+        $section .= $record['content'] . "\n\n";
+        $tokens += estimateTokens($section);
+        $sections[] = ['rowid' => (int)$record['rowid'], 'text' => $section, 'tokens' => $tokens];
+        if ($tokens > getRecordsTokenBudget()) break;
+    }
+    $stmt->closeCursor();
+
+    $recent_rowids = null;
+    if ($tokens > getRecordsTokenBudget()) {
+        // Running totals, so this keeps the newest records that fit together
+        $sections = array_values(array_filter($sections, fn($s) => $s['tokens'] <= getRecentRecordsTokenBudget()));
+        $recent_rowids = array_column($sections, 'rowid');
+    }
+    $medical_records_text = implode('', array_column($sections, 'text'));
+    if ($recent_rowids !== null) {
+        $stmt = $db->prepare("SELECT COUNT(*) FROM medical_records WHERE user_id = ?");
+        $stmt->execute([$userId]);
+        $omitted = (int)$stmt->fetchColumn() - count($recent_rowids);
+        $medical_records_text .= "($omitted " . ($recent_rowids ? 'older ' : '') . "records are not shown in full. "
+                               . "Excerpts from them that are relevant to the patient's question are given with each message.)\n";
+    } elseif (empty($medical_records_text)) {
+        $medical_records_text = "No medical records available yet.\n";
+    }
+
+    // Get patient's appointments with notes
+    $stmt = $db->prepare("
+        SELECT appointment_date, appointment_time, doctor_name, appointment_type,
+               location, notes, status
+        FROM appointments
+        WHERE user_id = ?
+        ORDER BY appointment_date DESC, appointment_time DESC
+    ");
+    $stmt->execute([$userId]);
+
+    // Build appointments section
+    $appointments_text = "";
+    while ($appt = $stmt->fetch(PDO::FETCH_ASSOC)) {
+        $appointments_text .= "Date: {$appt['appointment_date']}";
+        if ($appt['appointment_time']) {
+            $appointments_text .= " at {$appt['appointment_time']}";
+        }
+        $appointments_text .= "\n";
+        $appointments_text .= "Doctor: {$appt['doctor_name']}\n";
+        if ($appt['appointment_type']) {
+            $appointments_text .= "Type: {$appt['appointment_type']}\n";
+        }
+        if ($appt['location']) {
+            $appointments_text .= "Location: {$appt['location']}\n";
+        }
+        $appointments_text .= "Status: {$appt['status']}\n";
+        if ($appt['notes']) {
+            $appointments_text .= "Doctor's Notes:\n{$appt['notes']}\n";
+        }
+        $appointments_text .= "---\n\n";
+    }
+    if (empty($appointments_text)) {
+        $appointments_text = "No appointment history available.\n";
+    }
+
+    $text = str_replace(
+        ['{{MEDICAL_RECORDS}}', '{{APPOINTMENTS}}'],
+        [$medical_records_text, $appointments_text],
+        file_get_contents($templatePath)
+    );
+    return ['text' => $text, 'recent_rowids' => $recent_rowids];
+}
+
+
+/**
+ * The patient's context, served from the cache while its version is current
+ *
+ * Cache files are named after the patient, the content version, the template's mtime
+ * and the record budgets, so a record/appointment write, a template edit or a budget
+ * change simply makes the next turn miss; the miss rebuilds, stores the new file and removes the patient's old ones.
+ * Returns what buildPatientContext() does.
+ */
+function getPatientContext(PDO $db, string $userId, string $templatePath): array {
+    $started = hrtime(true);
+    $dir = getPromptContextCacheDir();
+    if ($dir === null) return buildPatientContext($db, $userId, $templatePath);
+
+    $patientKey = hash('sha256', $userId);
+    // The record budgets decide which records are sent whole, so a change to them is a new context too
+    $variant = filemtime($templatePath) . '-' . getRecordsTokenBudget() . '-' . getRecentRecordsTokenBudget();
+    $path = "$dir/$patientKey-" . getPatientContextVersion($db, $userId) . "-$variant.json";
+
+    $context = is_file($path) ? json_decode((string)file_get_contents($path), true) : null;
+    if (is_array($context)) {
+        countMetric('prompt_context:hits');
+        countMetric('prompt_context:hit_us', intdiv(hrtime(true) - $started, 1000));
+        countMetric('prompt_context:bytes_reused', strlen($context['text']));
+        return $context;
+    }
+
+    // Version and rows from one read snapshot, so a concurrent write cannot be stored under the old version
+    $db->beginTransaction();
+    try {
+        $version = getPatientContextVersion($db, $userId);
+        $context = buildPatientContext($db, $userId, $templatePath);
+    } finally {
+        $db->commit();
+    }
+    $path = "$dir/$patientKey-$version-$variant.json";
+
+    // NOTE: the cache is an optimization; failing to write it must never fail the turn
+    if (is_dir($dir) || @mkdir($dir, 0700, true)) {
+        $tmp = @tempnam($dir, 'tmp');
+        if ($tmp !== false && @file_put_contents($tmp, json_encode($context)) !== false && @rename($tmp, $path)) {
+            foreach (glob("$dir/$patientKey-*") ?: [] as $old) {
+                if ($old !== $path) @unlink($old);
+            }
+        } elseif ($tmp !== false) {
+            @unlink($tmp);
+        }
+    }
+
+    countMetric('prompt_context:misses');
+    countMetric('prompt_context:build_us', intdiv(hrtime(true) - $started, 1000));
+    return $context;
+}
+
+
+/**
+ * The part of the prompt that changes every turn: dates, record excerpts and the summary of older messages
+ *
+ * The messages themselves are sent as the request's contents, not repeated here.
+ */
+function renderTurnContext(string $templatePath, string $local_datetime, string $timezone, ?string $summary, string $excerpts = ''): string {
+    return str_replace(
+        ['{{UTC_DATETIME}}', '{{LOCAL_DATETIME}}', '{{TIMEZONE}}', '{{RECORD_EXCERPTS}}', '{{CONVERSATION_SUMMARY}}'],
+        [gmdate('Y-m-d H:i:s') . ' UTC', $local_datetime ?: 'Not provided', $timezone, $excerpts,
+         $summary ?? 'None: the whole conversation follows.'],
+        file_get_contents($templatePath)
+    );
+}
+
+
+/**
+ * Prompt context cache counters for monitoring (shared by all PHP workers of this server)
+ */
+function getPromptContextStats(): array {
+    $hits = readMetric('prompt_context:hits');
+    $misses = readMetric('prompt_context:misses');
+    return [
+        'enabled' => getPromptContextCacheDir() !== null,
+        'hits' => $hits,
+        'misses' => $misses,
+        'hit_ratio' => $hits + $misses > 0 ? round($hits / ($hits + $misses), 4) : null,
+        // Per turn: what a miss costs, what a hit costs instead, and the context a hit did not rebuild
+        'avg_build_ms' => $misses > 0 ? round(readMetric('prompt_context:build_us') / $misses / 1000, 3) : null,
+        'avg_hit_ms' => $hits > 0 ? round(readMetric('prompt_context:hit_us') / $hits / 1000, 3) : null,
+        'avg_bytes_saved' => $hits > 0 ? intdiv(readMetric('prompt_context:bytes_reused'), $hits) : null
+    ];
+}
@@ -0,0 +1,147 @@
+<?php
+declare(strict_types=1);
+
+require_once __DIR__ . '/lib.php';
+
+
+/**
+ * Largest chart sent to Gemini whole, in tokens (AIOFC_CHAT_RECORDS_TOKENS); larger
+ * charts send their newest records whole and excerpts of the others
+ */
+function getRecordsTokenBudget(): int {
+    $tokens = getenv('AIOFC_CHAT_RECORDS_TOKENS');
+    return $tokens === false || $tokens === '' ? 16000 : max(1000, (int)$tokens);
+}
+
+
+/**
+ * Tokens of newest records always sent whole when the chart is too large (AIOFC_CHAT_RECENT_RECORDS_TOKENS)
+ */
+function getRecentRecordsTokenBudget(): int {
+    $tokens = getenv('AIOFC_CHAT_RECENT_RECORDS_TOKENS');
+    return $tokens === false || $tokens === '' ? 6000 : max(0, (int)$tokens);
+}
+
+
+/**
+ * Record chunks retrieved per turn for a large chart (AIOFC_CHAT_RECORD_CHUNKS)
+ */
+function getRecordChunkLimit(): int {
+    $chunks = getenv('AIOFC_CHAT_RECORD_CHUNKS');
+    return $chunks === false || $chunks === '' ? 8 : max(1, (int)$chunks);
+}
+
+
+/**
+ * Words of a question that say nothing about which record it is about
+ */
+const RETRIEVAL_STOPWORDS = [
+    'a', 'about', 'all', 'am', 'an', 'and', 'any', 'are', 'as', 'at', 'be', 'been', 'but', 'by', 'can',
+    'could', 'did', 'do', 'does', 'for', 'from', 'had', 'has', 'have', 'how', 'i', 'if', 'in', 'is', 'it',
+    'its', 'me', 'my', 'of', 'on', 'or', 'please', 'should', 'so', 'tell', 'that', 'the', 'their', 'them',
+    'there', 'these', 'this', 'to', 'was', 'were', 'what', 'when', 'which', 'who', 'why', 'will', 'with',
+    'would', 'you', 'your'
+];
+
+
+/**
+ * FTS5 MATCH expression for one patient's record chunks: the owner token (as in
+ * pg_main/api_search.php) AND any of the question's words, so bm25() ranks chunks by
+ * how many of the rarer words they contain rather than requiring all of them.
+ */
+function recordQueryExpression(string $userId, string $question): ?string {
+    preg_match_all('/[\p{L}\p{N}]+/u', mb_strtolower($question), $matches);
+    $words = array_values(array_unique(array_diff($matches[0], RETRIEVAL_STOPWORDS)));
+    if (!$words) return null;
+    $phrases = array_map(fn($w) => '"' . $w . '"', array_slice($words, 0, 16));
+    return 'owner : "' . strtoupper(bin2hex($userId)) . '" AND content : (' . implode(' OR ', $phrases) . ')';
+}
+
+
+/**
+ * Prompt section with the chunks of the patient's records most relevant to the question
+ *
+ * BM25 over medical_record_chunks_fts (migration 0010), skipping the records the prompt
+ * already holds whole. Chunks overlap, so neighbouring chunks of one record are joined,
+ * and passages are cut back to whole words. Returns '' when nothing matches.
+ */
+function retrieveRecordExcerpts(PDO $db, string $userId, string $question, array $excludeRowids): string {
+    $started = hrtime(true);
+    $expression = recordQueryExpression($userId, $question);
+    if ($expression === null) return '';
+
+    $stmt = $db->prepare("
+        SELECT
+            r.rowid AS record_rowid,
+            r.record_title,
+            r.record_type,
+            r.record_date,
+            c.chunk_start,
+            length(r.content) AS content_length,
+            substr(r.content, c.chunk_start + 1, c.chunk_length) AS excerpt
+        FROM medical_record_chunks_fts
+        JOIN medical_record_chunks c ON c.chunk_id = medical_record_chunks_fts.rowid
+        JOIN medical_records r ON r.rowid = c.record_rowid
+        WHERE medical_record_chunks_fts MATCH :expression
+        AND r.user_id = :user_id
+        AND r.rowid NOT IN (SELECT value FROM json_each(:exclude))
+        ORDER BY rank
+        LIMIT :limit
+    ");
+    $stmt->execute(['expression' => $expression, 'user_id' => $userId,
+                    'exclude' => json_encode(array_values($excludeRowids)), 'limit' => getRecordChunkLimit()]);
+    $chunks = $stmt->fetchAll(PDO::FETCH_ASSOC);
+
+    // Newest record first, each record's chunks in text order
+    usort($chunks, fn($a, $b) => [$b['record_date'], $a['record_rowid'], $a['chunk_start']]
+                                 <=> [$a['record_date'], $b['record_rowid'], $b['chunk_start']]);
+    // Join overlapping chunks of one record into a single passage
+    $passages = [];
+    foreach ($chunks as $chunk) {
+        $excerpt = $chunk['excerpt'] ?? '';
+        $start = (int)$chunk['chunk_start'];
+        $last = count($passages) - 1;
+        if ($last >= 0 && $passages[$last]['record_rowid'] === $chunk['record_rowid'] && $start <= $passages[$last]['end']) {
+            $passages[$last]['text'] .= mb_substr($excerpt, $passages[$last]['end'] - $start);
+            $passages[$last]['end'] = max($passages[$last]['end'], $start + mb_strlen($excerpt));
+        } else {
+            $passages[] = $chunk + ['start' => $start, 'text' => $excerpt, 'end' => $start + mb_strlen($excerpt)];
+        }
+    }
+
+    $text = '';
+    $record = null;
+    foreach ($passages as $passage) {
+        $excerpt = $passage['text'];
+        if ($passage['start'] > 0) $excerpt = '…' . preg_replace('/^\S*\s+/u', '', $excerpt, 1);
+        if ($passage['end'] < (int)$passage['content_length']) $excerpt = preg_replace('/\s+\S*$/u', '', $excerpt) . '…';
+        if ($passage['record_rowid'] !== $record) {
+            $text .= "--- {$passage['record_title']} ({$passage['record_type']}) - Date: {$passage['record_date']} ---\n";
+        }
+        $text .= $excerpt . "\n\n";
+        $record = $passage['record_rowid'];
+    }
+
+    countMetric('record_retrieval:lookups');
+    countMetric('record_retrieval:chunks', count($chunks));
+    countMetric('record_retrieval:tokens', estimateTokens($text));
+    countMetric('record_retrieval:us', intdiv(hrtime(true) - $started, 1000));
+    return $text === '' ? '' : "=== RELEVANT EXCERPTS FROM OLDER RECORDS ===\n$text";
+}
+
+
+/**
+ * Record retrieval counters for monitoring (shared by all PHP workers of this server)
+ */
+function getRecordRetrievalStats(): array {
+    $lookups = readMetric('record_retrieval:lookups');
+    return [
+        'records_token_budget' => getRecordsTokenBudget(),
+        'recent_records_token_budget' => getRecentRecordsTokenBudget(),
+        'chunk_limit' => getRecordChunkLimit(),
+        'lookups' => $lookups,
+        'avg_chunks' => $lookups > 0 ? round(readMetric('record_retrieval:chunks') / $lookups, 2) : null,
+        'avg_tokens' => $lookups > 0 ? intdiv(readMetric('record_retrieval:tokens'), $lookups) : null,
+        'avg_ms' => $lookups > 0 ? round(readMetric('record_retrieval:us') / $lookups / 1000, 3) : null
+    ];
+}
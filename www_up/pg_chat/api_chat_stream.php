@@ -0,0 +1,141 @@
+<?php
+require_once '../infrastructure/lib.php';
+require_once '../infrastructure/chat_turn.php';
+$started = hrtime(true);
+$user_id = checkAuth();
+if (!$user_id) {
+    http_response_code(401);
+    echo json_encode(['success' => false, 'error' => 'Unauthorized']);
+    exit;
+}
+
+// Errors before the stream starts are answered as in api_chat.php; the stream itself is text/event-stream
+header('Content-Type: application/json');
+
+if ($_SERVER['REQUEST_METHOD'] !== 'POST') {
+    http_response_code(405);
+    echo json_encode(['success' => false, 'error' => 'Method not allowed']);
+    exit;
+}
+
+$input = json_decode(file_get_contents('php://input'), true);
+$message = $input['message'] ?? '';
+$conversation_id = $input['conversation_id'] ?? null;
+$local_datetime = $input['local_datetime'] ?? '';
+$timezone = $input['timezone'] ?? 'UTC';
+
+if (empty($message)) {
+    echo json_encode(['success' => false, 'error' => 'Message is required']);
+    exit;
+}
+
+/**
+ * Send one Server-Sent Event; false once the patient has gone away
+ */
+function sendEvent(string $event, array $data): bool {
+    echo "event: $event\ndata: " . json_encode($data) . "\n\n";
+    flush();
+    return !connection_aborted();
+}
+
+$db = getAppDb();
+
+try {
+    $turn = startChatTurn($db, $user_id, $message, $conversation_id);
+    if ($turn === null) {
+        echo json_encode(['success' => false, 'error' => 'Conversation not found']);
+        exit;
+    }
+    $conversation_id = $turn['conversation_id'];
+
+    $config = loadCreds();
+    if (empty($config['gemini_api_key'])) {
+        error_log('Gemini API key is empty or not configured');
+        throw new Exception('API key not configured');
+    }
+
+    header('Content-Type: text/event-stream');
+    header('Cache-Control: no-cache');
+    header('X-Accel-Buffering: no');  // NOTE: a proxy (nginx) would otherwise buffer the whole stream
+    while (ob_get_level() > 0) ob_end_flush();
+    // Keep running when the patient leaves, to store what was generated so far
+    ignore_user_abort(true);
+    sendEvent('start', [
+        'conversation_id' => $conversation_id,
+        'title' => $turn['title'],
+        'user_message_id' => $turn['message_id']
+    ]);
+
+    $prompt = prepareChatTurn($db, $config, $user_id, $conversation_id, $message, $local_datetime, $timezone, __DIR__);
+    $ai_response = '';
+    $first_token = null;
+    $connected = true;
+    $relay = function (string $text) use (&$ai_response, &$first_token, &$connected): bool {
+        $first_token ??= hrtime(true);
+        $ai_response .= $text;
+        $connected = sendEvent('chunk', ['text' => $text]);
+        return $connected;
+    };
+
+    $stream_path = "models/{$config['gemini_model']}:streamGenerateContent";
+    $gemini_started = hrtime(true);
+    [$http_code, $last_event, $gemini_response, $completed] = geminiStreamRequest($config, $stream_path,
+        buildGeminiRequest($prompt['history'], $prompt['context'], $prompt['turn_context'], $prompt['cached_content']), $relay);
+
+    if ($prompt['cached_content'] !== null && in_array($http_code, [400, 403, 404], true)) {
+        // Refused before any text was sent, so the turn can still be answered inline
+        error_log("Gemini refused cachedContent {$prompt['cached_content']}: HTTP $http_code");
+        forgetGeminiCachedContent($user_id, $prompt['cached_content']);
+        $gemini_started = hrtime(true);
+        [$http_code, $last_event, $gemini_response, $completed] = geminiStreamRequest($config, $stream_path,
+            buildGeminiRequest($prompt['history'], $prompt['context'], $prompt['turn_context'], null), $relay);
+    }
+
+    countMetric('chat_stream:turns');
+    if ($first_token !== null) {
+        countMetric('chat_stream:first_tokens');
+        countMetric('chat_stream:first_token_us', intdiv($first_token - $started, 1000));
+        countMetric('chat_stream:gemini_first_token_us', intdiv($first_token - $gemini_started, 1000));
+    }
+
+    if ($http_code !== 200) {
+        countMetric('chat_stream:failures');
+        error_log('Gemini API HTTP code: ' . $http_code);
+        error_log('Gemini API response: ' . $gemini_response);
+        throw new Exception('Failed to get response from Gemini API: HTTP ' . $http_code);
+    }
+
+    countGeminiUsage($last_event);
+    if (!$completed) {
+        // Patient gone or stream broken: keep what was said, marked as cut short
+        countMetric($connected ? 'chat_stream:failures' : 'chat_stream:disconnects');
+        $ai_response = ltrim($ai_response . "\n\n" . CHAT_INTERRUPTED_MARKER);
+    } elseif ($ai_response === '') {
+        $ai_response = 'I apologize, but I was unable to generate a response. Please try again.';
+    }
+
+    $response_id = finishChatTurn($db, $conversation_id, $ai_response);
+    countMetric('chat_stream:total_us', intdiv(hrtime(true) - $started, 1000));
+
+    sendEvent('done', [
+        'response' => $ai_response,
+        'ai_message_id' => $response_id,
+        'interrupted' => !$completed
+    ]);
+
+} catch (Exception $e) {
+    if ($db->inTransaction()) $db->rollBack();
+    error_log('Chat stream API error: ' . $e->getMessage());
+    error_log('Chat stream API trace: ' . $e->getTraceAsString());
+
+    $error = [
+        'success' => false,
+        'error' => 'An error occurred while processing your request',
+        'debug' => $e->getMessage()
+    ];
+    if (headers_sent()) {
+        sendEvent('error', $error);
+    } else {
+        echo json_encode($error);
+    }
+}
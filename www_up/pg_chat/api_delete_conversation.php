@@ -40,10 +40,11 @@ try {
         exit;
     }
     
-    // Soft delete the conversation by setting deleted_flag = 1
+    // Soft delete the conversation by setting deleted_flag = 1; deleted_at starts the archive retention window
     $stmt = $db->prepare("
         UPDATE conversations 
         SET deleted_flag = 1,
+            deleted_at = CURRENT_TIMESTAMP,
             updated_at = CURRENT_TIMESTAMP
         WHERE conversation_id = ? AND user_id = ?
     ");
@@ -33,22 +33,6 @@ if ($action === 'delete' && empty($message_id)) {
 $db = getAppDb();
 
 try {
-    // First, ensure the deleted column exists
-    $stmt = $db->query("PRAGMA table_info(chat_messages)");
-    $columns = $stmt->fetchAll(PDO::FETCH_ASSOC);
-    $hasDeletedColumn = false;
-    foreach ($columns as $col) {
-        if ($col['name'] === 'deleted') {
-            $hasDeletedColumn = true;
-            break;
-        }
-    }
-    
-    if (!$hasDeletedColumn) {
-        // Add the deleted column if it doesn't exist
-        $db->exec("ALTER TABLE chat_messages ADD COLUMN deleted INTEGER DEFAULT 0");
-    }
-    
     if ($action === 'clear') {
         // Verify conversation belongs to user and mark all messages as deleted
         $stmt = $db->prepare("
@@ -64,19 +48,29 @@ try {
             exit;
         }
         
-        // Mark all messages in conversation as deleted
+        // Mark all messages in conversation as deleted and reset its summary columns;
+        // messages deleted earlier keep their deleted_at
+        $db->beginTransaction();
         $stmt = $db->prepare("
             UPDATE chat_messages 
-            SET deleted = 1 
+            SET deleted = 1, deleted_at = CURRENT_TIMESTAMP 
+            WHERE conversation_id = ? AND (deleted = 0 OR deleted IS NULL)
+        ");
+        $stmt->execute([$conversation_id]);
+        
+        $stmt = $db->prepare("
+            UPDATE conversations 
+            SET last_message_at = NULL, message_count = 0 
             WHERE conversation_id = ?
         ");
         $stmt->execute([$conversation_id]);
+        $db->commit();
         
         echo json_encode(['success' => true, 'action' => 'cleared']);
     } else {
         // Delete single message - verify it belongs to user's conversation
         $stmt = $db->prepare("
-            SELECT c.user_id 
+            SELECT c.conversation_id 
             FROM chat_messages m
             JOIN conversations c ON m.conversation_id = c.conversation_id
             WHERE m.message_id = ? AND c.user_id = ?
@@ -89,18 +83,37 @@ try {
             exit;
         }
         
-        // Mark message as deleted
+        // Mark message as deleted and recount the conversation from its remaining messages;
+        // an already deleted message keeps its deleted_at, so its archive retention is not restarted
+        $db->beginTransaction();
         $stmt = $db->prepare("
             UPDATE chat_messages 
-            SET deleted = 1 
+            SET deleted = 1, deleted_at = CURRENT_TIMESTAMP 
             WHERE message_id = ?
+            AND (deleted = 0 OR deleted IS NULL)
         ");
         $stmt->execute([$message_id]);
         
+        $stmt = $db->prepare("
+            UPDATE conversations 
+            SET last_message_at = (
+                    SELECT MAX(timestamp) FROM chat_messages 
+                    WHERE conversation_id = :conversation_id AND (deleted = 0 OR deleted IS NULL)
+                ),
+                message_count = (
+                    SELECT COUNT(*) FROM chat_messages 
+                    WHERE conversation_id = :conversation_id AND (deleted = 0 OR deleted IS NULL)
+                )
+            WHERE conversation_id = :conversation_id
+        ");
+        $stmt->execute(['conversation_id' => $result['conversation_id']]);
+        $db->commit();
+        
         echo json_encode(['success' => true, 'action' => 'deleted']);
     }
     
 } catch (Exception $e) {
+    if ($db->inTransaction()) $db->rollBack();
     error_log('Delete message API error: ' . $e->getMessage());
     echo json_encode([
         'success' => false,
@@ -10,6 +10,12 @@ if (!$user_id) {
 header('Content-Type: application/json');
 
 $conversation_id = $_GET['id'] ?? '';
+// Keyset cursors: "<timestamp>|<rowid>" of the oldest (before) or newest (after) message the client
+// already has, as before_cursor/after_cursor returned them. They are not looked up again, so a
+// cursor message archived or deleted since still marks its place.
+$before = $_GET['before'] ?? '';
+$after = $_GET['after'] ?? '';
+$limit = min(max((int)($_GET['limit'] ?? 50), 1), 200);
 
 if (empty($conversation_id)) {
     echo json_encode(['success' => false, 'error' => 'Conversation ID is required']);
@@ -21,7 +27,7 @@ $db = getAppDb();
 try {
     // Get conversation details
     $stmt = $db->prepare("
-        SELECT title, created_at, updated_at 
+        SELECT title, created_at, updated_at, message_count 
         FROM conversations 
         WHERE conversation_id = ? AND user_id = ?
     ");
@@ -33,23 +39,79 @@ try {
         exit;
     }
     
-    // Get messages (excluding deleted)
-    $stmt = $db->prepare("
-        SELECT message_id, role, message, timestamp 
-        FROM chat_messages 
-        WHERE conversation_id = ?
-        AND (deleted = 0 OR deleted IS NULL)
-        ORDER BY timestamp ASC
-    ");
-    $stmt->execute([$conversation_id]);
-    $messages = $stmt->fetchAll(PDO::FETCH_ASSOC);
+    // A cursor is a position: (timestamp, rowid) orders messages as they were inserted,
+    // even within one second, and is what idx_chat_messages_conversation_time stores
+    $cursor = null;
+    if ($before !== '' || $after !== '') {
+        $cursor = array_pad(explode('|', $before !== '' ? $before : $after, 2), 2, '');
+        
+        if ($cursor[0] === '' || !ctype_digit($cursor[1])) {
+            echo json_encode(['success' => false, 'error' => 'Invalid cursor']);
+            exit;
+        }
+    }
+    
+    // One page of messages (excluding deleted), plus one row to tell whether more follow
+    if ($after !== '') {
+        $stmt = $db->prepare("
+            SELECT message_id, role, message, timestamp, rowid
+            FROM chat_messages 
+            WHERE conversation_id = ?
+            AND (deleted = 0 OR deleted IS NULL)
+            AND (timestamp, rowid) > (?, ?)
+            ORDER BY timestamp ASC, rowid ASC
+            LIMIT ?
+        ");
+        $stmt->execute([$conversation_id, $cursor[0], $cursor[1], $limit + 1]);
+        $messages = $stmt->fetchAll(PDO::FETCH_ASSOC);
+        $has_more_after = count($messages) > $limit;
+        $messages = array_slice($messages, 0, $limit);
+        $has_more_before = true;
+    } else {
+        // The page just older than `before`, or the newest page when there is no cursor
+        if ($cursor) {
+            $stmt = $db->prepare("
+                SELECT message_id, role, message, timestamp, rowid
+                FROM chat_messages 
+                WHERE conversation_id = ?
+                AND (deleted = 0 OR deleted IS NULL)
+                AND (timestamp, rowid) < (?, ?)
+                ORDER BY timestamp DESC, rowid DESC
+                LIMIT ?
+            ");
+            $stmt->execute([$conversation_id, $cursor[0], $cursor[1], $limit + 1]);
+        } else {
+            $stmt = $db->prepare("
+                SELECT message_id, role, message, timestamp, rowid
+                FROM chat_messages 
+                WHERE conversation_id = ?
+                AND (deleted = 0 OR deleted IS NULL)
+                ORDER BY timestamp DESC, rowid DESC
+                LIMIT ?
+            ");
+            $stmt->execute([$conversation_id, $limit + 1]);
+        }
+        $messages = $stmt->fetchAll(PDO::FETCH_ASSOC);
+        $has_more_before = count($messages) > $limit;
+        $messages = array_reverse(array_slice($messages, 0, $limit));
+        $has_more_after = $cursor !== null;
+    }
+    
+    // Cursors of this page's oldest and newest messages, for the next before=/after= request
+    $positions = array_map(fn($msg) => "{$msg['timestamp']}|{$msg['rowid']}", $messages);
+    $messages = array_map(fn($msg) => array_diff_key($msg, ['rowid' => true]), $messages);
     
     echo json_encode([
         'success' => true,
         'title' => $conversation['title'],
         'created_at' => $conversation['created_at'],
         'updated_at' => $conversation['updated_at'],
-        'messages' => $messages
+        'message_count' => (int)$conversation['message_count'],
+        'messages' => $messages,
+        'has_more_before' => $has_more_before,
+        'has_more_after' => $has_more_after,
+        'before_cursor' => $positions[0] ?? null,
+        'after_cursor' => $positions[count($positions) - 1] ?? null
     ]);
     
 } catch (Exception $e) {
@@ -0,0 +1,83 @@
+<?php
+require_once '../infrastructure/lib.php';
+$user_id = checkAuth();
+if (!$user_id) {
+    http_response_code(401);
+    echo json_encode(['success' => false, 'error' => 'Unauthorized']);
+    exit;
+}
+
+header('Content-Type: application/json');
+
+// Keyset cursor: "<last activity>|<rowid>" of the last conversation on the previous page, as
+// next_cursor returned it. It is not looked up again, so it stays put when that conversation
+// gets a new message and moves to the top.
+$cursor = $_GET['cursor'] ?? '';
+$limit = min(max((int)($_GET['limit'] ?? 30), 1), 100);
+
+$db = getAppDb();
+
+try {
+    if ($cursor !== '') {
+        [$activity, $rowid] = array_pad(explode('|', $cursor, 2), 2, '');
+        if ($activity === '' || !ctype_digit($rowid)) {
+            echo json_encode(['success' => false, 'error' => 'Invalid cursor']);
+            exit;
+        }
+
+        // The plain <= lets SQLite range-scan idx_conversations_user_last_activity; the row value breaks ties
+        $stmt = $db->prepare("
+            SELECT conversation_id, title, created_at, updated_at, last_message_at, message_count,
+                   COALESCE(last_message_at, updated_at) AS last_activity, rowid
+            FROM conversations
+            WHERE user_id = ?
+            AND (deleted_flag = 0 OR deleted_flag IS NULL)
+            AND COALESCE(last_message_at, updated_at) <= ?
+            AND (COALESCE(last_message_at, updated_at), rowid) < (?, ?)
+            ORDER BY COALESCE(last_message_at, updated_at) DESC, rowid DESC
+            LIMIT ?
+        ");
+        $stmt->execute([$user_id, $activity, $activity, (int)$rowid, $limit + 1]);
+    } else {
+        $stmt = $db->prepare("
+            SELECT conversation_id, title, created_at, updated_at, last_message_at, message_count,
+                   COALESCE(last_message_at, updated_at) AS last_activity, rowid
+            FROM conversations
+            WHERE user_id = ?
+            AND (deleted_flag = 0 OR deleted_flag IS NULL)
+            ORDER BY COALESCE(last_message_at, updated_at) DESC, rowid DESC
+            LIMIT ?
+        ");
+        $stmt->execute([$user_id, $limit + 1]);
+    }
+    $rows = $stmt->fetchAll(PDO::FETCH_ASSOC);
+
+    $rows_shown = array_slice($rows, 0, $limit);
+    $last = end($rows_shown);
+    $conversations = [];
+    foreach ($rows_shown as $row) {
+        $conversations[] = [
+            'conversation_id' => $row['conversation_id'],
+            'title' => $row['title'],
+            'updated_at' => $row['updated_at'],
+            'last_message_at' => $row['last_message_at'],
+            'message_count' => (int)$row['message_count'],
+            // Same label the server-rendered first page shows
+            'date_label' => date('M j, g:i A', strtotime($row['updated_at']))
+        ];
+    }
+
+    echo json_encode([
+        'success' => true,
+        'conversations' => $conversations,
+        'has_more' => count($rows) > $limit,
+        'next_cursor' => count($rows) > $limit ? "{$last['last_activity']}|{$last['rowid']}" : null
+    ]);
+
+} catch (Exception $e) {
+    error_log('List conversations error: ' . $e->getMessage());
+    echo json_encode([
+        'success' => false,
+        'error' => 'An error occurred while loading conversations'
+    ]);
+}
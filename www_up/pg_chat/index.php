@@ -2,6 +2,9 @@
 require_once '../infrastructure/lib.php';
 require_once '../infrastructure/include.php';
 
+// Conversations rendered with the page; keep in sync with the default limit of api_list_conversations.php
+const SIDEBAR_PAGE_SIZE = 30;
+
 // Check for mock mode
 $mock_mode = isset($_GET['mock']) && $_GET['mock'] === 'true';
 
@@ -20,30 +23,29 @@ if (!$mock_mode) {
     $patient = $stmt->fetch(PDO::FETCH_ASSOC);
     $patient_name = $patient ? $patient['full_name'] : 'Patient';
     
-    // Get all non-deleted conversations for this user, sorted by last message timestamp
+    // First page of non-deleted conversations, most recent message first; the sidebar fetches
+    // the rest from api_list_conversations.php (same order, on idx_conversations_user_last_activity)
     $stmt = $db->prepare("
-        SELECT 
-            c.conversation_id, 
-            c.title, 
-            c.created_at, 
-            c.updated_at,
-            MAX(m.timestamp) as last_message_time
-        FROM conversations c
-        LEFT JOIN chat_messages m ON c.conversation_id = m.conversation_id AND m.deleted = 0
-        WHERE c.user_id = ? 
-        AND (c.deleted_flag = 0 OR c.deleted_flag IS NULL)
-        GROUP BY c.conversation_id
-        ORDER BY 
-            CASE 
-                WHEN MAX(m.timestamp) IS NOT NULL THEN MAX(m.timestamp)
-                ELSE c.updated_at
-            END DESC
+        SELECT conversation_id, title, created_at, updated_at, last_message_at, message_count,
+               COALESCE(last_message_at, updated_at) AS last_activity, rowid
+        FROM conversations
+        WHERE user_id = ? 
+        AND (deleted_flag = 0 OR deleted_flag IS NULL)
+        ORDER BY COALESCE(last_message_at, updated_at) DESC, rowid DESC
+        LIMIT ?
     ");
-    $stmt->execute([$user_id]);
+    $stmt->execute([$user_id, SIDEBAR_PAGE_SIZE + 1]);
     $conversations = $stmt->fetchAll(PDO::FETCH_ASSOC);
+    $has_more_conversations = count($conversations) > SIDEBAR_PAGE_SIZE;
+    $conversations = array_slice($conversations, 0, SIDEBAR_PAGE_SIZE);
+    // Keyset cursor of the last row, in api_list_conversations.php's format
+    $last = end($conversations);
+    $conversations_cursor = $has_more_conversations ? "{$last['last_activity']}|{$last['rowid']}" : '';
 } else {
     // Mock mode - use fake data
     $patient_name = 'John Doe';
+    $has_more_conversations = false;
+    $conversations_cursor = '';
     $conversations = [
         ['conversation_id' => 'mock1', 'title' => 'Questions about test results', 'created_at' => '2024-01-15 10:00:00'],
         ['conversation_id' => 'mock2', 'title' => 'Medication side effects', 'created_at' => '2024-01-14 14:30:00']
@@ -81,7 +83,7 @@ if (!$mock_mode) {
                     <h2>Conversations</h2>
                     <button id="newChatBtn" class="btn-new-chat">+ New Chat</button>
                 </div>
-                <div class="conversations-list" id="conversationsList">
+                <div class="conversations-list" id="conversationsList" data-has-more="<?= $has_more_conversations ? '1' : '0' ?>" data-cursor="<?= htmlspecialchars($conversations_cursor) ?>">
                     <?php if (empty($conversations)): ?>
                         <div class="conversation-item active" data-id="new">
                             <div class="conversation-title">(new chat)</div>
@@ -130,8 +132,14 @@ if (!$mock_mode) {
 
     <script>
         const patientName = <?= json_encode($patient_name) ?>;
+        const greeting = `Hello ${patientName}! I am not a doctor, but I have read all your records and I am ready to answer any questions you have.`;
+        const PAGE_SIZE = 50;
         let currentConversationId = null;
         let isNewChat = true;
+        // Keyset paging: older messages are fetched with before=<position of the oldest message shown>
+        let oldestCursor = null;
+        let hasOlderMessages = false;
+        let loadingOlder = false;
 
         // Handle conversation selection
         document.querySelectorAll('.conversation-item').forEach(item => {
@@ -194,7 +202,8 @@ if (!$mock_mode) {
                 });
                 const timezone = Intl.DateTimeFormat().resolvedOptions().timeZone;
                 
-                const response = await fetch('api_chat.php', {
+                // Streamed reply (Server-Sent Events), shown as it is written
+                const response = await fetch('api_chat_stream.php', {
                     method: 'POST',
                     headers: {
                         'Content-Type': 'application/json',
@@ -207,44 +216,72 @@ if (!$mock_mode) {
                     })
                 });
 
-                const data = await response.json();
-                
-                if (data.success) {
-                    // Update conversation ID if this was a new chat
-                    if (!currentConversationId && data.conversation_id) {
-                        currentConversationId = data.conversation_id;
-                        isNewChat = false;
+                if (!(response.headers.get('Content-Type') || '').startsWith('text/event-stream')) {
+                    // Refused before the stream started: a JSON error as from api_chat.php
+                    const data = await response.json();
+                    console.error('Chat error:', data.error);
+                    addMessageToUI('Sorry, there was an error processing your request. Please try again.', 'assistant error');
+                    return;
+                }
+
+                let aiMsgElement = null;
+                let aiText = '';
+                let finished = false;
+                await readEvents(response, (event, data) => {
+                    if (event === 'start') {
+                        // Update conversation ID if this was a new chat
+                        if (!currentConversationId && data.conversation_id) {
+                            currentConversationId = data.conversation_id;
+                            isNewChat = false;
+                            
+                            // Update sidebar with new conversation
+                            updateSidebarWithNewConversation(data.conversation_id, data.title || message.substring(0, 50));
+                        }
                         
-                        // Update sidebar with new conversation
-                        updateSidebarWithNewConversation(data.conversation_id, data.title || message.substring(0, 50));
-                    }
-                    
-                    // Update user message with ID
-                    if (data.user_message_id && userMsgElement) {
-                        const deleteBtn = userMsgElement.querySelector('.message-delete');
-                        if (!deleteBtn) {
-                            // Add delete button now that we have the ID
-                            const wrapper = userMsgElement.querySelector('.message-wrapper');
-                            const delBtn = document.createElement('button');
-                            delBtn.className = 'message-delete';
-                            delBtn.setAttribute('data-message-id', data.user_message_id);
-                            delBtn.setAttribute('title', 'Delete message');
-                            delBtn.innerHTML = '×';
-                            delBtn.addEventListener('click', (e) => {
-                                e.stopPropagation();
-                                deleteMessage(data.user_message_id, userMsgElement);
-                            });
-                            wrapper.appendChild(delBtn);
+                        // Update user message with ID
+                        if (data.user_message_id && userMsgElement) {
+                            const deleteBtn = userMsgElement.querySelector('.message-delete');
+                            if (!deleteBtn) {
+                                // Add delete button now that we have the ID
+                                const wrapper = userMsgElement.querySelector('.message-wrapper');
+                                const delBtn = document.createElement('button');
+                                delBtn.className = 'message-delete';
+                                delBtn.setAttribute('data-message-id', data.user_message_id);
+                                delBtn.setAttribute('title', 'Delete message');
+                                delBtn.innerHTML = '×';
+                                delBtn.addEventListener('click', (e) => {
+                                    e.stopPropagation();
+                                    deleteMessage(data.user_message_id, userMsgElement);
+                                });
+                                wrapper.appendChild(delBtn);
+                            }
                         }
+                        
+                        // Placeholder the reply is written into
+                        aiMsgElement = addMessageToUI('…', 'assistant');
+                    } else if (event === 'chunk' && aiMsgElement) {
+                        aiText += data.text;
+                        aiMsgElement.querySelector('.message-content').textContent = aiText;
+                        const messagesContainer = document.getElementById('chatMessages');
+                        messagesContainer.scrollTop = messagesContainer.scrollHeight;
+                    } else if (event === 'done' && aiMsgElement) {
+                        // Replace the placeholder with the stored message, delete button included
+                        aiMsgElement.replaceWith(createMessageElement(data.response, 'assistant', data.ai_message_id));
+                        finished = true;
+                        
+                        // Show clear chat button
+                        document.getElementById('clearChatBtn').style.display = 'block';
+                    } else if (event === 'error') {
+                        console.error('Chat error:', data.error);
+                        aiMsgElement?.remove();
+                        addMessageToUI('Sorry, there was an error processing your request. Please try again.', 'assistant error');
+                        finished = true;
                     }
-                    
-                    // Add AI response to UI with ID
-                    addMessageToUI(data.response, 'assistant', data.ai_message_id);
-                    
-                    // Show clear chat button
-                    document.getElementById('clearChatBtn').style.display = 'block';
-                } else {
-                    addMessageToUI('Sorry, there was an error processing your request. Please try again.', 'assistant error');
+                });
+                
+                if (!finished) {
+                    aiMsgElement?.remove();
+                    addMessageToUI('Sorry, the connection was lost before the answer was complete. Please try again.', 'assistant error');
                 }
             } catch (error) {
                 console.error('Error:', error);
@@ -258,6 +295,7 @@ if (!$mock_mode) {
         function startNewChat() {
             currentConversationId = null;
             isNewChat = true;
+            hasOlderMessages = false;
             document.getElementById('chatTitle').textContent = 'New Conversation';
             document.getElementById('chatMessages').innerHTML = `
                 <div class="message assistant">
@@ -278,25 +316,32 @@ if (!$mock_mode) {
         async function loadConversation(conversationId) {
             currentConversationId = conversationId;
             isNewChat = false;
+            oldestCursor = null;
+            hasOlderMessages = false;
             
             try {
-                const response = await fetch(`api_get_conversation.php?id=${conversationId}`);
+                // Newest page only; older pages load as the user scrolls up
+                const response = await fetch(`api_get_conversation.php?id=${conversationId}&limit=${PAGE_SIZE}`);
                 const data = await response.json();
                 
-                if (data.success) {
+                if (data.success && currentConversationId === conversationId) {
                     document.getElementById('chatTitle').textContent = data.title;
                     
                     // Clear and load messages
                     const messagesContainer = document.getElementById('chatMessages');
                     messagesContainer.innerHTML = '';
                     
-                    // Always start with the greeting
-                    addMessageToUI(`Hello ${patientName}! I am not a doctor, but I have read all your records and I am ready to answer any questions you have.`, 'assistant');
+                    // The greeting opens the conversation, so it only shows once the first page is loaded
+                    if (!data.has_more_before) {
+                        addMessageToUI(greeting, 'assistant');
+                    }
                     
                     // Add conversation messages
                     data.messages.forEach(msg => {
                         addMessageToUI(msg.message, msg.role, msg.message_id);
                     });
+                    oldestCursor = data.before_cursor;
+                    hasOlderMessages = data.has_more_before;
                     
                     // Show clear chat button if there are messages
                     if (data.messages.length > 0) {
@@ -308,8 +353,73 @@ if (!$mock_mode) {
             }
         }
 
+        async function loadOlderMessages() {
+            if (loadingOlder || !hasOlderMessages || !oldestCursor) return;
+            loadingOlder = true;
+            const conversationId = currentConversationId;
+            
+            try {
+                const response = await fetch(`api_get_conversation.php?id=${conversationId}&before=${encodeURIComponent(oldestCursor)}&limit=${PAGE_SIZE}`);
+                const data = await response.json();
+                
+                // Ignore the page if the user switched conversations meanwhile
+                if (data.success && currentConversationId === conversationId) {
+                    const messagesContainer = document.getElementById('chatMessages');
+                    const previousHeight = messagesContainer.scrollHeight;
+                    const firstChild = messagesContainer.firstChild;
+                    
+                    if (!data.has_more_before) {
+                        messagesContainer.insertBefore(createMessageElement(greeting, 'assistant'), firstChild);
+                    }
+                    data.messages.forEach(msg => {
+                        messagesContainer.insertBefore(createMessageElement(msg.message, msg.role, msg.message_id), firstChild);
+                    });
+                    if (data.before_cursor) oldestCursor = data.before_cursor;
+                    hasOlderMessages = data.has_more_before;
+                    
+                    // Keep the messages the user was looking at in place
+                    messagesContainer.scrollTop += messagesContainer.scrollHeight - previousHeight;
+                }
+            } catch (error) {
+                console.error('Error loading older messages:', error);
+            } finally {
+                loadingOlder = false;
+            }
+        }
+
+        document.getElementById('chatMessages').addEventListener('scroll', (e) => {
+            if (e.target.scrollTop < 200) loadOlderMessages();
+        });
+
+        // Hand each Server-Sent Event of a fetch() response to onEvent(event, data)
+        async function readEvents(response, onEvent) {
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true }).replace(/\r\n/g, '\n');
+                let end;
+                while ((end = buffer.indexOf('\n\n')) !== -1) {
+                    const block = buffer.slice(0, end);
+                    buffer = buffer.slice(end + 2);
+                    const event = (block.match(/^event: (.*)$/m) || [])[1] || 'message';
+                    const data = (block.match(/^data: (.*)$/m) || [])[1];
+                    if (data) onEvent(event, JSON.parse(data));
+                }
+            }
+        }
+
         function addMessageToUI(message, role, messageId = null) {
             const messagesContainer = document.getElementById('chatMessages');
+            const messageDiv = createMessageElement(message, role, messageId);
+            messagesContainer.appendChild(messageDiv);
+            messagesContainer.scrollTop = messagesContainer.scrollHeight;
+            return messageDiv;
+        }
+
+        function createMessageElement(message, role, messageId = null) {
             const messageDiv = document.createElement('div');
             messageDiv.className = `message ${role}`;
             
@@ -330,8 +440,6 @@ if (!$mock_mode) {
                 });
             }
             
-            messagesContainer.appendChild(messageDiv);
-            messagesContainer.scrollTop = messagesContainer.scrollHeight;
             return messageDiv;
         }
 
@@ -344,27 +452,36 @@ if (!$mock_mode) {
             
             // Add new conversation to top of list
             const conversationsList = document.getElementById('conversationsList');
-            const newConvDiv = document.createElement('div');
-            newConvDiv.className = 'conversation-item active';
-            newConvDiv.dataset.id = conversationId;
-            newConvDiv.innerHTML = `
+            const newConvDiv = createConversationElement(conversationId, title, 'Just now');
+            newConvDiv.classList.add('active');
+            conversationsList.insertBefore(newConvDiv, conversationsList.firstChild);
+            
+            // Update chat title
+            document.getElementById('chatTitle').textContent = title;
+        }
+        
+        function createConversationElement(conversationId, title, dateLabel) {
+            const convDiv = document.createElement('div');
+            convDiv.className = 'conversation-item';
+            convDiv.dataset.id = conversationId;
+            convDiv.innerHTML = `
                 <div class="conversation-content">
                     <div class="conversation-title">${escapeHtml(title)}</div>
-                    <div class="conversation-date">Just now</div>
+                    <div class="conversation-date">${escapeHtml(dateLabel)}</div>
                 </div>
-                <button class="conversation-delete" data-id="${conversationId}" title="Delete conversation">×</button>
+                <button class="conversation-delete" data-id="${escapeHtml(conversationId)}" title="Delete conversation">×</button>
             `;
             
             // Add click handler for selection
-            newConvDiv.addEventListener('click', (e) => {
+            convDiv.addEventListener('click', (e) => {
                 if (e.target.classList.contains('conversation-delete')) return;
                 document.querySelectorAll('.conversation-item').forEach(i => i.classList.remove('active'));
-                newConvDiv.classList.add('active');
+                convDiv.classList.add('active');
                 loadConversation(conversationId);
             });
             
             // Add delete handler
-            const deleteBtn = newConvDiv.querySelector('.conversation-delete');
+            const deleteBtn = convDiv.querySelector('.conversation-delete');
             deleteBtn.addEventListener('click', async (e) => {
                 e.stopPropagation();
                 if (confirm('Are you sure you want to delete this conversation?')) {
@@ -372,12 +489,48 @@ if (!$mock_mode) {
                 }
             });
             
-            conversationsList.insertBefore(newConvDiv, conversationsList.firstChild);
+            return convDiv;
+        }
+        
+        // Sidebar paging: the page renders the newest conversations, older ones load on scroll
+        let loadingConversations = false;
+        
+        async function loadMoreConversations() {
+            const conversationsList = document.getElementById('conversationsList');
+            if (loadingConversations || conversationsList.dataset.hasMore !== '1') return;
+            loadingConversations = true;
             
-            // Update chat title
-            document.getElementById('chatTitle').textContent = title;
+            try {
+                // Position of the last row loaded, not its id: it stays put when that conversation moves up
+                const cursor = conversationsList.dataset.cursor;
+                const response = await fetch(`api_list_conversations.php?cursor=${encodeURIComponent(cursor)}`);
+                const data = await response.json();
+                
+                if (data.success) {
+                    data.conversations.forEach(conv => {
+                        // Skip conversations already shown (e.g. one that moved up after a new message)
+                        if (conversationsList.querySelector(`.conversation-item[data-id="${CSS.escape(conv.conversation_id)}"]`)) return;
+                        conversationsList.appendChild(createConversationElement(conv.conversation_id, conv.title, conv.date_label));
+                    });
+                    conversationsList.dataset.hasMore = data.has_more ? '1' : '0';
+                    conversationsList.dataset.cursor = data.next_cursor || '';
+                }
+            } catch (error) {
+                console.error('Error loading conversations:', error);
+            } finally {
+                loadingConversations = false;
+            }
         }
         
+        document.getElementById('conversationsList').addEventListener('scroll', (e) => {
+            const list = e.target;
+            if (list.scrollTop + list.clientHeight > list.scrollHeight - 200) loadMoreConversations();
+        });
+        
+        // A first page too short to scroll would never trigger the listener above
+        const sidebarList = document.getElementById('conversationsList');
+        if (sidebarList.scrollHeight <= sidebarList.clientHeight) loadMoreConversations();
+        
         async function deleteConversation(conversationId) {
             try {
                 const response = await fetch('api_delete_conversation.php', {
@@ -478,6 +631,7 @@ if (!$mock_mode) {
                 const data = await response.json();
                 if (data.success) {
                     // Clear all messages except the greeting
+                    hasOlderMessages = false;
                     const messagesContainer = document.getElementById('chatMessages');
                     messagesContainer.innerHTML = `
                         <div class="message assistant">
@@ -14,16 +14,32 @@ import sqlite3
 import os
 import sys
 import subprocess
+import time
 from pathlib import Path
 
-# Load BASE_URL from config.json
+# Load BASE_URL from config.json (the environment overrides it for isolated test servers)
 config_path = Path(__file__).parent.parent / 'config.json'
-if config_path.exists():
+if os.environ.get('BASE_URL'):
+    BASE_URL = os.environ['BASE_URL'].rstrip('/')
+elif config_path.exists():
     with open(config_path, 'r') as f:
         config = json.load(f)
         BASE_URL = config['BASE_URL'].rstrip('/')
 else:
     BASE_URL = "http://localhost:8080"
+DATA_DIR = os.environ.get('AIOFC_DATA_DIR', '../../data')
+METRICS_HEADERS = {'X-Metrics-Token': os.environ.get('AIOFC_METRICS_TOKEN', '')}
+
+def standin_requests():
+    """Generate requests received by scripts/gemini_standin.py, oldest first; None when not testing against it"""
+    gemini_url = os.environ.get('AIOFC_GEMINI_BASE_URL', '')
+    if not gemini_url.startswith('http://127.0.0.1:'):
+        return None
+    return requests.get(gemini_url.rsplit('/v1beta', 1)[0] + '/_standin/requests', timeout=10).json()['requests']
+
+def standin_url(path):
+    """URL of a path on the Gemini stand-in (only when standin_requests() is not None)"""
+    return os.environ['AIOFC_GEMINI_BASE_URL'].rsplit('/v1beta', 1)[0] + path
 
 def test_chat_page():
     """Test the chat interface page"""
@@ -33,7 +49,7 @@ def test_chat_page():
     session = requests.Session()
     
     # Setup test user in database
-    conn = sqlite3.connect('../../data/auth.db')
+    conn = sqlite3.connect(f'{DATA_DIR}/auth.db')
     cursor = conn.cursor()
     
     # Create test user
@@ -54,7 +70,7 @@ def test_chat_page():
     conn.close()
     
     # Setup test patient in app database
-    app_conn = sqlite3.connect('../../data/aioffice.db')
+    app_conn = sqlite3.connect(f'{DATA_DIR}/aioffice.db')
     app_cursor = app_conn.cursor()
     
     # Create test patient
@@ -163,6 +179,160 @@ def test_chat_page():
                     print("    ⚠️  Note: LLM response may be missing medical disclaimer")
                 
                 print("    ✓ LLM successfully processed medical context and responded appropriately")
+                
+                # Test 6b: A follow-up turn reuses the patient's context (from the Gemini context cache when enabled)
+                follow_up = session.post(f"{BASE_URL}/pg_chat/api_chat.php",
+                                         json={
+                                             'message': 'And my white blood cell count?',
+                                             'conversation_id': data['conversation_id'],
+                                             'local_datetime': local_dt,
+                                             'timezone': timezone
+                                         }).json()
+                assert follow_up.get('success'), f"Follow-up turn failed: {follow_up.get('error')}"
+                assert follow_up.get('conversation_id') == data['conversation_id'], "Follow-up landed in another conversation"
+                print("    ✓ Follow-up turn answered in the same conversation")
+
+                # Test 6c: The streaming endpoint relays the reply as Server-Sent Events and stores it whole
+                stream_response = session.post(f"{BASE_URL}/pg_chat/api_chat_stream.php",
+                                               json={
+                                                   'message': 'What about my cholesterol?',
+                                                   'conversation_id': data['conversation_id'],
+                                                   'local_datetime': local_dt,
+                                                   'timezone': timezone
+                                               }, stream=True)
+                assert stream_response.headers.get('Content-Type', '').startswith('text/event-stream'), \
+                    f"Streaming endpoint did not stream: {stream_response.text[:200]}"
+                events = []
+                for block in stream_response.text.replace('\r\n', '\n').split('\n\n'):
+                    fields = dict(line.split(': ', 1) for line in block.split('\n') if ': ' in line)
+                    if 'event' in fields:
+                        events.append((fields['event'], json.loads(fields.get('data', '{}'))))
+                names = [name for name, _ in events]
+                assert names[0] == 'start' and names[-1] == 'done' and 'chunk' in names, f"Unexpected events: {names}"
+                done = events[-1][1]
+                streamed = ''.join(event['text'] for name, event in events if name == 'chunk')
+                assert done['response'] == streamed and not done['interrupted'], "Stored reply differs from the streamed one"
+                app_cursor.execute("SELECT message FROM chat_messages WHERE message_id = ?", (done['ai_message_id'],))
+                assert app_cursor.fetchone() == (streamed,), "Streamed reply was not stored"
+                print(f"    ✓ Streamed reply arrived in {names.count('chunk')} chunks and was stored")
+
+                # Tests 6d-6f check the prompts Gemini received, so they need the stand-in
+                # (scripts/test_server.py --gemini-standin, which also sets small prompt budgets)
+                if standin_requests() is None:
+                    print("    (Not running against the Gemini stand-in - skipping prompt checks)")
+                else:
+                    metrics = requests.get(f"{BASE_URL}/pg_main/api_metrics.php", headers=METRICS_HEADERS, timeout=10).json()
+
+                    def ask(text, conversation_id=None):
+                        """One chat turn; returns the reply and the chat request Gemini received for it"""
+                        reply = session.post(f"{BASE_URL}/pg_chat/api_chat.php",
+                                             json={
+                                                 'message': text,
+                                                 'conversation_id': conversation_id,
+                                                 'local_datetime': local_dt,
+                                                 'timezone': timezone
+                                             }).json()
+                        assert reply.get('success'), f"Chat turn failed: {reply.get('error')}"
+                        # A summary call, if any, comes first; the chat call is the turn's last request
+                        return reply, standin_requests()[-1]
+
+                    # Test 6d: A record written since the last turn is in the next turn's context
+                    app_cursor.execute("""
+                        INSERT INTO medical_records
+                        (record_id, user_id, record_title, record_type, record_date, content, created_at)
+                        VALUES ('test_rec_lipid', ?, 'Lipid Panel', 'lab_results', '2024-06-01',
+                                'LDL cholesterol: 99 mg/dL', CURRENT_TIMESTAMP)
+                    """, (test_user_id,))
+                    app_conn.commit()
+                    _, sent = ask('And my LDL?', data['conversation_id'])
+                    assert 'LDL cholesterol: 99 mg/dL' in sent['prompt'], "New record missing from the next turn's context"
+                    print("    ✓ A record write reached the next turn's context")
+
+                    # Test 6e: Turns past the history budget are folded into a stored summary and not resent
+                    sentence = 'The pain starts in my lower back and spreads down my left leg. '
+                    budget = metrics['conversation_window']['history_token_budget']
+                    filler = sentence * (budget * 4 * 3 // 5 // len(sentence) + 1)  # ~0.6 of the budget each
+                    first, _ = ask('FIRST-TURN-MARKER ' + filler)
+                    fold_conv = first['conversation_id']
+                    _, sent = ask('SECOND-TURN-MARKER ' + filler, fold_conv)
+                    app_cursor.execute("""
+                        SELECT summary, covered_messages FROM conversation_summaries WHERE conversation_id = ?
+                    """, (fold_conv,))
+                    summary_row = app_cursor.fetchone()
+                    assert summary_row and summary_row[1] == 2, f"First exchange not folded into a summary: {summary_row}"
+                    # With a cachedContents entry the turn context rides in the last message's first part
+                    sent_messages = [content['parts'][-1]['text'] for content in sent['request']['contents']]
+                    assert not any('FIRST-TURN-MARKER' in m for m in sent_messages), "Folded turn was still sent verbatim"
+                    assert 'SECOND-TURN-MARKER' in sent_messages[-1], "Current message missing from the request"
+                    assert summary_row[0] in sent['prompt'], "Stored summary missing from the request"
+                    print("    ✓ Older turns were folded into the stored summary instead of resent")
+
+                    # Test 6f: A chart over the records budget sends excerpts of older records, not the records
+                    sentence = 'Routine observation noted without change. '
+                    budget = metrics['record_retrieval']['records_token_budget']
+                    filler = sentence * (budget * 4 * 3 // 2 // len(sentence) + 1)  # ~1.5 of the budget
+                    app_cursor.execute("""
+                        INSERT INTO medical_records
+                        (record_id, user_id, record_title, record_type, record_date, content, created_at)
+                        VALUES ('test_rec_imaging', ?, 'Imaging Report', 'imaging', '2019-05-01', ?, CURRENT_TIMESTAMP)
+                    """, (test_user_id, filler + 'Thyroid ultrasound showed a 4 mm nodule in the left lobe. '
+                          + filler + 'END-OF-IMAGING-REPORT'))
+                    app_conn.commit()
+                    _, sent = ask('What did my thyroid ultrasound show?')
+                    assert 'RELEVANT EXCERPTS FROM OLDER RECORDS' in sent['prompt'], "No record excerpts in the request"
+                    assert '4 mm nodule' in sent['prompt'], "Relevant passage missing from the excerpts"
+                    assert 'END-OF-IMAGING-REPORT' not in sent['prompt'], "Older record was sent whole"
+                    print("    ✓ Older records were sent as relevant excerpts, not whole")
+
+                    # Test 6g: A patient who leaves mid-stream gets the partial reply stored, marked as cut short
+                    requests.post(standin_url('/_standin/config'), json={'chunk_delay': 0.2, 'output_tokens': 400}, timeout=10)
+                    try:
+                        stream_response = session.post(f"{BASE_URL}/pg_chat/api_chat_stream.php",
+                                                       json={
+                                                           'message': 'Tell me everything about my blood work.',
+                                                           'local_datetime': local_dt,
+                                                           'timezone': timezone
+                                                       }, stream=True)
+                        left_conv = None
+                        for line in stream_response.iter_lines(decode_unicode=True):
+                            if line.startswith('data: ') and left_conv is None:
+                                left_conv = json.loads(line[6:])['conversation_id']
+                            elif line == 'event: chunk':
+                                break
+                        stream_response.close()
+                        stored = None
+                        for _ in range(60):
+                            app_cursor.execute("""
+                                SELECT message FROM chat_messages WHERE conversation_id = ? AND role = 'assistant'
+                            """, (left_conv,))
+                            stored = app_cursor.fetchone()
+                            if stored: break
+                            time.sleep(0.25)
+                    finally:
+                        requests.post(standin_url('/_standin/config'), json={'chunk_delay': 0.05, 'output_tokens': None},
+                                      timeout=10)
+                    assert stored and stored[0].endswith('[Response interrupted before it was complete]'), \
+                        f"Partial reply not stored with the interrupted marker: {stored}"
+                    print("    ✓ Reply cut short by a disconnect was stored with the interrupted marker")
+
+                    # Test 6h: A cachedContents entry Gemini no longer has is dropped and the turn answered inline
+                    for cache in requests.get(standin_url('/v1beta/cachedContents'), timeout=10).json()['cachedContents']:
+                        requests.delete(standin_url(f"/v1beta/{cache['name']}"), timeout=10)
+                    fallbacks = requests.get(f"{BASE_URL}/pg_main/api_metrics.php", headers=METRICS_HEADERS, timeout=10).json()['gemini_cache']['fallbacks']
+                    stream_response = session.post(f"{BASE_URL}/pg_chat/api_chat_stream.php",
+                                                   json={
+                                                       'message': 'Is my hemoglobin normal?',
+                                                       'conversation_id': left_conv,
+                                                       'local_datetime': local_dt,
+                                                       'timezone': timezone
+                                                   })
+                    assert 'event: done' in stream_response.text and '"interrupted":false' in stream_response.text, \
+                        f"Turn after a lost cache entry failed: {stream_response.text[-300:]}"
+                    sent = standin_requests()[-1]['request']
+                    assert 'cachedContent' not in sent and 'systemInstruction' in sent, "Retry did not send the context inline"
+                    metrics = requests.get(f"{BASE_URL}/pg_main/api_metrics.php", headers=METRICS_HEADERS, timeout=10).json()
+                    assert metrics['gemini_cache']['fallbacks'] == fallbacks + 1, "Cache fallback was not counted"
+                    print("    ✓ Lost cachedContents entry fell back to an inline context")
             else:
                 error_msg = data.get('error', 'Unknown error')
                 print(f"    ⚠️  Chat API returned error: {error_msg}")
@@ -204,6 +374,47 @@ def test_chat_page():
         except json.JSONDecodeError:
             print("    (Conversation API returned non-JSON response)")
     
+    # Test 7b: Keyset pagination (both messages share a timestamp; insertion order decides)
+    print("  ✓ Testing conversation pagination...")
+    page = session.get(f"{BASE_URL}/pg_chat/api_get_conversation.php?id=test_conv_1&limit=1").json()
+    assert [m['message_id'] for m in page.get('messages', [])] == ['msg_2'], "Newest page should hold the last message"
+    assert page.get('has_more_before') == True, "Newest page should report older messages"
+    before_cursor = page.get('before_cursor')
+    page = session.get(f"{BASE_URL}/pg_chat/api_get_conversation.php",
+                       params={'id': 'test_conv_1', 'limit': 1, 'before': before_cursor}).json()
+    assert [m['message_id'] for m in page.get('messages', [])] == ['msg_1'], "before= should return the older page"
+    assert page.get('has_more_before') == False, "Oldest page should report no older messages"
+    # The cursor message moved out of chat_messages (as scripts/archive.py does): the cursor still holds its place
+    app_cursor.execute("DELETE FROM chat_messages WHERE message_id = 'msg_2'")
+    app_conn.commit()
+    page = session.get(f"{BASE_URL}/pg_chat/api_get_conversation.php",
+                       params={'id': 'test_conv_1', 'limit': 1, 'before': before_cursor}).json()
+    assert [m['message_id'] for m in page.get('messages', [])] == ['msg_1'], \
+        f"before= should survive its message being archived: {page.get('error')}"
+    
+    # Test 7c: Sidebar pages
+    print("  ✓ Testing conversation list API...")
+    app_cursor.executemany("""
+        INSERT OR REPLACE INTO conversations (conversation_id, user_id, title, created_at, updated_at)
+        VALUES (?, ?, 'Older Conversation', ?, ?)
+    """, [(f'test_conv_old_{i}', test_user_id, f'2020-01-0{i} 10:00:00', f'2020-01-0{i} 10:00:00') for i in (1, 2)])
+    app_conn.commit()
+    listing = session.get(f"{BASE_URL}/pg_chat/api_list_conversations.php?limit=1").json()
+    assert listing.get('success') == True, "Failed to list conversations"
+    assert len(listing.get('conversations', [])) == 1, "limit=1 should return one conversation"
+    listed = [c['conversation_id'] for c in listing['conversations']]
+    # The last listed conversation gets a new message and moves to the top; the cursor must hold its place
+    app_cursor.execute("UPDATE conversations SET last_message_at = datetime('now', '+1 day') WHERE conversation_id = ?",
+                       (listed[-1],))
+    app_conn.commit()
+    while listing.get('has_more'):
+        listing = session.get(f"{BASE_URL}/pg_chat/api_list_conversations.php",
+                              params={'limit': 1, 'cursor': listing['next_cursor']}).json()
+        listed += [c['conversation_id'] for c in listing.get('conversations', [])]
+    assert {'test_conv_1', 'test_conv_old_1', 'test_conv_old_2'} <= set(listed), \
+        "Paging through the list should reach every conversation"
+    assert len(listed) == len(set(listed)), "Pages should not overlap"
+    
     # Test 8: Check for proper styling
     print("  ✓ Testing CSS styles loaded...")
     styles = soup.find('link', {'rel': 'stylesheet', 'href': 'style.css'})
@@ -226,7 +437,7 @@ def test_chat_page():
             f.write("Error: webshot_test.py not found at scripts/ - visual validation unavailable\n")
     
     # Cleanup
-    app_cursor.execute("DELETE FROM chat_messages WHERE conversation_id = 'test_conv_1'")
+    app_cursor.execute("DELETE FROM chat_messages WHERE conversation_id IN (SELECT conversation_id FROM conversations WHERE user_id = ?)", (test_user_id,))
     app_cursor.execute("DELETE FROM conversations WHERE user_id = ?", (test_user_id,))
     app_cursor.execute("DELETE FROM appointments WHERE user_id = ?", (test_user_id,))
     app_cursor.execute("DELETE FROM medical_records WHERE user_id = ?", (test_user_id,))
@@ -235,7 +446,7 @@ def test_chat_page():
     app_conn.close()
     
     # Clean auth database
-    conn = sqlite3.connect('../../data/auth.db')
+    conn = sqlite3.connect(f'{DATA_DIR}/auth.db')
     cursor = conn.cursor()
     cursor.execute("DELETE FROM sessions WHERE id = ?", (test_session_id,))
     cursor.execute("DELETE FROM users WHERE id = ?", (test_user_id,))
@@ -10,40 +10,14 @@ require_once '../infrastructure/lib.php';
 
 $input = json_decode(file_get_contents('php://input'), true);
 
-$authDbPath = __DIR__ . '/../../data/auth.db';
+$authDbPath = getDataDir() . '/auth.db';
 
-// Initialize database if it doesn't exist
+// Schemas are created by scripts/migrate.py, never at request time
 if (!file_exists($authDbPath)) {
-    $db = new SQLite3($authDbPath);
-    $db->exec("
-        CREATE TABLE IF NOT EXISTS users (
-            id TEXT PRIMARY KEY,
-            email TEXT UNIQUE NOT NULL,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            last_login DATETIME
-        );
-        
-        CREATE TABLE IF NOT EXISTS sessions (
-            id TEXT PRIMARY KEY,
-            user_id TEXT NOT NULL,
-            token TEXT UNIQUE NOT NULL,
-            device_info TEXT,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            last_activity DATETIME DEFAULT CURRENT_TIMESTAMP,
-            expires_at DATETIME NOT NULL,
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        );
-        
-        CREATE TABLE IF NOT EXISTS verification_codes (
-            id TEXT PRIMARY KEY,
-            email TEXT NOT NULL,
-            code TEXT NOT NULL,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            expires_at DATETIME NOT NULL,
-            used BOOLEAN DEFAULT 0
-        );
-    ");
-    $db->close();
+    error_log("Auth database missing at $authDbPath; run scripts/migrate.py");
+    http_response_code(503);
+    echo json_encode(['error' => 'Service not initialized']);
+    exit;
 }
 
 // Handle token validation (auto-login check)
@@ -78,8 +52,7 @@ if (isset($input['email']) && !isset($input['code'])) {
         exit;
     }
     
-    $db = new SQLite3($authDbPath);
-    $db->busyTimeout(5000);
+    $db = getAuthDb();
     
     // Generate and store verification code
     $code = generateVerificationCode();
@@ -100,8 +73,8 @@ if (isset($input['email']) && !isset($input['code'])) {
     $subject = "Medical Office Assistant - Verification Code";
     $body = "Your verification code is: $code\n\nThis code will expire in 15 minutes.";
     
-    // Use the email-send command with error capture
-    $emailCmd = "/home/ace/bin/email-send " . escapeshellarg($email) . " " . 
+    // Use the configured email-send command with error capture
+    $emailCmd = loadCreds()['email_send_cmd'] . " " . escapeshellarg($email) . " " . 
                 escapeshellarg($subject) . " " . escapeshellarg($body) . " 2>&1";
     $output = [];
     $returnCode = 0;
@@ -127,8 +100,7 @@ if (isset($input['email']) && isset($input['code'])) {
         exit;
     }
     
-    $db = new SQLite3($authDbPath);
-    $db->busyTimeout(5000);
+    $db = getAuthDb();
     
     // Verify code
     $stmt = $db->prepare("
@@ -207,37 +179,7 @@ if (isset($input['email']) && isset($input['code'])) {
     // For test user, ensure test data exists in application database
     if ($email === 'ai@ironmedia.com') {
         try {
-            $appDbPath = __DIR__ . '/../../data/aioffice.db';
-            $appDb = new SQLite3($appDbPath);
-            $appDb->busyTimeout(5000);
-            
-            // Create tables if they don't exist (matching existing schema)
-            $appDb->exec("
-                CREATE TABLE IF NOT EXISTS patients (
-                    user_id TEXT PRIMARY KEY,
-                    full_name TEXT NOT NULL,
-                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            ");
-            
-            $appDb->exec("
-                CREATE TABLE IF NOT EXISTS appointments (
-                    appointment_id TEXT PRIMARY KEY,
-                    user_id TEXT NOT NULL,
-                    doctor_name TEXT NOT NULL,
-                    appointment_date DATE NOT NULL,
-                    appointment_time TIME,
-                    appointment_datetime_utc DATETIME,
-                    appointment_type TEXT,
-                    location TEXT,
-                    notes TEXT,
-                    status TEXT DEFAULT 'scheduled',
-                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES patients(user_id)
-                )
-            ");
+            $appDb = openSqlite(getDataDir() . '/aioffice.db');
             
             // Insert or update patient record with test name
             $stmt = $appDb->prepare("
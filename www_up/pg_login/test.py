@@ -20,7 +20,7 @@ test_dir = Path(__file__).parent
 
 # Determine base URL from config.json
 config_path = Path(__file__).parent.parent / 'config.json'
-if config_path.exists():
+if config_path.exists() and not os.environ.get('BASE_URL'):
     with open(config_path) as f:
         config = json.load(f)
         base_url = config.get('BASE_URL', 'http://localhost:8000')
@@ -87,8 +87,10 @@ try:
     # Note: We can't test actual email delivery without access to the recipient's inbox
     # but we can check if the email-send command exists and is executable
     import os
+    import shutil
     import subprocess
-    email_cmd_exists = os.path.exists('/home/ace/bin/email-send') and os.access('/home/ace/bin/email-send', os.X_OK)
+    email_cmd = os.environ.get('AIOFC_EMAIL_SEND', '/home/ace/bin/email-send').split()
+    email_cmd_exists = shutil.which(email_cmd[0]) is not None
     test("Email send command available", email_cmd_exists, 
          "email-send command not found or not executable" if not email_cmd_exists else "")
     
@@ -96,7 +98,7 @@ try:
     if email_cmd_exists:
         try:
             # Test with invalid arguments to check if command runs
-            result = subprocess.run(['/home/ace/bin/email-send'], 
+            result = subprocess.run(email_cmd, 
                                   capture_output=True, text=True, timeout=5)
             # Command should exit with error code due to missing args, but should run
             test("Email command executable by PHP user", True)
@@ -109,7 +111,7 @@ except Exception as e:
 
 # Test 4: Check database was created and code was stored
 try:
-    db_path = Path(__file__).parent.parent.parent / 'data' / 'auth.db'
+    db_path = Path(os.environ.get('AIOFC_DATA_DIR', Path(__file__).parent.parent.parent / 'data')) / 'auth.db'
     if db_path.exists():
         conn = sqlite3.connect(str(db_path))
         cursor = conn.cursor()
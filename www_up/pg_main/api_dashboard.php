@@ -16,14 +16,8 @@ if (!$userId) {
 }
 
 try {
-    // Connect to application database
-    $dbPath = __DIR__ . '/../../data/aioffice.db';
-    $db = new SQLite3($dbPath);
-    $db->busyTimeout(5000);
-    
-    // Attach auth database to get user email
-    $authDbPath = __DIR__ . '/../../data/auth.db';
-    $db->exec("ATTACH DATABASE '$authDbPath' AS auth");
+    // Same connection the auth check used (auth.db is attached as `auth`)
+    $db = getAppDb();
     
     // Get user information
     $stmt = $db->prepare("
@@ -34,35 +28,36 @@ try {
         LEFT JOIN patients ON auth.users.id = patients.user_id
         WHERE auth.users.id = :user_id
     ");
-    $stmt->bindValue(':user_id', $userId, SQLITE3_TEXT);
-    $result = $stmt->execute();
-    $userRow = $result->fetchArray(SQLITE3_ASSOC);
+    $stmt->execute(['user_id' => $userId]);
+    $userRow = $stmt->fetch(PDO::FETCH_ASSOC) ?: [];
     
     $userData = [
         'name' => $userRow['full_name'] ?? 'Patient',
         'email' => $userRow['email'] ?? ''
     ];
     
-    // Get recent conversations (last 3)
+    // Get recent conversations (last 3), in the pg_chat sidebar's order and index
     $stmt = $db->prepare("
         SELECT 
             conversation_id,
             title as preview,
-            updated_at as timestamp
+            COALESCE(last_message_at, updated_at) as timestamp,
+            message_count
         FROM conversations
         WHERE user_id = :user_id
-        ORDER BY updated_at DESC
+        AND (deleted_flag = 0 OR deleted_flag IS NULL)
+        ORDER BY COALESCE(last_message_at, updated_at) DESC
         LIMIT 3
     ");
-    $stmt->bindValue(':user_id', $userId, SQLITE3_TEXT);
-    $result = $stmt->execute();
+    $stmt->execute(['user_id' => $userId]);
     
     $recentChats = [];
-    while ($row = $result->fetchArray(SQLITE3_ASSOC)) {
+    while ($row = $stmt->fetch(PDO::FETCH_ASSOC)) {
         $recentChats[] = [
             'id' => $row['conversation_id'],
             'preview' => substr($row['preview'], 0, 100) . '...',
-            'timestamp' => $row['timestamp']
+            'timestamp' => $row['timestamp'],
+            'message_count' => (int)$row['message_count']
         ];
     }
     
@@ -72,9 +67,8 @@ try {
         FROM medical_records
         WHERE user_id = :user_id
     ");
-    $stmt->bindValue(':user_id', $userId, SQLITE3_TEXT);
-    $result = $stmt->execute();
-    $row = $result->fetchArray(SQLITE3_ASSOC);
+    $stmt->execute(['user_id' => $userId]);
+    $row = $stmt->fetch(PDO::FETCH_ASSOC);
     $hasMedicalRecords = $row['count'] > 0;
     
     // Get latest appointment (even if in the past)
@@ -91,9 +85,8 @@ try {
         ORDER BY appointment_datetime_utc DESC, appointment_date DESC
         LIMIT 1
     ");
-    $stmt->bindValue(':user_id', $userId, SQLITE3_TEXT);
-    $result = $stmt->execute();
-    $nextAppointment = $result->fetchArray(SQLITE3_ASSOC);
+    $stmt->execute(['user_id' => $userId]);
+    $nextAppointment = $stmt->fetch(PDO::FETCH_ASSOC);
     
     // If we have a UTC datetime, use that; otherwise use date and time fields
     if ($nextAppointment && $nextAppointment['appointment_datetime_utc']) {
@@ -102,8 +95,6 @@ try {
         $nextAppointment['time'] = $utcDateTime->format('H:i');
     }
     
-    $db->close();
-    
     // Return dashboard data
     echo json_encode([
         'user' => $userData,
@@ -10,16 +10,14 @@ $token = $_COOKIE['aiofc_session'] ?? '';
 
 if ($token) {
     // Invalidate session in database
-    $authDbPath = __DIR__ . '/../../data/auth.db';
-    $db = new SQLite3($authDbPath);
-    $db->busyTimeout(5000);
+    $db = getAppDb();
     
     // Delete session from database
-    $stmt = $db->prepare("DELETE FROM sessions WHERE token = :token");
-    $stmt->bindValue(':token', $token, SQLITE3_TEXT);
-    $stmt->execute();
+    $stmt = $db->prepare("DELETE FROM auth.sessions WHERE token = :token");
+    $stmt->execute(['token' => $token]);
     
-    $db->close();
+    // Otherwise the token stays valid on this server until its cache entry expires
+    forgetSessionToken($token);
 }
 
 // Clear session cookie
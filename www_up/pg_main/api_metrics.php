@@ -0,0 +1,32 @@
+<?php
+declare(strict_types=1);
+
+require_once '../infrastructure/lib.php';
+require_once '../infrastructure/prompt_context.php';
+require_once '../infrastructure/gemini.php';
+require_once '../infrastructure/conversation_window.php';
+require_once '../infrastructure/record_retrieval.php';
+require_once '../infrastructure/chat_turn.php';
+
+header('Content-Type: application/json');
+
+// Monitoring only: with AIOFC_METRICS_TOKEN set, answer requests sending it as X-Metrics-Token;
+// without one, answer local requests (the monitoring agent on this host), nobody else
+// NOTE: behind a reverse proxy on this host every request is local, so set the token there
+$token = getenv('AIOFC_METRICS_TOKEN') ?: '';
+$allowed = $token !== ''
+    ? hash_equals($token, $_SERVER['HTTP_X_METRICS_TOKEN'] ?? '')
+    : in_array($_SERVER['REMOTE_ADDR'] ?? '', ['127.0.0.1', '::1'], true);
+if (!$allowed) {
+    http_response_code(403);
+    die(json_encode(['error' => 'Forbidden']));
+}
+
+echo json_encode([
+    'session_cache' => getSessionCacheStats(),
+    'prompt_context' => getPromptContextStats(),
+    'gemini_cache' => getGeminiCacheStats(),
+    'conversation_window' => getConversationWindowStats(),
+    'record_retrieval' => getRecordRetrievalStats(),
+    'chat_latency' => getChatLatencyStats()
+]);
@@ -0,0 +1,127 @@
+<?php
+declare(strict_types=1);
+
+require_once '../infrastructure/lib.php';
+
+header('Content-Type: application/json');
+
+$userId = checkAuth();
+if (!$userId) {
+    http_response_code(401);
+    die(json_encode(['error' => 'Not authenticated']));
+}
+
+$query = trim((string)($_GET['q'] ?? ''));
+$type = $_GET['type'] ?? 'all';
+$limit = min(max((int)($_GET['limit'] ?? 20), 1), 50);
+
+if ($query === '') {
+    http_response_code(400);
+    die(json_encode(['success' => false, 'error' => 'Search text is required']));
+}
+if (!in_array($type, ['all', 'messages', 'records'], true)) {
+    http_response_code(400);
+    die(json_encode(['success' => false, 'error' => 'Invalid type']));
+}
+
+/**
+ * FTS5 MATCH expression for one patient's rows: the owner token (hex of the user id,
+ * see migration 0006) AND every word of the search text within $columns. Each word is
+ * quoted, so punctuation and FTS5 operators typed by the patient are taken literally.
+ * No prefix queries: expanding one reads every matching term of every patient's rows.
+ */
+function searchExpression(string $userId, string $query, string $columns): ?string {
+    $words = array_filter(preg_split('/\s+/u', $query) ?: [], fn($w) => preg_match('/[\p{L}\p{N}]/u', $w));
+    if (!$words) return null;
+    $phrases = array_map(fn($w) => '"' . str_replace('"', '""', $w) . '"', array_slice(array_values($words), 0, 8));
+    return 'owner : "' . strtoupper(bin2hex($userId)) . '" AND ' . $columns . ' : (' . implode(' ', $phrases) . ')';
+}
+
+// snippet()/highlight() mark matches with \x02...\x03; escape the text first, then turn them into <mark>
+function markMatches(?string $text): string {
+    return str_replace(["\x02", "\x03"], ['<mark>', '</mark>'], htmlspecialchars($text ?? '', ENT_QUOTES, 'UTF-8'));
+}
+
+try {
+    // Same connection the auth check used
+    $db = getAppDb();
+    $messages = [];
+    $records = [];
+
+    // NOTE: the indexes only hold what the patient can see (no soft-deleted messages or conversations);
+    // the user_id comparison repeats the owner token check on the real column
+    $expression = searchExpression($userId, $query, 'message');
+    if ($expression !== null && $type !== 'records') {
+        $stmt = $db->prepare("
+            SELECT
+                m.message_id,
+                m.conversation_id,
+                c.title,
+                m.role,
+                m.timestamp,
+                snippet(chat_messages_fts, 0, char(2), char(3), '…', 16) AS snippet
+            FROM chat_messages_fts
+            JOIN chat_messages m ON m.rowid = chat_messages_fts.rowid
+            JOIN conversations c ON c.conversation_id = m.conversation_id
+            WHERE chat_messages_fts MATCH :expression
+            AND c.user_id = :user_id
+            ORDER BY rank
+            LIMIT :limit
+        ");
+        $stmt->execute(['expression' => $expression, 'user_id' => $userId, 'limit' => $limit]);
+        while ($row = $stmt->fetch(PDO::FETCH_ASSOC)) {
+            $messages[] = [
+                'message_id' => $row['message_id'],
+                'conversation_id' => $row['conversation_id'],
+                'conversation_title' => $row['title'],
+                'role' => $row['role'],
+                'timestamp' => $row['timestamp'],
+                'snippet' => markMatches($row['snippet'])
+            ];
+        }
+    }
+
+    $expression = searchExpression($userId, $query, '{record_title content}');
+    if ($expression !== null && $type !== 'messages') {
+        // rank is bm25() with the title weighted five times the body (migration 0006)
+        $stmt = $db->prepare("
+            SELECT
+                r.record_id,
+                r.record_type,
+                r.record_date,
+                highlight(medical_records_fts, 0, char(2), char(3)) AS title,
+                snippet(medical_records_fts, 1, char(2), char(3), '…', 24) AS snippet
+            FROM medical_records_fts
+            JOIN medical_records r ON r.rowid = medical_records_fts.rowid
+            WHERE medical_records_fts MATCH :expression
+            AND r.user_id = :user_id
+            ORDER BY rank
+            LIMIT :limit
+        ");
+        $stmt->execute(['expression' => $expression, 'user_id' => $userId, 'limit' => $limit]);
+        while ($row = $stmt->fetch(PDO::FETCH_ASSOC)) {
+            $records[] = [
+                'record_id' => $row['record_id'],
+                'record_type' => $row['record_type'],
+                'record_date' => $row['record_date'],
+                'title' => markMatches($row['title']),
+                'snippet' => markMatches($row['snippet'])
+            ];
+        }
+    }
+
+    echo json_encode([
+        'success' => true,
+        'query' => $query,
+        'messages' => $messages,
+        'records' => $records
+    ]);
+
+} catch (Exception $e) {
+    error_log('Search error: ' . $e->getMessage());
+    http_response_code(500);
+    echo json_encode([
+        'success' => false,
+        'error' => 'An error occurred while searching'
+    ]);
+}
@@ -8,6 +8,7 @@
 
 import json
 import os
+import sqlite3
 import sys
 import subprocess
 from pathlib import Path
@@ -29,7 +30,7 @@ if not config_path.exists():
 
 with open(config_path) as f:
     config = json.load(f)
-    base_url = config['BASE_URL'].rstrip('/')
+    base_url = os.environ.get('BASE_URL', config['BASE_URL']).rstrip('/')
 
 # Test results
 test_results = []
@@ -87,8 +88,94 @@ try:
 except Exception as e:
     test("Logout API endpoint exists", False, str(e))
 
+# Test 4a: Search API endpoint (should require authentication)
+try:
+    response = requests.get(f"{base_url}/pg_main/api_search.php", params={'q': 'cholesterol'}, timeout=10)
+    test("Search API requires authentication", response.status_code == 401, f"Status: {response.status_code}")
+except Exception as e:
+    test("Search API endpoint exists", False, str(e))
+
+# Test 4a-2: Search as a seeded patient: ranking, <mark> snippets, owner scoping, soft deletes
+data_dir = Path(os.environ.get('AIOFC_DATA_DIR', test_dir.parent.parent / 'data'))
+search_user, other_user = 'test_search_user', 'test_search_other'
+search_token = 'test_search_token_' + os.urandom(16).hex()
+auth_conn = sqlite3.connect(data_dir / 'auth.db')
+app_conn = sqlite3.connect(data_dir / 'aioffice.db')
+try:
+    for user_id in [search_user, other_user]:
+        auth_conn.execute("INSERT OR REPLACE INTO users (id, email, created_at) VALUES (?, ?, CURRENT_TIMESTAMP)",
+                          (user_id, f'{user_id}@example.com'))
+    auth_conn.execute("""
+        INSERT OR REPLACE INTO sessions (id, user_id, token, created_at, expires_at, last_activity)
+        VALUES ('test_search_session', ?, ?, CURRENT_TIMESTAMP, datetime('now', '+1 day'), CURRENT_TIMESTAMP)
+    """, (search_user, search_token))
+    auth_conn.commit()
+    # Triggers index these rows the moment they are written
+    app_conn.executemany("""
+        INSERT OR REPLACE INTO medical_records (record_id, user_id, record_title, record_type, record_date, content, created_at)
+        VALUES (?, ?, ?, 'lab_results', '2024-03-01', ?, CURRENT_TIMESTAMP)
+    """, [('test_search_body', search_user, 'Blood Panel', 'Ferritin 12 ng/mL, below the reference range.'),
+          ('test_search_title', search_user, 'Ferritin Follow-up', 'Iron stores rechecked after supplements.'),
+          ('test_search_foreign', other_user, 'Ferritin Results', 'Ferritin 80 ng/mL.')])
+    app_conn.execute("""
+        INSERT OR REPLACE INTO conversations (conversation_id, user_id, title, created_at, updated_at)
+        VALUES ('test_search_conv', ?, 'Iron', CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+    """, (search_user,))
+    app_conn.executemany("""
+        INSERT OR REPLACE INTO chat_messages (message_id, conversation_id, role, message, timestamp, deleted)
+        VALUES (?, 'test_search_conv', 'patient', ?, CURRENT_TIMESTAMP, ?)
+    """, [('test_search_visible', 'Is my ferritin too low?', 0),
+          ('test_search_deleted', 'Forget what I said about ferritin.', 1)])
+    app_conn.commit()
+
+    response = requests.get(f"{base_url}/pg_main/api_search.php", params={'q': 'ferritin'},
+                            cookies={'aiofc_session': search_token}, timeout=10)
+    results = response.json() if response.status_code == 200 else {}
+    record_ids = [r['record_id'] for r in results.get('records', [])]
+    message_ids = [m['message_id'] for m in results.get('messages', [])]
+    test("Search finds the patient's records", set(record_ids) == {'test_search_title', 'test_search_body'},
+         f"Status: {response.status_code}, records: {record_ids}")
+    test("Search ranks a title match first", record_ids[:1] == ['test_search_title'], str(record_ids))
+    test("Search marks matches in snippets",
+         any('<mark>Ferritin</mark>' in r['snippet'] for r in results.get('records', []))
+         and any('<mark>ferritin</mark>' in m['snippet'] for m in results.get('messages', [])))
+    test("Search leaves out other patients' records", 'test_search_foreign' not in record_ids)
+    test("Search finds visible messages, not soft-deleted ones", message_ids == ['test_search_visible'], str(message_ids))
+except Exception as e:
+    test("Search API answers a signed-in patient", False, str(e))
+finally:
+    app_conn.execute("DELETE FROM chat_messages WHERE conversation_id = 'test_search_conv'")
+    app_conn.execute("DELETE FROM conversations WHERE conversation_id = 'test_search_conv'")
+    app_conn.execute("DELETE FROM medical_records WHERE record_id LIKE 'test_search_%'")
+    app_conn.commit()
+    app_conn.close()
+    auth_conn.execute("DELETE FROM sessions WHERE id = 'test_search_session'")
+    auth_conn.execute("DELETE FROM users WHERE id IN (?, ?)", (search_user, other_user))
+    auth_conn.commit()
+    auth_conn.close()
+
+# Test 4b: Metrics endpoint answers the configured token (or localhost without one), refuses everyone else
+metrics_token = os.environ.get('AIOFC_METRICS_TOKEN', '')
+try:
+    if metrics_token:
+        response = requests.get(f"{base_url}/pg_main/api_metrics.php", headers={'X-Metrics-Token': 'wrong'}, timeout=10)
+        test("Metrics API refuses a wrong token", response.status_code == 403, f"Status: {response.status_code}")
+    response = requests.get(f"{base_url}/pg_main/api_metrics.php", headers={'X-Metrics-Token': metrics_token}, timeout=10)
+    if response.status_code == 200:
+        test("Metrics API reports session cache", "hits" in response.json().get('session_cache', {}))
+        test("Metrics API reports prompt context cache", "avg_bytes_saved" in response.json().get('prompt_context', {}))
+        test("Metrics API reports Gemini context cache", "cached_token_ratio" in response.json().get('gemini_cache', {}))
+        test("Metrics API reports conversation window", "avg_history_tokens" in response.json().get('conversation_window', {}))
+        test("Metrics API reports record retrieval", "avg_chunks" in response.json().get('record_retrieval', {}))
+        test("Metrics API reports chat latency", "avg_first_token_ms" in response.json().get('chat_latency', {}).get('streaming', {}))
+    else:
+        test("Metrics API refuses remote clients", response.status_code == 403, f"Status: {response.status_code}")
+except Exception as e:
+    test("Metrics API endpoint exists", False, str(e))
+
 # Test 5: Check for required files
-required_files = ['index.php', 'style.css', 'app.js', 'api_dashboard.php', 'api_logout.php', 'README.md']
+required_files = ['index.php', 'style.css', 'app.js', 'api_dashboard.php', 'api_logout.php', 'api_metrics.php',
+                  'api_search.php', 'README.md']
 for file in required_files:
     file_path = test_dir / file
     test(f"File exists: {file}", file_path.exists())
@@ -36,10 +36,10 @@ if (!$record || !$record['source_filename']) {
 
 // Construct safe file path
 $filename = basename($record['source_filename']); // Prevent path traversal
-$filepath = realpath(__DIR__ . '/../../data/uploads/' . $filename);
+$filepath = realpath(getDataDir() . '/uploads/' . $filename);
 
 // Verify file exists and is within uploads directory
-$uploadsDir = realpath(__DIR__ . '/../../data/uploads');
+$uploadsDir = realpath(getDataDir() . '/uploads');
 if (!$filepath || !file_exists($filepath) || strpos($filepath, $uploadsDir) !== 0) {
     http_response_code(404);
     exit('File not found');
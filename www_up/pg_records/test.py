@@ -18,7 +18,8 @@ import tempfile
 import shutil
 
 # Test configuration
-BASE_URL = "http://localhost:8080"
+BASE_URL = os.environ.get('BASE_URL', "http://localhost:8080").rstrip('/')
+DATA_DIR = os.environ.get('AIOFC_DATA_DIR', '../../data')
 TEST_EMAIL = "test_records@example.com"
 TEST_USER_ID = "test_user_records_123"
 
@@ -27,10 +28,10 @@ def setup_test_environment():
     print("Setting up test environment...")
     
     # Create data directories if they don't exist
-    os.makedirs("../../data/uploads", exist_ok=True)
+    os.makedirs(f"{DATA_DIR}/uploads", exist_ok=True)
     
     # Set up auth database
-    auth_db_path = "../../data/auth.db"
+    auth_db_path = f"{DATA_DIR}/auth.db"
     auth_conn = sqlite3.connect(auth_db_path)
     auth_cur = auth_conn.cursor()
     
@@ -76,7 +77,7 @@ def setup_test_environment():
     token_to_return = test_token
     
     # Set up app database
-    app_db_path = "../../data/aioffice.db"
+    app_db_path = f"{DATA_DIR}/aioffice.db"
     app_conn = sqlite3.connect(app_db_path)
     app_cur = app_conn.cursor()
     
@@ -121,7 +122,7 @@ def setup_test_environment():
     
     for idx, (filename, title, record_type, date) in enumerate(sample_pdfs):
         # Create a simple PDF file (just a text file for testing)
-        pdf_path = f"../../data/uploads/{filename}"
+        pdf_path = f"{DATA_DIR}/uploads/{filename}"
         with open(pdf_path, "wb") as f:
             # Write a minimal PDF header (enough for testing)
             f.write(b"%PDF-1.4\n")
@@ -268,19 +269,19 @@ def cleanup_test_environment():
     
     # Clean up test PDFs
     for filename in ["lab_results_2024.pdf", "prescription_2024.pdf", "visit_notes_2024.pdf"]:
-        pdf_path = f"../../data/uploads/{filename}"
+        pdf_path = f"{DATA_DIR}/uploads/{filename}"
         if os.path.exists(pdf_path):
             os.remove(pdf_path)
     
     # Clean up database entries
-    app_conn = sqlite3.connect("../../data/aioffice.db")
+    app_conn = sqlite3.connect(f"{DATA_DIR}/aioffice.db")
     app_cur = app_conn.cursor()
     app_cur.execute("DELETE FROM medical_records WHERE user_id = ?", (TEST_USER_ID,))
     app_cur.execute("DELETE FROM patients WHERE user_id = ?", (TEST_USER_ID,))
     app_conn.commit()
     app_conn.close()
     
-    auth_conn = sqlite3.connect("../../data/auth.db")
+    auth_conn = sqlite3.connect(f"{DATA_DIR}/auth.db")
     auth_cur = auth_conn.cursor()
     auth_cur.execute("DELETE FROM sessions WHERE user_id = ?", (TEST_USER_ID,))
     auth_cur.execute("DELETE FROM users WHERE id = ?", (TEST_USER_ID,))